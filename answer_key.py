@@ -0,0 +1,246 @@
+"""
+答案键旁路文件
+生成题目时同时写出的二进制答案键：按题号存放精确的分子/分母，并记录题目文件的校验和。
+判题时内存映射该文件直接比较答案，校验和不一致时才回退为重新计算。
+追加模式另在题目文件旁保存去重索引（ExerciseIndex），向已有题目集追加时无需重新解析已有题目。
+"""
+
+import mmap
+import os
+import struct
+import zlib
+from array import array
+from fractions import Fraction
+
+from key_index import KeyIndex
+
+
+class AnswerKey:
+    """
+    内存映射的答案键（只读）
+
+    文件格式（本机字节序，主流平台均为小端）：
+    - 文件头 24 字节：魔数 b'AKEY'、版本号 uint32、题目数 uint64、题目文件 CRC32 uint32、标志 uint32
+    - 记录：每题 16 字节（分子 int64、分母 int64），第 i 条对应题号 i + 1；
+      值超出 int64 范围时记录为 (0, 0) 并置 FLAG_INCOMPLETE，此时整个答案键不用于判题
+    """
+
+    MAGIC = b'AKEY'
+    VERSION = 1
+    HEADER = struct.Struct('=4sIQII')
+    FLAG_INCOMPLETE = 1
+    INT64_MIN = -(1 << 63)
+    INT64_MAX = (1 << 63) - 1
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.read(AnswerKey.HEADER.size)
+            if len(header) < AnswerKey.HEADER.size:
+                raise ValueError(f"答案键文件不完整：{path}")
+            magic, version, count, checksum, flags = AnswerKey.HEADER.unpack(header)
+            if magic != AnswerKey.MAGIC or version != AnswerKey.VERSION:
+                raise ValueError(f"不是有效的答案键文件：{path}")
+            self.count = count
+            self.checksum = checksum
+            self.flags = flags
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if count else None
+        if self._mmap is not None and len(self._mmap) < AnswerKey.HEADER.size + 16 * count:
+            raise ValueError(f"答案键文件不完整：{path}")
+        self._records = (memoryview(self._mmap)[AnswerKey.HEADER.size:AnswerKey.HEADER.size + 16 * count].cast('q')
+                         if count else None)
+
+    def __reduce__(self):
+        # 进程间传递时只传路径，由接收方重新映射
+        return AnswerKey, (self.path,)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return iter(range(1, self.count + 1))
+
+    def __contains__(self, index):
+        return 1 <= index <= self.count
+
+    def __getitem__(self, index):
+        if not 1 <= index <= self.count:
+            raise KeyError(index)
+        return self.get(index)
+
+    def get(self, index, default=None):
+        """返回题号 index 的精确值；题号不存在返回 default"""
+        if not 1 <= index <= self.count:
+            return default
+        numerator = self._records[2 * index - 2]
+        denominator = self._records[2 * index - 1]
+        if denominator == 0:
+            return None
+        return Fraction(numerator, denominator)
+
+    def close(self):
+        if self._records is not None:
+            self._records.release()
+            self._mmap.close()
+            self._records = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @staticmethod
+    def sidecar_path(exercise_path):
+        """题目文件对应的答案键路径"""
+        return exercise_path + '.key'
+
+    @staticmethod
+    def file_checksum(path):
+        """按块计算文件的 CRC32"""
+        checksum = 0
+        with open(path, 'rb') as f:
+            while True:
+                block = f.read(1 << 20)
+                if not block:
+                    return checksum
+                checksum = zlib.crc32(block, checksum)
+
+    @staticmethod
+    def load_for(exercise_path):
+        """
+        打开题目文件的答案键；答案键不存在、损坏、不完整或与题目文件校验和不一致时返回 None
+        """
+        path = AnswerKey.sidecar_path(exercise_path)
+        if not os.path.exists(path):
+            return None
+        try:
+            key = AnswerKey(path)
+        except (OSError, ValueError):
+            return None
+        if key.flags & AnswerKey.FLAG_INCOMPLETE or key.checksum != AnswerKey.file_checksum(exercise_path):
+            key.close()
+            return None
+        return key
+
+    @staticmethod
+    def write(path, values, checksum):
+        """一次性写出答案键"""
+        with AnswerKeyWriter(path) as writer:
+            writer.append(values)
+            writer.checksum = checksum
+
+    @staticmethod
+    def extend(path, values, checksum):
+        """在已有答案键末尾追加记录，并改写题目数与题目文件校验和（已有记录不重写）"""
+        with open(path, 'r+b') as f:
+            magic, version, count, _, flags = AnswerKey.HEADER.unpack(f.read(AnswerKey.HEADER.size))
+            if magic != AnswerKey.MAGIC or version != AnswerKey.VERSION:
+                raise ValueError(f"不是有效的答案键文件：{path}")
+            f.seek(AnswerKey.HEADER.size + 16 * count)
+            f.truncate()
+            writer = AnswerKeyWriter(path, f)
+            writer.count = count
+            writer.flags = flags
+            writer.append(values)
+            writer.checksum = checksum
+            writer.close()
+
+
+class AnswerKeyWriter:
+    """增量写出答案键：先写占位文件头，追加记录，关闭时回填题目数与校验和"""
+
+    def __init__(self, path, f=None):
+        # 传入已定位到记录末尾的文件对象时在其后继续追加（见 AnswerKey.extend）
+        if f is None:
+            f = open(path, 'wb')
+            f.write(bytes(AnswerKey.HEADER.size))
+        self._f = f
+        self.count = 0
+        self.checksum = 0
+        self.flags = 0
+
+    def append(self, values):
+        """按题号顺序追加一批精确值（Fraction 或具有 numerator/denominator 的对象）"""
+        records = array('q')
+        for value in values:
+            numerator, denominator = value.numerator, value.denominator
+            if AnswerKey.INT64_MIN <= numerator <= AnswerKey.INT64_MAX and denominator <= AnswerKey.INT64_MAX:
+                records.append(numerator)
+                records.append(denominator)
+            else:
+                records.append(0)
+                records.append(0)
+                self.flags |= AnswerKey.FLAG_INCOMPLETE
+        self._f.write(records.tobytes())
+        self.count += len(records) // 2
+
+    def close(self):
+        if self._f.closed:
+            return
+        self._f.seek(0)
+        self._f.write(AnswerKey.HEADER.pack(AnswerKey.MAGIC, AnswerKey.VERSION, self.count, self.checksum, self.flags))
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ExerciseIndex:
+    """
+    题目文件的去重索引（追加模式使用）
+
+    保存题目文件中全部题目的 64 位标准化键（KeyIndex 的整张表）、题目数与题目文件的 CRC32，
+    并记录写出时题目文件的大小与修改时间；二者都未变化时直接信任索引，追加新题目无需重新读取、解析已有题目。
+
+    文件格式（本机字节序）：
+    - 文件头 40 字节：魔数 b'EIDX'、版本号 uint32、题目数 uint64、题目文件大小 uint64、修改时间 int64（纳秒）、
+      题目文件 CRC32 uint32、保留 uint32
+    - 之后为 KeyIndex.write 写出的表
+    """
+
+    MAGIC = b'EIDX'
+    VERSION = 2
+    HEADER = struct.Struct('=4sIQQqII')
+
+    def __init__(self, keys, count, checksum):
+        self.keys = keys
+        self.count = count
+        self.checksum = checksum
+
+    @staticmethod
+    def sidecar_path(exercise_path):
+        """题目文件对应的去重索引路径"""
+        return exercise_path + '.idx'
+
+    @staticmethod
+    def load_for(exercise_path):
+        """读取题目文件的去重索引；不存在、损坏或题目文件已被修改时返回 None"""
+        path = ExerciseIndex.sidecar_path(exercise_path)
+        try:
+            stat = os.stat(exercise_path)
+            with open(path, 'rb') as f:
+                header = f.read(ExerciseIndex.HEADER.size)
+                if len(header) < ExerciseIndex.HEADER.size:
+                    return None
+                magic, version, count, size, mtime_ns, checksum, _ = ExerciseIndex.HEADER.unpack(header)
+                if (magic != ExerciseIndex.MAGIC or version != ExerciseIndex.VERSION
+                        or size != stat.st_size or mtime_ns != stat.st_mtime_ns):
+                    return None
+                return ExerciseIndex(KeyIndex.read(f), count, checksum)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, exercise_path):
+        """写出索引（先写临时文件再原子替换），记录题目文件当前的大小与修改时间"""
+        stat = os.stat(exercise_path)
+        path = ExerciseIndex.sidecar_path(exercise_path)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(ExerciseIndex.HEADER.pack(ExerciseIndex.MAGIC, ExerciseIndex.VERSION, self.count,
+                                              stat.st_size, stat.st_mtime_ns, self.checksum, 0))
+            self.keys.write(f)
+        os.replace(tmp, path)
@@ -7,48 +7,308 @@
 
 用法示例：
 - 生成题目：python arithmetic_generator.py -r 10 -n 20
+- 流式生成（不限题目数量）：python arithmetic_generator.py -r 10 -n 1000000 --stream
+- 多进程生成：python arithmetic_generator.py -r 10 -n 1000000 --stream --workers 8 --seed 42
+- 批量向量化生成（需 NumPy）：python arithmetic_generator.py -r 10 -n 1000000 --stream --engine numpy
 - 判题：python arithmetic_generator.py -e Exercises.txt -a Answers.txt
+- 向已有题目集追加（题号接续、与已有题目不重复）：python arithmetic_generator.py -r 10 -n 2000 --append
+- 从磁盘题目池抽样出卷：python arithmetic_generator.py -r 20 -n 100 --pool pools/r20
+- 批量作业（一个进程执行清单中的全部作业）：python arithmetic_generator.py --jobs nightly.json --workers 8
+- 常驻出卷/判题服务：python arithmetic_generator.py --serve --port 8000 --workers 2 --prewarm 10 20
+- 分阶段性能报告：python arithmetic_generator.py -r 10 -n 10000 --profile profile.json --cprofile
+- 流式多进程判题：python arithmetic_generator.py -e Exercises.txt -a Answers.txt --stream --workers 8
+- 批量判题：python arithmetic_generator.py -e Exercises.txt -a submissions/ --output-dir grades --workers 8
 """
 
 import argparse
+import csv
+import json
 import os
-from typing import List, Tuple
-
+import queue
+import sys
+import threading
+import time
+import zlib
+from fractions import Fraction
+from typing import Dict, List, Optional, Tuple, Union
+
+from answer_key import AnswerKey, AnswerKeyWriter, ExerciseIndex
 from expression_utils import ExpressionUtils
-from fraction_utils import FractionUtils
+from fraction_utils import FractionUtils, Rational
+from ingest import Ingest
+from key_index import KeyIndex
+from metrics import Metrics
 
+# 答案键：内存映射的二进制答案键，或由题目计算得到的 题号 -> 值 字典
+AnswerKeyLike = Union[AnswerKey, Dict[int, Optional[Fraction]]]
 
-def generate_exercises(n: int, r: int) -> Tuple[List[str], List[str]]:
-    """生成 n 道题目与答案
 
-    Args:
-        n: 题目数量（最大 10000）
-        r: 数值范围（必需）
+def iter_problems(n: int, r: int, workers: int = 1, seed: Optional[int] = None):
+    """按并行度选择生成方式，逐个产出不重复的题目 (题目文本, 精确值)"""
+    if workers > 1:
+        return ExpressionUtils.iter_unique_problems_parallel(n, r, max_operators=3, workers=workers, seed=seed)
+    return ExpressionUtils.iter_unique_problems(n, r, max_operators=3, seed=seed)
 
-    Returns:
-        (exercises, answers): 两个等长列表
+
+def iter_chunks(n: int, r: int, workers: int = 1, seed: Optional[int] = None,
+                engine: str = "python", chunk_size: int = 1000):
+    """逐块产出 (题目行, 答案行, 精确值)，题号从 1 连续编号
+
+    engine 为 "numpy" 时使用 BatchEngine 整批向量化生成（workers 不起作用）；
+    小数值范围仍走精确计数与无放回抽样，保证能取满上限。
     """
+    if engine == "numpy" and ExpressionUtils.expression_space(r) is None:
+        # 按需导入，python 引擎不承担导入 NumPy 的启动开销
+        from batch_engine import BatchEngine
+
+        if not BatchEngine.available():
+            raise ValueError("--engine numpy 需要安装 NumPy")
+        start = 1
+        for expressions, answers, numerators, denominators in BatchEngine(r, seed=seed).generate(n):
+            exercise_lines, answer_lines = BatchEngine.format_lines(start, expressions, answers)
+            start += len(exercise_lines)
+            yield exercise_lines, answer_lines, list(map(Rational, numerators.tolist(), denominators.tolist()))
+        return
+
+    # 题目生成时已携带精确值，无需再解析求值
+    exercises = []
+    answers = []
+    values = []
+    for i, (expression, value) in enumerate(iter_problems(n, r, workers, seed), start=1):
+        exercises.append(ExpressionUtils.format_exercise(i, expression))
+        answers.append(ExpressionUtils.format_answer(i, FractionUtils.fraction_to_string(value)))
+        values.append(value)
+        if len(exercises) >= chunk_size:
+            yield exercises, answers, values
+            exercises = []
+            answers = []
+            values = []
+    if exercises:
+        yield exercises, answers, values
+
+
+def build_exercise_set(n: int, r: int, workers: int = 1, seed: Optional[int] = None,
+                       engine: str = "python", pool: Optional[str] = None) -> Tuple[List[str], List[str], List[Fraction]]:
+    """生成 n 道题目，返回题目行、答案行与每题的精确值；指定 pool 时从该磁盘题目池抽样"""
     if r is None or r < 1:
         raise ValueError("必须通过 -r 指定数值范围，且为>=1的自然数")
 
     if n < 1 or n > 10000:
         raise ValueError("-n 范围为 1-10000")
 
-    expressions = ExpressionUtils.generate_unique_expressions(n, r, max_operators=3)
     exercises = []
     answers = []
+    values = []
+    if pool is not None:
+        for i, (expression, value) in enumerate(ExpressionUtils.sample_pool(n, r, pool_path=pool, seed=seed), start=1):
+            exercises.append(ExpressionUtils.format_exercise(i, expression))
+            answers.append(ExpressionUtils.format_answer(i, FractionUtils.fraction_to_string(value)))
+            values.append(value)
+        return exercises, answers, values
+
+    for chunk_exercises, chunk_answers, chunk_values in iter_chunks(n, r, workers, seed, engine, n):
+        exercises.extend(chunk_exercises)
+        answers.extend(chunk_answers)
+        values.extend(chunk_values)
+
+    return exercises, answers, values
 
-    for i, expr in enumerate(expressions, start=1):
-        exercises.append(ExpressionUtils.format_exercise(i, expr))
-        answers.append(ExpressionUtils.format_answer(i, ExpressionUtils.calculate_answer(expr)))
 
+def generate_exercises(n: int, r: int, workers: int = 1, seed: Optional[int] = None,
+                       engine: str = "python") -> Tuple[List[str], List[str]]:
+    """生成 n 道题目与答案
+
+    Args:
+        n: 题目数量（最大 10000）
+        r: 数值范围（必需）
+        workers: 生成进程数，大于 1 时分片并行生成
+        seed: 随机种子，指定后结果只由种子决定（与 workers 无关），且任意题目可按序号单独重建
+        engine: "python" 逐题生成；"numpy" 使用 BatchEngine 整批向量化生成（需 NumPy）
+
+    Returns:
+        (exercises, answers): 两个等长列表
+    """
+    exercises, answers, _ = build_exercise_set(n, r, workers, seed, engine)
     return exercises, answers
 
 
+def save_exercise_set(exercises: List[str], answers: List[str], values: List[Fraction],
+                      exercise_path: str = "Exercises.txt", answer_path: str = "Answers.txt") -> None:
+    """写出题目与答案文件，并在题目文件旁写出二进制答案键（见 AnswerKey）"""
+    write_lines(exercise_path, exercises)
+    write_lines(answer_path, answers)
+    with Metrics.timer("answer_key.write"):
+        AnswerKey.write(AnswerKey.sidecar_path(exercise_path), values, AnswerKey.file_checksum(exercise_path))
+
+
 def write_lines(path: str, lines: List[str]) -> None:
     """写入行到文件（覆盖）"""
-    with open(path, "w", encoding="utf-8") as f:
-        f.write("\n".join(lines))
+    with Metrics.timer("write"):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines))
+
+
+class StreamWriter:
+    """后台写入线程：按块写入多个文件，使文件 I/O 与题目生成重叠进行
+
+    每次 write 传入与文件一一对应的行列表；队列长度有限，内存占用与题目总数无关。
+    写入的同时计算每个文件内容的 CRC32（checksums），供答案键校验使用。
+    """
+
+    def __init__(self, paths: List[str], max_pending: int = 4, append: bool = False,
+                 checksums: Optional[List[int]] = None):
+        # 追加模式：写在已有内容之后，checksums 为已有内容的 CRC32，在其基础上继续累加
+        self._files = [open(path, "ab" if append else "wb") for path in paths]
+        self._first = [f.tell() == 0 for f in self._files]
+        self.checksums = list(checksums) if checksums is not None else [0] * len(paths)
+        self._queue = queue.Queue(max_pending)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            chunks = self._queue.get()
+            if chunks is None:
+                return
+            if self._error is not None:
+                continue
+            try:
+                start = time.perf_counter()
+                for i, (f, lines) in enumerate(zip(self._files, chunks)):
+                    # 与 write_lines 一致：行间以换行分隔，文件末尾不留空行
+                    data = (("" if self._first[i] else "\n") + "\n".join(lines)).encode("utf-8")
+                    f.write(data)
+                    self.checksums[i] = zlib.crc32(data, self.checksums[i])
+                    self._first[i] = False
+                Metrics.add_time("write", time.perf_counter() - start)
+            except Exception as e:
+                self._error = e
+
+    def write(self, *chunks: List[str]) -> None:
+        if self._error is not None:
+            raise self._error
+        self._queue.put(chunks)
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+        for f in self._files:
+            f.close()
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def stream_exercises(n: int, r: int, exercise_path: str = "Exercises.txt",
+                     answer_path: str = "Answers.txt", chunk_size: int = 1000,
+                     workers: int = 1, seed: Optional[int] = None, engine: str = "python") -> int:
+    """流式生成 n 道题目与答案并分块写入文件，不受 10000 道上限限制
+
+    Returns:
+        实际生成的题目数量
+    """
+    if r is None or r < 1:
+        raise ValueError("必须通过 -r 指定数值范围，且为>=1的自然数")
+
+    if n < 1:
+        raise ValueError("-n 必须为>=1的自然数")
+
+    # 生成是惰性的，容量不足须在打开（截断）输出文件之前发现
+    ExpressionUtils.check_capacity(n, r)
+
+    count = 0
+    with AnswerKeyWriter(AnswerKey.sidecar_path(exercise_path)) as key_writer:
+        with StreamWriter([exercise_path, answer_path]) as writer:
+            for exercises, answers, values in iter_chunks(n, r, workers, seed, engine, chunk_size):
+                count += len(exercises)
+                writer.write(exercises, answers)
+                key_writer.append(values)
+        key_writer.checksum = writer.checksums[0]
+    return count
+
+
+def build_exercise_index(exercise_path: str) -> ExerciseIndex:
+    """读取并解析整个题目文件，重建去重索引（索引缺失或题目文件被修改过时使用）"""
+    keys = KeyIndex()
+    count = 0
+    for idx, expr in Ingest.iter_exercises(exercise_path):
+        count = max(count, idx)
+        try:
+            keys.add(ExpressionUtils.get_expression_key(expr.decode("utf-8")))
+        except (ValueError, UnicodeDecodeError):
+            continue
+    return ExerciseIndex(keys, count, AnswerKey.file_checksum(exercise_path))
+
+
+def append_exercises(n: int, r: int, exercise_path: str = "Exercises.txt", answer_path: str = "Answers.txt",
+                     seed: Optional[int] = None, chunk_size: int = 1000) -> int:
+    """向已有题目集追加 n 道新题目，题号接续已有题目，且与已有题目互不重复
+
+    已有题目的标准化键从去重索引 Exercises.txt.idx 读取（整表读入，不逐题解析）；索引缺失或题目文件
+    在索引之后被修改过时才解析整个题目文件重建。答案键的校验和在原值上对新增内容增量计算，
+    有效的答案键只追加新记录。题目文件不存在时从空题目集开始。
+
+    Returns:
+        实际追加的题目数量
+    """
+    if r is None or r < 1:
+        raise ValueError("必须通过 -r 指定数值范围，且为>=1的自然数")
+
+    if n < 1:
+        raise ValueError("-n 必须为>=1的自然数")
+
+    key_path = AnswerKey.sidecar_path(exercise_path)
+    if not os.path.exists(exercise_path):
+        # 新题目集：从空文件与空答案键开始追加
+        write_lines(exercise_path, [])
+        write_lines(answer_path, [])
+        AnswerKey.write(key_path, [], 0)
+
+    with Metrics.timer("append.index"):
+        index = ExerciseIndex.load_for(exercise_path)
+        if index is None:
+            Metrics.incr("append.index_rebuilds")
+            index = build_exercise_index(exercise_path)
+
+    # 只有与追加前的题目文件一致的答案键才继续追加，否则保持原样（判题时因校验和不符而回退为重新计算）
+    key_valid = False
+    if os.path.exists(key_path):
+        try:
+            with AnswerKey(key_path) as key:
+                key_valid = key.count == index.count and key.checksum == index.checksum
+        except (OSError, ValueError):
+            pass
+
+    start = index.count
+    values = []
+    exercises = []
+    answers = []
+    trees = ExpressionUtils.iter_unique_trees(n, r, max_operators=3, seed=seed, seen=index.keys, start=start)
+    with StreamWriter([exercise_path, answer_path], append=True, checksums=[index.checksum, 0]) as writer:
+        for i, tree in enumerate(trees, start=start + 1):
+            exercises.append(ExpressionUtils.format_exercise(i, ExpressionUtils.render(tree)))
+            answers.append(ExpressionUtils.format_answer(i, FractionUtils.fraction_to_string(tree.value)))
+            values.append(tree.value)
+            if len(exercises) >= chunk_size:
+                writer.write(exercises, answers)
+                exercises = []
+                answers = []
+        if exercises:
+            writer.write(exercises, answers)
+
+    index.count = start + len(values)
+    index.checksum = writer.checksums[0]
+    if key_valid:
+        with Metrics.timer("answer_key.write"):
+            AnswerKey.extend(key_path, values, index.checksum)
+    index.save(exercise_path)
+    return len(values)
 
 
 def read_exercise_line(line: str) -> Tuple[int, str]:
@@ -94,65 +354,95 @@ def read_answer_line(line: str) -> Tuple[int, str]:
         raise ValueError(f"答案行格式错误：{line}")
 
 
-def grade(exercise_path: str, answer_path: str, output_path: str = "Grade.txt") -> None:
-    """判题并输出结果到 Grade.txt"""
+def is_answer_correct(value, ans_token: Optional[str]) -> bool:
+    """比较题目的值与用户答案；题目无法计算、缺少答案或答案格式错误均判为错误"""
+    if value is None or ans_token is None:
+        return False
+    # 规范书写的答案与值的格式化结果逐字相同，无需再解析
+    if ans_token == FractionUtils.fraction_to_string(value):
+        return True
+    try:
+        user_value = FractionUtils.string_to_fraction(ans_token)
+    except Exception:
+        return False
+    return user_value == value
+
+
+def build_answer_key(exercise_path: str) -> Dict[int, Optional[Fraction]]:
+    """读取题目文件并一次性计算全部题目的值，作为内存中的答案键（无法计算的题目值为 None）"""
     if not os.path.exists(exercise_path):
         raise FileNotFoundError(f"题目文件不存在：{exercise_path}")
+
+    exercises = [record for block in Ingest.iter_exercise_blocks(exercise_path) for record in block]
+
+    # 批量计算表达式值，非法表达式结果为 None
+    values = FractionUtils.calculate_expressions((expr.decode() for _, expr in exercises), strict=False,
+                                                 cache=FractionUtils.value_cache)
+    return {idx: value for (idx, _), value in zip(exercises, values)}
+
+
+def read_answers(answer_path: str) -> Dict[int, str]:
+    """读取答案文件，返回 题号 -> 答案 的字典（跳过不合法行）"""
     if not os.path.exists(answer_path):
         raise FileNotFoundError(f"答案文件不存在：{answer_path}")
 
-    # 读取题目
-    with open(exercise_path, "r", encoding="utf-8") as f:
-        exercise_lines = [line.rstrip("\n") for line in f]
+    answer_map = {}
+    for block in Ingest.iter_answer_blocks(answer_path):
+        answer_map.update((idx, answer.decode()) for idx, answer in block)
+    return answer_map
 
-    # 读取答案
-    with open(answer_path, "r", encoding="utf-8") as f:
-        answer_lines = [line.rstrip("\n") for line in f]
 
-    # 建立答案字典
-    answer_map = {}
-    for line in answer_lines:
-        try:
-            idx, ans_token = read_answer_line(line)
-            answer_map[idx] = ans_token
-        except Exception:
-            # 跳过不合法行
-            continue
+def load_answer_key(exercise_path: str) -> AnswerKeyLike:
+    """优先使用与题目文件校验和一致的二进制答案键，否则重新计算题目得到答案键"""
+    with Metrics.timer("grade.answer_key"):
+        answer_key = AnswerKey.load_for(exercise_path)
+        if answer_key is not None:
+            Metrics.incr("grade.sidecar_hits")
+            return answer_key
+        Metrics.incr("grade.sidecar_misses")
+        return build_answer_key(exercise_path)
+
 
+def compare_answers(answer_key: AnswerKeyLike, answer_map: Dict[int, str]) -> Tuple[List[int], List[int]]:
+    """按题号升序比较答案键与用户答案，返回 (正确题号, 错误题号)"""
     correct = []
     wrong = []
+    for idx in sorted(answer_key):
+        if is_answer_correct(answer_key[idx], answer_map.get(idx)):
+            correct.append(idx)
+        else:
+            wrong.append(idx)
+    return correct, wrong
+
 
+def grade_lines(exercise_lines: List[str], answer_lines: List[str]) -> Tuple[List[int], List[int]]:
+    """对内存中的题目行与答案行判题（格式同 Exercises.txt / Answers.txt），返回 (正确题号, 错误题号)"""
+    exercises = []
     for line in exercise_lines:
         try:
-            idx, expr = read_exercise_line(line)
-        except Exception:
-            continue
-
-        # 计算表达式值
-        value = FractionUtils.calculate_expression(expr)
-
-        # 题目答案
-        expected = FractionUtils.fraction_to_string(value)
-
-        # 用户答案
-        ans_token = answer_map.get(idx)
-        if ans_token is None:
-            wrong.append(idx)
+            exercises.append(read_exercise_line(line))
+        except ValueError:
             continue
-
+    answer_map = {}
+    for line in answer_lines:
         try:
-            user_value = FractionUtils.string_to_fraction(ans_token)
-        except Exception:
-            wrong.append(idx)
+            idx, ans_token = read_answer_line(line)
+        except ValueError:
             continue
+        answer_map[idx] = ans_token
+    values = FractionUtils.calculate_expressions((expr for _, expr in exercises), strict=False,
+                                                 cache=FractionUtils.value_cache)
+    return compare_answers({idx: value for (idx, _), value in zip(exercises, values)}, answer_map)
 
-        if user_value == value:
-            correct.append(idx)
-        else:
-            wrong.append(idx)
 
-    correct.sort()
-    wrong.sort()
+def grade_with_key(answer_key: AnswerKeyLike, answer_path: str,
+                   output_path: str = "Grade.txt") -> Tuple[int, int]:
+    """用已计算好的答案键判一份答案文件，输出结果文件
+
+    Returns:
+        (正确数量, 错误数量)
+    """
+    correct, wrong = compare_answers(answer_key, read_answers(answer_path))
 
     result_lines = [
         f"Correct: {len(correct)} ({', '.join(map(str, correct))})",
@@ -160,22 +450,337 @@ def grade(exercise_path: str, answer_path: str, output_path: str = "Grade.txt")
     ]
 
     write_lines(output_path, result_lines)
+    return len(correct), len(wrong)
+
+
+def grade(exercise_path: str, answer_path: str, output_path: str = "Grade.txt") -> Tuple[int, int]:
+    """判题并输出结果到 Grade.txt
+
+    Returns:
+        (正确数量, 错误数量)
+    """
+    if not os.path.exists(exercise_path):
+        raise FileNotFoundError(f"题目文件不存在：{exercise_path}")
+    if not os.path.exists(answer_path):
+        raise FileNotFoundError(f"答案文件不存在：{answer_path}")
+
+    return grade_with_key(load_answer_key(exercise_path), answer_path, output_path)
+
+
+# 批量判题工作进程中的答案键，由进程池初始化函数设置，避免每个任务重复传输
+_answer_key: AnswerKeyLike = {}
+
+
+def _init_answer_key(answer_key: AnswerKeyLike) -> None:
+    global _answer_key
+    _answer_key = answer_key
+
+
+def _grade_one(answer_key: AnswerKeyLike, answer_path: str,
+               output_path: str) -> Tuple[Optional[int], Optional[int], Optional[str]]:
+    """判一份答案，错误只影响这一份：返回 (正确数量, 错误数量, None) 或 (None, None, 错误信息)"""
+    try:
+        correct, wrong = grade_with_key(answer_key, answer_path, output_path)
+    except Exception as e:
+        return None, None, f"{type(e).__name__}: {e}"
+    return correct, wrong, None
+
+
+def _grade_submission(job: Tuple[str, str]) -> Tuple[Optional[int], Optional[int], Optional[str]]:
+    answer_path, output_path = job
+    return _grade_one(_answer_key, answer_path, output_path)
+
+
+def grade_output_names(files: List[str]) -> List[str]:
+    """
+    为每份答案取互不相同的结果文件名 Grade_<文件名>.txt
+
+    文件名（不含扩展名）重复时改用 Grade_<上级目录>_<文件名>.txt，仍然重复时再追加在列表中的序号（从 1 开始）。
+    """
+    stems = [os.path.splitext(os.path.basename(path))[0] for path in files]
+    names = []
+    for path, stem in zip(files, stems):
+        if stems.count(stem) > 1:
+            parent = os.path.basename(os.path.dirname(os.path.abspath(path)))
+            stem = f"{parent}_{stem}"
+        names.append(stem)
+    return [f"Grade_{name}.txt" if names.count(name) == 1 else f"Grade_{name}_{i}.txt"
+            for i, name in enumerate(names, start=1)]
+
+
+def grade_many(exercise_path: str, answer_paths: List[str], output_dir: str = ".",
+               workers: int = 1, summary_name: str = "Summary.csv"
+               ) -> List[Tuple[str, Optional[int], Optional[int], Optional[str]]]:
+    """用同一份题目批量判多份答案：题目只计算一次，各答案文件并行判题
+
+    answer_paths 中的目录会展开为其中的 .txt 文件。每份答案输出一个结果文件（命名见 grade_output_names），
+    并在 output_dir 下写出汇总表 Summary.csv（answer_file,grade_file,correct,wrong,error）。
+    某份答案无法读取或判题出错时只在汇总中记录错误，不影响其它答案。
+
+    Returns:
+        [(答案文件, 正确数量, 错误数量, 错误信息), ...]：成功时错误信息为 None，失败时两个数量为 None
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    files = []
+    for path in answer_paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith(".txt"))
+        else:
+            files.append(path)
+
+    answer_key = load_answer_key(exercise_path)
+    os.makedirs(output_dir, exist_ok=True)
+    outputs = [os.path.join(output_dir, name) for name in grade_output_names(files)]
+    jobs = list(zip(files, outputs))
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_answer_key,
+                                 initargs=(answer_key,)) as executor:
+            counts = list(executor.map(_grade_submission, jobs, chunksize=8))
+    else:
+        counts = [_grade_one(answer_key, path, output_path) for path, output_path in jobs]
+
+    results = [(path, correct, wrong, error) for path, (correct, wrong, error) in zip(files, counts)]
+    with open(os.path.join(output_dir, summary_name), "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(["answer_file", "grade_file", "correct", "wrong", "error"])
+        for (path, correct, wrong, error), output in zip(results, outputs):
+            writer.writerow([path, os.path.basename(output), correct, wrong, error])
+    return results
+
+
+def _grade_chunk(items: List[Tuple[int, str, Optional[str]]]) -> List[Tuple[int, bool]]:
+    """判题任务：items 为 (题号, 表达式, 用户答案) 列表，可在工作进程中执行"""
+    values = FractionUtils.calculate_expressions((expr for _, expr, _ in items), strict=False,
+                                                 cache=FractionUtils.value_cache)
+    return [(idx, is_answer_correct(value, ans_token)) for (idx, _, ans_token), value in zip(items, values)]
+
+
+class NumberingOrderError(ValueError):
+    """流式判题时题目或答案未按题号严格升序排列"""
+
+
+def _iter_grade_chunks(exercise_path: str, answer_path: str, chunk_size: int):
+    """同步流式读取题目与答案文件（Ingest 按块读入并切分），按块产出 (题号, 表达式, 用户答案) 列表
+
+    两个文件均按题号升序排列时，只需缓存少量提前读到的答案，内存占用与文件大小无关。
+
+    Raises:
+        NumberingOrderError: 题号不是严格升序（乱序或重复）。此时后面的答案可能已被跳过，
+            继续判题会把它们误判为错误
+    """
+    answers = Ingest.iter_answers(answer_path)
+    pending = {}
+    last_answer = 0
+    last_exercise = 0
+    chunk = []
+    for idx, expr in Ingest.iter_exercises(exercise_path):
+        if idx <= last_exercise:
+            raise NumberingOrderError(f"题目文件题号未按升序排列：{idx} 出现在 {last_exercise} 之后")
+        last_exercise = idx
+        chunk.append((idx, expr.decode()))
+        if len(chunk) < chunk_size:
+            continue
+        # 读取答案直到覆盖本块最大题号
+        while last_answer < idx:
+            record = next(answers, None)
+            if record is None:
+                break
+            if record[0] <= last_answer:
+                raise NumberingOrderError(f"答案文件题号未按升序排列：{record[0]} 出现在 {last_answer} 之后")
+            last_answer = record[0]
+            pending[last_answer] = record[1].decode()
+        yield [(idx, expr, pending.pop(idx, None)) for idx, expr in chunk]
+        chunk = []
+    if chunk:
+        for idx, answer in answers:
+            if idx <= last_answer:
+                raise NumberingOrderError(f"答案文件题号未按升序排列：{idx} 出现在 {last_answer} 之后")
+            last_answer = idx
+            pending[idx] = answer.decode()
+        yield [(idx, expr, pending.pop(idx, None)) for idx, expr in chunk]
+
+
+def grade_stream(exercise_path: str, answer_path: str, output_path: str = "Grade.txt",
+                 workers: int = 1, chunk_size: int = 10000) -> Tuple[int, int]:
+    """流式判题：分块读取文件、多进程计算，并增量写出结果
+
+    正确与错误题号先分别写入临时文件，最后拼接为 Grade.txt，内存占用与题目数量无关。
+    要求题目与答案文件均按题号严格升序排列（程序生成的文件总是如此）；发现乱序或重复题号时
+    放弃已有的流式结果，回退为整体读入的 grade，结果与 grade 相同。
 
+    Returns:
+        (正确数量, 错误数量)
+    """
+    if not os.path.exists(exercise_path):
+        raise FileNotFoundError(f"题目文件不存在：{exercise_path}")
+    if not os.path.exists(answer_path):
+        raise FileNotFoundError(f"答案文件不存在：{answer_path}")
 
-def main():
+    try:
+        return _grade_stream(exercise_path, answer_path, output_path, workers, chunk_size)
+    except NumberingOrderError:
+        Metrics.incr("grade.stream_fallback")
+        return grade(exercise_path, answer_path, output_path)
+
+
+def _grade_stream(exercise_path: str, answer_path: str, output_path: str,
+                  workers: int, chunk_size: int) -> Tuple[int, int]:
+    import tempfile
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+
+    counts = [0, 0]
+    with tempfile.TemporaryFile("w+", encoding="utf-8") as correct_f, \
+            tempfile.TemporaryFile("w+", encoding="utf-8") as wrong_f:
+        outputs = (wrong_f, correct_f)
+
+        def record(results):
+            for idx, ok in results:
+                f = outputs[ok]
+                f.write(f", {idx}" if counts[ok] else str(idx))
+                counts[ok] += 1
+
+        chunks = _iter_grade_chunks(exercise_path, answer_path, chunk_size)
+        answer_key = AnswerKey.load_for(exercise_path)
+        if answer_key is not None:
+            # 答案键有效时直接比较，无需计算
+            with answer_key:
+                for items in chunks:
+                    record([(idx, is_answer_correct(answer_key.get(idx), ans_token)) for idx, _, ans_token in items])
+        elif workers > 1:
+            # 限制在途任务数量，避免一次性读入整个文件
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                in_flight = deque()
+                for items in chunks:
+                    in_flight.append(executor.submit(_grade_chunk, items))
+                    if len(in_flight) >= workers * 2:
+                        record(in_flight.popleft().result())
+                while in_flight:
+                    record(in_flight.popleft().result())
+        else:
+            for items in chunks:
+                record(_grade_chunk(items))
+
+        with open(output_path, "w", encoding="utf-8") as out:
+            for label, f, count in (("Correct", correct_f, counts[1]), ("Wrong", wrong_f, counts[0])):
+                if label == "Wrong":
+                    out.write("\n")
+                out.write(f"{label}: {count} (")
+                f.seek(0)
+                while True:
+                    block = f.read(1 << 20)
+                    if not block:
+                        break
+                    out.write(block)
+                out.write(")")
+
+    return counts[1], counts[0]
+
+
+def main(argv: Optional[List[str]] = None):
     parser = argparse.ArgumentParser(
         description="自动生成小学四则运算题目（支持判题）",
     )
     parser.add_argument("-r", type=int, help="数值范围（必需，所有数值小于此值）")
     parser.add_argument("-n", type=int, default=10, help="题目数量（默认10，最大10000）")
     parser.add_argument("-e", type=str, help="题目文件路径（判题模式）")
-    parser.add_argument("-a", type=str, help="答案文件路径（判题模式）")
+    parser.add_argument("-a", type=str, nargs="+", help="答案文件路径（判题模式），可给出多个文件或目录进行批量判题")
+    parser.add_argument("--output-dir", type=str, default=".", help="批量判题时结果文件的输出目录（默认当前目录）")
+    parser.add_argument("--stream", action="store_true", help="流式生成/判题，分块读写文件（不限题目数量）；"
+                        "流式判题要求题目与答案文件按题号升序排列，否则回退为整体读入判题")
+    parser.add_argument("--workers", type=int, default=1, help="生成或判题的进程数（默认1）")
+    parser.add_argument("--seed", type=int, help="随机种子，指定后生成结果可复现")
+    parser.add_argument("--engine", choices=["python", "numpy"], default="python",
+                        help="生成引擎：python 逐题生成（默认），numpy 整批向量化生成（需 NumPy）")
+    parser.add_argument("--profile", type=str, nargs="?", const="profile.json",
+                        help="输出分阶段计数与耗时的 JSON 报告（默认 profile.json）")
+    parser.add_argument("--cprofile", action="store_true", help="与 --profile 同用，在报告中附带 cProfile 耗时最多的函数")
+    parser.add_argument("--serve", action="store_true", help="以常驻服务方式运行，通过 HTTP 提供出卷与判题接口")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="服务监听地址（默认 127.0.0.1）")
+    parser.add_argument("--port", type=int, default=8000, help="服务监听端口（默认 8000）")
+    parser.add_argument("--socket", type=str, help="改为监听该路径的 Unix 套接字")
+    parser.add_argument("--pool-size", type=int, default=2000, help="每组参数预生成题目池的目标大小（默认 2000）")
+    parser.add_argument("--prewarm", type=int, nargs="*", default=[], help="服务启动时即预热的 r 值列表")
+    parser.add_argument("--jobs", type=str, help="执行作业清单（JSON 或 CSV）中的全部出卷/判题作业，每个作业输出一行 JSON 结果")
+    parser.add_argument("--append", action="store_true",
+                        help="向已有的 Exercises.txt/Answers.txt 追加 -n 道与已有题目不重复的新题目，题号接续")
+    parser.add_argument("--pool", type=str, help="从该目录的磁盘题目池抽样出卷（不存在时创建，题目不足时增量扩充）")
+
+    args = parser.parse_args(argv)
+    if not args.profile:
+        run(args, parser)
+        return
 
-    args = parser.parse_args()
+    Metrics.reset()
+    Metrics.enable()
+    profiler = None
+    if args.cprofile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    start = time.perf_counter()
+    try:
+        run(args, parser)
+    finally:
+        wall = time.perf_counter() - start
+        if profiler is not None:
+            profiler.disable()
+        Metrics.enable(False)
+        write_profile(args.profile, sys.argv[1:] if argv is None else argv, wall, profiler)
+        print(f"性能报告已写入 {args.profile}")
+
+
+def write_profile(path: str, argv: List[str], wall: float, profiler=None, top: int = 30) -> None:
+    """将 Metrics 的计数与计时（及可选的 cProfile 热点函数）写为 JSON 报告"""
+    report = {"argv": list(argv), "wall_sec": wall}
+    report.update(Metrics.snapshot())
+    if profiler is not None:
+        import pstats
+        stats = pstats.Stats(profiler).stats
+        rows = sorted(stats.items(), key=lambda item: item[1][2], reverse=True)[:top]
+        report["cprofile"] = [
+            {
+                "function": f"{filename}:{line}({name})",
+                "calls": calls,
+                "tottime_sec": tottime,
+                "cumtime_sec": cumtime,
+            }
+            for (filename, line, name), (_, calls, tottime, cumtime, _) in rows
+        ]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+def run(args: argparse.Namespace, parser: argparse.ArgumentParser) -> None:
+    """按解析后的命令行参数执行服务、判题或生成"""
+    if args.jobs:
+        from batch_jobs import run_manifest
+        summary = run_manifest(args.jobs, workers=args.workers)
+        print(f"作业完成：成功 {summary['ok']}，失败 {summary['error']}", file=sys.stderr)
+        return
+
+    if args.serve:
+        from service import serve
+        serve(args.host, args.port, args.socket, workers=args.workers, pool_size=args.pool_size,
+              prewarm=args.prewarm)
+        return
 
     # 判题模式优先
     if args.e and args.a:
-        grade(args.e, args.a)
+        with Metrics.timer("grade"):
+            if len(args.a) > 1 or os.path.isdir(args.a[0]):
+                results = grade_many(args.e, args.a, args.output_dir, workers=args.workers)
+                for path, _, _, error in results:
+                    if error is not None:
+                        print(f"判题失败：{path}：{error}", file=sys.stderr)
+                print(f"判题完成，共 {len(results)} 份答案，汇总已写入 {os.path.join(args.output_dir, 'Summary.csv')}")
+                return
+            if args.stream or args.workers > 1:
+                grade_stream(args.e, args.a[0], workers=args.workers)
+            else:
+                grade(args.e, args.a[0])
         print("判题完成，结果已写入 Grade.txt")
         return
 
@@ -183,13 +788,29 @@ def main():
     if args.r is None:
         parser.error("生成题目时必须提供 -r 参数，例如：python arithmetic_generator.py -r 10 -n 20")
 
-    exercises, answers = generate_exercises(args.n, args.r)
-
-    write_lines("Exercises.txt", exercises)
-    write_lines("Answers.txt", answers)
+    try:
+        if args.append:
+            with Metrics.timer("generate"):
+                count = append_exercises(args.n, args.r, seed=args.seed)
+            print(f"已追加 {count} 道题目到 Exercises.txt，与答案到 Answers.txt")
+            return
+
+        if args.stream:
+            with Metrics.timer("generate"):
+                count = stream_exercises(args.n, args.r, workers=args.workers, seed=args.seed, engine=args.engine)
+            print(f"已生成 {count} 道题目到 Exercises.txt，与答案到 Answers.txt")
+            return
+
+        with Metrics.timer("generate"):
+            exercises, answers, values = build_exercise_set(args.n, args.r, workers=args.workers, seed=args.seed,
+                                                            engine=args.engine, pool=args.pool)
+    except ValueError as e:
+        parser.error(str(e))
+
+    save_exercise_set(exercises, answers, values)
 
     print(f"已生成 {len(exercises)} 道题目到 Exercises.txt，与答案到 Answers.txt")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,290 @@
+"""
+批量生成引擎（可选，依赖 NumPy）
+一次为整批题目抽取操作数、运算符与括号，以整数分子/分母数组做向量化的有理数运算，
+用掩码施加减法与除法约束，最后才渲染题目文本；输出格式与 Exercises.txt / Answers.txt 一致。
+未安装 NumPy 时 BatchEngine.available() 返回 False，其余模块不受影响。
+"""
+
+from expression_utils import ExpressionUtils
+from fraction_utils import FractionUtils
+from key_index import KeyIndex
+
+try:
+    import numpy as np
+except ImportError:  # NumPy 为可选依赖
+    np = None
+
+
+class BatchEngine:
+    """
+    向量化题目生成器
+
+    题目均为左深链 n0 op1 n1 … opk nk（与 ExpressionSpace、tree_from_chain 的结构一致）：
+    - 操作数按 FractionUtils.generate_number 的分布整批抽取，不构造数值表；
+    - 运算符等概率抽取；'÷' 无合法除数时在其余三种运算符中重抽，与逐题生成的规则相同；
+    - '-' 的减数、'÷' 的除数与 FractionUtils.pick_not_greater / pick_greater 同分布（见 _partners），
+      随后以交叉相乘精确校验，未通过的行整行丢弃；
+    - 中间值的分子或分母达到 2^31 时整行丢弃，保证 int64 乘积不溢出；
+    - 去重键与 ExpressionUtils.make_branch 的 64 位标准化键 key64 完全一致，并使用 KeyIndex 去重。
+    """
+
+    # 中间值分子、分母的上限，两两相乘不超过 2^62
+    LIMIT = 1 << 31
+    # 文本渲染时的运算符与优先级，下标即运算符编码
+    OP_TEXT = ExpressionUtils.OPERATORS
+    OP_PREC = [1, 1, 2, 2]
+
+    def __init__(self, max_value, max_operators=3, seed=None):
+        if np is None:
+            raise ImportError("批量生成引擎需要 NumPy，请先安装：pip install numpy")
+        if max_value < 3:
+            raise ValueError("批量生成引擎要求 r >= 3")
+        self.max_value = max_value
+        self.max_operators = max_operators
+        self.rng = np.random.default_rng(seed)
+        self._ops = np.array(BatchEngine.OP_TEXT)
+        self._prec = np.array(BatchEngine.OP_PREC)
+
+    @staticmethod
+    def available():
+        """是否已安装 NumPy"""
+        return np is not None
+
+    def _numbers(self, size):
+        """按 generate_number 的分布抽取 size 个数，返回约分后的 (分子, 分母) 数组"""
+        rng = self.rng
+        r = self.max_value
+        choice = rng.integers(0, 4, size)
+        # 真分数：分母 2..r-1，分子 1..分母-1；带分数再加上 1..r-2 的整数部分
+        d = rng.integers(2, r, size)
+        n = 1 + (rng.random(size) * (d - 1)).astype(np.int64)
+        n += np.where(choice == 2, rng.integers(1, r - 1, size), 0) * d
+        integer = choice == 0
+        n = np.where(integer, rng.integers(0, r, size), n)
+        d = np.where(integer, 1, d)
+        g = np.gcd(n, d)
+        return n // g, d // g
+
+    @staticmethod
+    def _mix64(x):
+        """向量化的 FractionUtils.mix64（uint64 运算按 2^64 回绕，与整数运算取低 64 位一致）"""
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return x ^ (x >> np.uint64(31))
+
+    @staticmethod
+    def pair_hashes(numerators, denominators):
+        """向量化的 FractionUtils.pair_hash（分子、分母均为非负且小于 2^63）"""
+        golden = np.uint64(FractionUtils.HASH_GOLDEN)
+        return BatchEngine._mix64(numerators.astype(np.uint64) * golden + denominators.astype(np.uint64))
+
+    @staticmethod
+    def combine_hashes(ops, left, right):
+        """向量化的 FractionUtils.combine_hash，ops 为运算符编码数组"""
+        commutative = (ops == 0) | (ops == 2)
+        low = np.where(commutative, np.minimum(left, right), left)
+        high = np.where(commutative, np.maximum(left, right), right)
+        salts = np.array([FractionUtils.HASH_SALT[op] for op in BatchEngine.OP_TEXT], dtype=np.uint64)
+        return BatchEngine._mix64((low * np.uint64(FractionUtils.HASH_GOLDEN) + high) ^ salts[ops])
+
+    def _partners(self, vn, vd, greater):
+        """
+        向量化的 FractionUtils._pick_partner：为每个非负值 vn/vd 抽取不大于（greater 为 False）
+        或大于它的数，分布与对 generate_number 做拒绝抽样相同
+
+        Returns:
+            (numerators, denominators, exists): 未约分的分子、分母与“存在合法的数”的掩码
+        """
+        rng = self.rng
+        r = self.max_value
+        whole_max = r - 2
+        vn = np.maximum(vn, 0)
+        vd = np.maximum(vd, 1)
+        q = vn // vd
+        remainder = vn - q * vd
+        if greater:
+            int_lo, int_hi = q + 1, np.full_like(q, r - 1)
+            proper_full = np.zeros(len(q), dtype=bool)
+            mixed_lo, mixed_hi = q + 1, np.full_like(q, whole_max)
+            share = vd - remainder
+            d0 = vd // share + 1
+        else:
+            int_lo, int_hi = np.zeros_like(q), np.minimum(q, r - 1)
+            proper_full = q >= 1
+            mixed_lo, mixed_hi = np.ones_like(q), np.minimum(q - 1, whole_max)
+            share = remainder
+            d0 = np.where(share > 0, -(-vd // np.maximum(share, 1)), r)
+        d0 = np.maximum(d0, 2)
+        # 分数部分需与 f 比较的一项（见 FractionUtils._partial_bound）
+        has_partial = (d0 <= r - 1) & (q <= whole_max)
+        d0 = np.minimum(d0, r - 1)
+        bound = np.minimum(1.0, share * d0 / (vd * (d0 - 1)))
+        weight = np.where(q == 0, 0.5, 0.25 / whole_max)
+        int_count = np.maximum(int_hi - int_lo + 1, 0)
+        mixed_count = np.maximum(mixed_hi - mixed_lo + 1, 0)
+        masses = np.stack([int_count / (4 * r),
+                           np.where(proper_full, 0.5, 0.0),
+                           0.25 * mixed_count / whole_max,
+                           np.where(has_partial, weight * (r - d0) / whole_max * bound, 0.0)], axis=1)
+        edges = np.cumsum(masses, axis=1)
+        exists = edges[:, -1] > 0
+
+        numerators = np.zeros(len(q), dtype=np.int64)
+        denominators = np.ones(len(q), dtype=np.int64)
+        pending = np.flatnonzero(exists)
+        while len(pending):
+            size = len(pending)
+            x = rng.random(size) * edges[pending, -1]
+            part = (x[:, None] >= edges[pending]).sum(axis=1)
+            # 整数、真分数、带分数各自的候选
+            n = int_lo[pending] + (rng.random(size) * int_count[pending]).astype(np.int64)
+            d = np.ones(size, dtype=np.int64)
+            fd = rng.integers(2, r, size)
+            fn = 1 + (rng.random(size) * (fd - 1)).astype(np.int64)
+            fraction = (part == 1) | (part == 2)
+            w = np.where(part == 2, mixed_lo[pending] + (rng.random(size) * mixed_count[pending]).astype(np.int64), 0)
+            n = np.where(fraction, w * fd + fn, n)
+            d = np.where(fraction, fd, d)
+            # 整数部分为 q 的一项：等概率选分母，按合法分子的占比接受
+            pd = rng.integers(d0[pending], r)
+            low = remainder[pending] * pd // vd[pending]
+            count = pd - 1 - low if greater else low
+            accept = (part != 3) | (rng.random(size) * bound[pending] * (pd - 1) < count)
+            offset = low + 1 if greater else 1
+            pn = offset + (rng.random(size) * np.maximum(count, 1)).astype(np.int64)
+            n = np.where(part == 3, q[pending] * pd + pn, n)
+            d = np.where(part == 3, pd, d)
+            done = pending[accept]
+            numerators[done] = n[accept]
+            denominators[done] = d[accept]
+            pending = pending[~accept]
+        return numerators, denominators, exists
+
+    def draw(self, size):
+        """
+        抽取一批候选题目（可能含重复）
+
+        Returns:
+            (expressions, keys, numerators, denominators): 题目文本（NumPy 字符串数组）、64 位标准化键（uint64 数组）
+            与精确值的分子、分母（int64 数组）；不满足约束的行已被剔除
+        """
+        rng = self.rng
+        r = self.max_value
+        k = rng.integers(1, self.max_operators + 1, size)
+        vn, vd = self._numbers(size)
+        text = BatchEngine.format_values(vn, vd)
+        key = BatchEngine.pair_hashes(vn, vd)
+        prev_prec = np.full(size, 3)
+        ok = np.ones(size, dtype=bool)
+
+        for j in range(self.max_operators):
+            active = j < k
+            op = rng.integers(0, 4, size)
+            safe_vd = np.maximum(vd, 1)
+
+            # '÷'：无合法除数（被除数为 0 或已是范围内最大的数）时在 '+'、'-'、'×' 中重抽
+            divide = np.flatnonzero(active & (op == 3))
+            dn, dd, has_divisor = self._partners(vn[divide], safe_vd[divide], True)
+            has_divisor &= vn[divide] > 0
+            op[divide] = np.where(has_divisor, 3, rng.integers(0, 3, len(divide)))
+            divisor = np.zeros(size, dtype=np.int64)
+            d = np.ones(size, dtype=np.int64)
+            divisor[divide] = dn
+            d[divide] = dd
+
+            # '-'：被减数非负时 0 总是合法减数
+            subtract = np.flatnonzero(active & (op == 1))
+            sn, sdn, _ = self._partners(vn[subtract], safe_vd[subtract], False)
+            subtrahend = np.zeros(size, dtype=np.int64)
+            sd = np.ones(size, dtype=np.int64)
+            subtrahend[subtract] = sn
+            sd[subtract] = sdn
+
+            an, ad = self._numbers(size)
+            bn = np.select([op == 1, op == 3], [subtrahend, divisor], an)
+            bd = np.select([op == 1, op == 3], [sd, d], ad)
+            g = np.gcd(bn, bd)
+            bn //= g
+            bd //= g
+
+            ok &= ~active | ((np.abs(vn) < BatchEngine.LIMIT) & (vd < BatchEngine.LIMIT))
+            # 交叉相乘：cross 为 当前值 × bd，other 为 操作数 × vd
+            cross = vn * bd
+            other = bn * vd
+            ok &= ~active | (op != 1) | (cross >= other)
+            ok &= ~active | (op != 3) | ((cross > 0) & (cross < other))
+
+            n = np.select([op == 0, op == 1, op == 2], [cross + other, cross - other, vn * bn], cross)
+            nd = np.where(op == 3, vd * bn, vd * bd)
+            nd = np.where(nd == 0, 1, nd)
+            g = np.gcd(n, nd)
+            g = np.where(g == 0, 1, g)
+            vn = np.where(active, n // g, vn)
+            vd = np.where(active, nd // g, vd)
+
+            # 渲染：底层 '+'/'×' 随机交换左右，左侧子式按 paren 或优先级加括号
+            op_text = self._ops[op]
+            right_text = BatchEngine.format_values(bn, bd)
+            commutative = (op == 0) | (op == 2)
+            prec = self._prec[op]
+            if j == 0:
+                swap = commutative & (rng.random(size) < 0.5)
+                left_text = np.where(swap, right_text, text)
+                right_text = np.where(swap, text, right_text)
+            else:
+                paren = (op == 1) | (op == 3) | (rng.random(size) < 0.3) | (prev_prec < prec)
+                left_text = np.where(paren, np.char.add(np.char.add('(', text), ')'), text)
+            new_text = np.char.add(np.char.add(np.char.add(left_text, ' '), op_text),
+                                   np.char.add(' ', right_text))
+            text = np.where(active, new_text, text)
+            prev_prec = np.where(active, prec, prev_prec)
+
+            # 64 位标准化键：与 make_branch 相同，以 uint64 数组整批组合
+            key = np.where(active, BatchEngine.combine_hashes(op, key, BatchEngine.pair_hashes(bn, bd)), key)
+
+        return text[ok], key[ok], vn[ok], vd[ok]
+
+    @staticmethod
+    def format_values(numerators, denominators):
+        """向量化的 FractionUtils.fraction_to_string（值均非负）"""
+        whole = numerators // denominators
+        remainder = numerators % denominators
+        whole_text = whole.astype(str)
+        fraction_text = np.char.add(np.char.add(remainder.astype(str), '/'), denominators.astype(str))
+        mixed_text = np.char.add(np.char.add(whole_text, "'"), fraction_text)
+        return np.where(remainder == 0, whole_text, np.where(whole == 0, fraction_text, mixed_text))
+
+    @staticmethod
+    def format_lines(start, expressions, answers):
+        """向量化的 format_exercise / format_answer，题号从 start 开始"""
+        labels = np.char.add(np.arange(start, start + len(expressions)).astype(str), '. ')
+        return (np.char.add(np.char.add(labels, expressions), ' =').tolist(),
+                np.char.add(labels, answers).tolist())
+
+    def generate(self, count, batch_size=100000):
+        """
+        逐批产出至多 count 道互不重复的题目
+
+        与逐题生成相同，候选总数达到 count * 20 时停止。
+
+        Yields:
+            (expressions, answers, numerators, denominators): 题目文本与答案文本（NumPy 字符串数组）、
+            精确值的分子与分母（int64 数组）
+        """
+        expression_keys = KeyIndex(count)
+        add = expression_keys.add
+        produced = 0
+        attempts = 0
+        while produced < count and attempts < count * 20:
+            size = min(batch_size, max(count - produced, 1024))
+            attempts += size
+            expressions, keys, numerators, denominators = self.draw(size)
+            fresh = np.fromiter(map(add, keys.tolist()), dtype=bool, count=len(keys))
+            picked = np.flatnonzero(fresh)[:count - produced]
+            if len(picked) == 0:
+                continue
+            produced += len(picked)
+            numerators = numerators[picked]
+            denominators = denominators[picked]
+            yield (expressions[picked], BatchEngine.format_values(numerators, denominators),
+                   numerators, denominators)
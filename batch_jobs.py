@@ -0,0 +1,139 @@
+"""
+批量作业
+在一个进程内执行清单中的多个出卷/判题作业，省去每份试卷都重新启动解释器、导入模块的开销；
+可选用常驻的工作进程池并行执行。每个作业完成后按清单顺序输出一行 JSON 结果。
+
+清单为 JSON（作业对象列表，或 {"jobs": [...]}）或 CSV（首行为列名），字段：
+- type：generate 或 grade（省略时有 grade 字段或无 r 字段的视为判题）
+- id：结果中的作业标识（默认为清单中的序号，从 1 开始）
+- 出卷：r、n（默认 10）、seed、engine、pool、stream（真值时流式生成，不受 10000 道限制），
+  输出路径 exercises、answers（默认 Exercises.txt、Answers.txt）
+- 判题：exercises、answers、grade（默认 Grade.txt）
+并行执行时，同时运行的作业不应写同一输出文件或扩充同一题目池目录。
+
+用法示例：
+- python arithmetic_generator.py --jobs nightly.json
+- python arithmetic_generator.py --jobs nightly.csv --workers 8 > results.jsonl
+"""
+
+import csv
+import json
+import os
+import sys
+import time
+from typing import Dict, Iterator, List, Optional
+
+import arithmetic_generator as ag
+
+TRUE_VALUES = ("1", "true", "yes", "y")
+
+
+def load_manifest(path: str) -> List[Dict]:
+    """读取作业清单（按扩展名区分 CSV 与 JSON），CSV 中的空单元格视为未给出"""
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.lower().endswith(".csv"):
+            jobs = [{name: value for name, value in row.items() if name and value not in (None, "")}
+                    for row in csv.DictReader(f)]
+        else:
+            jobs = json.load(f)
+            if isinstance(jobs, dict):
+                jobs = jobs.get("jobs", [])
+    if not isinstance(jobs, list) or not all(isinstance(job, dict) for job in jobs):
+        raise ValueError(f"作业清单格式错误：{path}")
+    for i, job in enumerate(jobs, start=1):
+        job.setdefault("id", i)
+    return jobs
+
+
+def _job_type(job: Dict) -> str:
+    kind = job.get("type")
+    if kind is None:
+        kind = "grade" if "grade" in job or "r" not in job else "generate"
+    if kind not in ("generate", "grade"):
+        raise ValueError(f"未知作业类型：{kind}")
+    return kind
+
+
+def _optional_int(value) -> Optional[int]:
+    return None if value is None else int(value)
+
+
+def _make_parent(path: str) -> None:
+    parent = os.path.dirname(path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+
+
+def run_job(job: Dict) -> Dict:
+    """
+    执行一个作业，不抛出异常：参数、文件错误以及任何意外异常都作为本作业的 error 结果返回，
+    不会中断清单中的其它作业
+
+    Returns:
+        dict: {"id", "type", "status": "ok"/"error", "sec", 以及 "count" 或 "correct"/"wrong" 或 "error"}
+    """
+    start = time.perf_counter()
+    result = {"id": job.get("id"), "type": job.get("type")}
+    try:
+        kind = result["type"] = _job_type(job)
+        exercise_path = job.get("exercises", "Exercises.txt")
+        answer_path = job.get("answers", "Answers.txt")
+        if kind == "generate":
+            r = int(job["r"]) if "r" in job else None
+            n = int(job.get("n", 10))
+            seed = _optional_int(job.get("seed"))
+            engine = job.get("engine", "python")
+            _make_parent(exercise_path)
+            _make_parent(answer_path)
+            if str(job.get("stream", "")).lower() in TRUE_VALUES:
+                result["count"] = ag.stream_exercises(n, r, exercise_path, answer_path, seed=seed, engine=engine)
+            else:
+                exercises, answers, values = ag.build_exercise_set(n, r, seed=seed, engine=engine,
+                                                                   pool=job.get("pool"))
+                ag.save_exercise_set(exercises, answers, values, exercise_path, answer_path)
+                result["count"] = len(exercises)
+        else:
+            grade_path = job.get("grade", "Grade.txt")
+            _make_parent(grade_path)
+            result["correct"], result["wrong"] = ag.grade(exercise_path, answer_path, grade_path)
+        result["status"] = "ok"
+    except (ValueError, OSError) as e:
+        result["status"] = "error"
+        result["error"] = str(e)
+    except Exception as e:
+        # 字段类型错误（如 {"r": null}）等，附上异常类型便于定位
+        result["status"] = "error"
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["sec"] = round(time.perf_counter() - start, 6)
+    return result
+
+
+def run_jobs(jobs: List[Dict], workers: int = 1) -> Iterator[Dict]:
+    """按清单顺序逐个产出作业结果；workers 大于 1 时由常驻进程池并行执行"""
+    if workers <= 1 or len(jobs) <= 1:
+        for job in jobs:
+            yield run_job(job)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    # 小作业很多，成批分发以减少进程间往返
+    chunksize = max(1, min(64, len(jobs) // (workers * 8)))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(run_job, jobs, chunksize=chunksize)
+
+
+def run_manifest(path: str, workers: int = 1, out=None) -> Dict[str, int]:
+    """
+    执行清单中的全部作业，每个作业一行 JSON 写入 out（默认标准输出）
+
+    Returns:
+        dict: {"ok": 成功数, "error": 失败数}
+    """
+    out = out or sys.stdout
+    summary = {"ok": 0, "error": 0}
+    for result in run_jobs(load_manifest(path), workers):
+        summary[result["status"]] += 1
+        out.write(json.dumps(result, ensure_ascii=False) + "\n")
+        out.flush()
+    return summary
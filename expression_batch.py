@@ -0,0 +1,203 @@
+"""
+紧凑的题目批存储
+把大量题目保存为整数码的后缀式编码（array 缓冲区），而不是逐题的字符串或表达式树；
+题目文本、精确值与 64 位标准化键都在访问时才由编码计算。
+"""
+
+from array import array
+
+from expression_utils import ExpressionUtils
+from fraction_utils import FractionUtils, Rational
+
+
+class ExpressionBatch:
+    """
+    一组 (r) 参数下的题目批
+
+    编码：小于 LEAF_BASE 的码为运算符（低 2 位为 OPERATORS 下标，第 3 位为左侧括号标记），
+    其余为 LEAF_BASE + 分子 × base + 分母（操作数已约分，base = max(r, 3) 大于任何分母），
+    编码与解码都是算术运算，不需要数值表。
+    第 i 题的编码为 codes[offsets[i]:offsets[i + 1]]；码的宽度按 r 取 2、4 或 8 字节（见 typecode）。
+
+    实测 r=30 时（2 字节码）每题平均约 14 字节（含 4 字节偏移），r=50 时（4 字节码）约 23 字节，500 万道题约 117MB；
+    同样的题目保存为 str 列表每题约 94 字节（str 对象加列表指针），约 470MB。
+    """
+
+    LEAF_BASE = 8
+    # 叶子文本缓存的条目上限（r 很大时不同的数可达数十万个，缓存不能随之增长）
+    TEXT_CACHE_SIZE = 4096
+
+    def __init__(self, max_value):
+        self.max_value = max_value
+        self.base = ExpressionBatch.code_base(max_value)
+        self.codes = array(ExpressionBatch.typecode(max_value))
+        self.offsets = array('I', [0])
+        self._texts = {}
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.render(i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.render(i)
+
+    def nbytes(self):
+        """编码与偏移缓冲区占用的字节数"""
+        return self.codes.itemsize * len(self.codes) + self.offsets.itemsize * len(self.offsets)
+
+    # ==== 编码 ====
+
+    @staticmethod
+    def code_base(max_value):
+        """叶子编码中分母的进位基数：数值表中的分母不超过 max(r-1, 2)"""
+        return max(max_value, 3)
+
+    @staticmethod
+    def max_code(max_value):
+        """r 下可能出现的最大码：数值表中分子最大为 r-1（整数）或 (r-2)·r（带分数）"""
+        base = ExpressionBatch.code_base(max_value)
+        return ExpressionBatch.LEAF_BASE + max(max_value - 1, (max_value - 2) * max_value, 1) * base + base - 1
+
+    @staticmethod
+    def typecode(max_value):
+        """能容纳 r 下全部码的最窄 array 类型码"""
+        max_code = ExpressionBatch.max_code(max_value)
+        if max_code <= 0xFFFF:
+            return 'H'
+        return 'I' if max_code <= 0xFFFFFFFF else 'Q'
+
+    @staticmethod
+    def encode_tree(tree, base):
+        """
+        将表达式树编码为后缀式码列表
+
+        Args:
+            tree: ExpressionUtils 的表达式树
+            base: 叶子编码的进位基数（见 code_base）
+        """
+        codes = []
+        stack = [(tree, False)]
+        # 迭代后序遍历：节点第二次出栈时输出
+        while stack:
+            node, expanded = stack.pop()
+            if node.__class__ is ExpressionUtils.Branch:
+                if expanded:
+                    codes.append(ExpressionUtils.OPERATORS.index(node.op) | (4 if node.paren else 0))
+                else:
+                    stack.append((node, True))
+                    stack.append((node.right, False))
+                    stack.append((node.left, False))
+            else:
+                value = node.value
+                codes.append(ExpressionBatch.LEAF_BASE + value.numerator * base + value.denominator)
+        return codes
+
+    @staticmethod
+    def leaf_value(code, base):
+        """叶子码对应的数"""
+        numerator, denominator = divmod(code - ExpressionBatch.LEAF_BASE, base)
+        return Rational(numerator, denominator)
+
+    @staticmethod
+    def render_codes(codes, base, texts=None):
+        """
+        将后缀式码渲染为题目文本（括号规则与 ExpressionUtils.render 相同）
+
+        texts 为 叶子码 -> 文本 的字典，渲染时按需填充，供多次渲染复用；超过 TEXT_CACHE_SIZE 条时清空重建
+        """
+        operators = ExpressionUtils.OPERATORS
+        if texts is None:
+            texts = {}
+        stack = []
+        for code in codes:
+            if code >= ExpressionBatch.LEAF_BASE:
+                text = texts.get(code)
+                if text is None:
+                    if len(texts) >= ExpressionBatch.TEXT_CACHE_SIZE:
+                        texts.clear()
+                    text = texts[code] = FractionUtils.fraction_to_string(ExpressionBatch.leaf_value(code, base))
+                stack.append((text, 0))
+                continue
+            op = operators[code & 3]
+            prec = 2 if code & 2 else 1
+            right, right_prec = stack.pop()
+            left, left_prec = stack.pop()
+            if left_prec and (code & 4 or left_prec < prec):
+                left = f"({left})"
+            if right_prec and right_prec <= prec:
+                right = f"({right})"
+            stack.append((f"{left} {op} {right}", prec))
+        return stack[-1][0]
+
+    @staticmethod
+    def evaluate_codes(codes, base):
+        """对后缀式码求精确值"""
+        apply_operator = FractionUtils.apply_operator
+        leaf_value = ExpressionBatch.leaf_value
+        operators = ExpressionUtils.OPERATORS
+        stack = []
+        for code in codes:
+            if code >= ExpressionBatch.LEAF_BASE:
+                stack.append(leaf_value(code, base))
+            else:
+                right = stack.pop()
+                stack[-1] = apply_operator(operators[code & 3], stack[-1], right)
+        return stack[-1]
+
+    @staticmethod
+    def hash_codes(codes, base):
+        """由后缀式码计算 64 位标准化键（与树上的 key64 一致）"""
+        number_hash = FractionUtils.number_hash
+        combine_hash = FractionUtils.combine_hash
+        leaf_value = ExpressionBatch.leaf_value
+        operators = ExpressionUtils.OPERATORS
+        stack = []
+        for code in codes:
+            if code >= ExpressionBatch.LEAF_BASE:
+                stack.append(number_hash(leaf_value(code, base)))
+            else:
+                right = stack.pop()
+                stack[-1] = combine_hash(operators[code & 3], stack[-1], right)
+        return stack[-1]
+
+    # ==== 追加与访问 ====
+
+    def append(self, tree):
+        """追加一棵表达式树（操作数须在 r 的范围内）"""
+        self.codes.extend(ExpressionBatch.encode_tree(tree, self.base))
+        self.offsets.append(len(self.codes))
+
+    def append_encoded(self, codes):
+        """追加一道已编码的题目（码须使用同一 base，例如来自同参数的 PoolFile）"""
+        self.codes.extend(codes)
+        self.offsets.append(len(self.codes))
+
+    def extend(self, trees):
+        for tree in trees:
+            self.append(tree)
+
+    def encoded(self, i):
+        """第 i 题的后缀式码"""
+        return self.codes[self.offsets[i]:self.offsets[i + 1]]
+
+    def render(self, i):
+        """第 i 题的题目文本"""
+        return ExpressionBatch.render_codes(self.encoded(i), self.base, self._texts)
+
+    def value(self, i):
+        """第 i 题的精确值"""
+        return ExpressionBatch.evaluate_codes(self.encoded(i), self.base)
+
+    def key64(self, i):
+        """第 i 题的 64 位标准化键"""
+        return ExpressionBatch.hash_codes(self.encoded(i), self.base)
+
+    @staticmethod
+    def generate(count, max_value, max_operators=3, seed=None):
+        """生成至多 count 道互不重复的题目，直接编码进一个批（不保留表达式树与文本）"""
+        batch = ExpressionBatch(max_value)
+        batch.extend(ExpressionUtils.iter_unique_trees(count, max_value, max_operators, seed=seed))
+        return batch
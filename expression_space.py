@@ -0,0 +1,184 @@
+"""
+题目空间
+对小数值范围精确统计去重意义下不同题目的数量，并支持将序号逆排序（unrank）为题目，
+从而以无放回抽样的方式直接得到不重复的题目
+"""
+
+import random
+from bisect import bisect_right
+from itertools import accumulate
+
+from fraction_utils import FractionUtils
+
+
+class ExpressionSpace:
+    """
+    给定 r 与 max_operators 时生成器所能产生的全部题目（按去重规则取等价类）
+
+    生成器产生的题目均为左深链：n0 op1 n1 op2 n2 … opk nk（1 <= k <= max_operators），
+    数字取自 FractionUtils.number_table(r)，'-' 要求当前值不小于减数，'÷' 要求商为真分数。
+    按 normalize_expression 的规则，两条链等价当且仅当仅在最底层的 '+'/'×' 交换了左右两个数，
+    因此底层 '+'/'×' 按无序数对计数，其余按有序选择计数。
+    """
+
+    # 数值表不超过该大小（即 r <= 3）时视为小范围，启用精确计数与无放回抽样。
+    # r = 4、5 时题目空间已有约 50 万、700 万道题，拒绝重复的生成足以取满常见题量，
+    # 且逐题 unrank 比拒绝重复更慢（r=5 时 2 万道题约 2.05s 对 1.2s）
+    MAX_TABLE_SIZE = 5
+    # permute 的 Feistel 轮数
+    FEISTEL_ROUNDS = 4
+
+    def __init__(self, max_value, max_operators=3):
+        self.table = FractionUtils.number_table(max_value)
+        self.max_operators = max_operators
+        self._completions = {}
+        self._step_prefix = {}
+
+        # 底层（第一个运算）的全部等价类：(运算符, 左数, 右数, 值)
+        table = self.table
+        bottoms = []
+        for i, a in enumerate(table):
+            for b in table[i:]:
+                bottoms.append(('+', a, b, a + b))
+        for i, a in enumerate(table):
+            for b in table[:i + 1]:
+                bottoms.append(('-', a, b, a - b))
+        for i, a in enumerate(table):
+            for b in table[i:]:
+                bottoms.append(('×', a, b, a * b))
+        for i, a in enumerate(table):
+            if a > 0:
+                for b in table[i + 1:]:
+                    bottoms.append(('÷', a, b, a / b))
+        self._bottoms = bottoms
+
+        # 每种运算符个数 k 下，底层等价类权重的前缀和
+        self._bottom_prefix = []
+        self.sizes = []
+        for k in range(1, max_operators + 1):
+            prefix = list(accumulate(self.completions(value, k - 1) for _, _, _, value in bottoms))
+            self._bottom_prefix.append(prefix)
+            self.sizes.append(prefix[-1] if prefix else 0)
+        self.capacity = sum(self.sizes)
+
+    @staticmethod
+    def is_small(max_value):
+        """数值范围是否足够小，可以精确计数（只计数，不构造数值表）"""
+        # 数值表至少含 r 个整数，r 较大时无需计数
+        return (max_value <= ExpressionSpace.MAX_TABLE_SIZE
+                and FractionUtils.number_count(max_value) <= ExpressionSpace.MAX_TABLE_SIZE)
+
+    def _steps(self, value):
+        """当前值为 value 时，下一步全部合法的 (运算符, 操作数)，顺序固定"""
+        table = self.table
+        le = bisect_right(table, value)
+        steps = [('+', n) for n in table]
+        steps += [('-', n) for n in table[:le]]
+        steps += [('×', n) for n in table]
+        if value > 0:
+            steps += [('÷', n) for n in table[le:]]
+        return steps
+
+    @staticmethod
+    def _apply(op, value, n):
+        if op == '+':
+            return value + n
+        if op == '-':
+            return value - n
+        if op == '×':
+            return value * n
+        return value / n
+
+    def completions(self, value, m):
+        """从当前值 value 出发再追加恰好 m 个运算的不同方式数"""
+        if m == 0:
+            return 1
+        size = len(self.table)
+        le = bisect_right(self.table, value)
+        if m == 1:
+            return 2 * size + le + (size - le if value > 0 else 0)
+        key = (value, m)
+        count = self._completions.get(key)
+        if count is None:
+            count = sum(self.completions(self._apply(op, value, n), m - 1) for op, n in self._steps(value))
+            self._completions[key] = count
+        return count
+
+    def unrank(self, index):
+        """
+        将 [0, capacity) 内的序号映射为一条题目链
+
+        Returns:
+            (first, steps): 首个操作数与 [(运算符, 操作数), ...]
+        """
+        if not 0 <= index < self.capacity:
+            raise IndexError(f"序号超出范围：{index}")
+        k = 1
+        for size in self.sizes:
+            if index < size:
+                break
+            index -= size
+            k += 1
+
+        prefix = self._bottom_prefix[k - 1]
+        pos = bisect_right(prefix, index)
+        op, a, b, value = self._bottoms[pos]
+        index -= prefix[pos - 1] if pos else 0
+        steps = [(op, b)]
+
+        for m in range(k - 1, 0, -1):
+            options, prefix = self._weighted_steps(value, m)
+            pos = bisect_right(prefix, index)
+            index -= prefix[pos - 1] if pos else 0
+            op, n, value = options[pos]
+            steps.append((op, n))
+        return a, steps
+
+    def _weighted_steps(self, value, m):
+        """当前值为 value、还需 m 个运算时的全部 (运算符, 操作数, 新值) 及其权重前缀和（按参数缓存）"""
+        key = (value, m)
+        cached = self._step_prefix.get(key)
+        if cached is None:
+            options = [(op, n, self._apply(op, value, n)) for op, n in self._steps(value)]
+            prefix = list(accumulate(self.completions(child, m - 1) for _, _, child in options))
+            cached = self._step_prefix[key] = (options, prefix)
+        return cached
+
+    @staticmethod
+    def permutation_keys(seed):
+        """由 seed 派生 permute 使用的各轮密钥"""
+        rng = random.Random(f"{seed}:permutation")
+        return tuple(rng.getrandbits(64) for _ in range(ExpressionSpace.FEISTEL_ROUNDS))
+
+    def permute(self, keys, index):
+        """
+        [0, capacity) 上由轮密钥 keys 决定的伪随机双射
+
+        在不小于 capacity 的最小 4 的幂上做平衡 Feistel 网络，结果超出 capacity 时继续迭代（cycle walking），
+        期望迭代不超过 4 次，因此任一位置的像都能以 O(1) 代价单独求出。
+        """
+        if not 0 <= index < self.capacity:
+            raise IndexError(f"序号超出范围：{index}")
+        half = ((self.capacity - 1).bit_length() + 1) // 2
+        mask = (1 << half) - 1
+        mix64 = FractionUtils.mix64
+        value = index
+        while True:
+            left, right = value >> half, value & mask
+            for key in keys:
+                left, right = right, left ^ (mix64(key ^ right) & mask)
+            value = (left << half) | right
+            if value < self.capacity:
+                return value
+
+    def sample(self, seed, start, stop):
+        """
+        无放回抽样中第 start 到 stop - 1 条互不等价的题目链，stop 超过容量时抛出 ValueError
+
+        第 i 条为 unrank(permute(keys, i))，只由 (seed, i) 决定，与抽样总数无关。
+        """
+        if stop > self.capacity:
+            raise ValueError(f"该数值范围内最多只能生成 {self.capacity} 道不重复的题目")
+        keys = ExpressionSpace.permutation_keys(seed)
+        for index in range(start, stop):
+            yield self.unrank(self.permute(keys, index))
@@ -4,132 +4,205 @@
 """
 
 import random
-import hashlib
-from dataclasses import dataclass
-from typing import List, Union
-from fractions import Fraction
-from fraction_utils import FractionUtils
+from functools import lru_cache
+from itertools import islice
+from fraction_utils import FractionUtils, Rational
+from expression_space import ExpressionSpace
+from key_index import KeyIndex
+from metrics import Metrics
 
 
 class ExpressionUtils:
     """表达式工具类，处理表达式生成和去重"""
 
     OPERATORS = ['+', '-', '×', '÷']
+    # 复杂表达式中 '+'、'×' 左侧子式额外加括号的概率（'-'、'÷' 总是加括号）
+    PAREN_PROBABILITY = 0.3
+
+    # ==== 生成用表达式树：构造时即携带精确值与标准化键，仅在输出时渲染 ====
+
+    class Tree:
+        """表达式树节点基类：value 为精确值，key64 为 64 位标准化键（节点只用 __slots__ 保存字段）"""
+
+        __slots__ = ('value', 'key64')
+
+        def __init__(self, value, key64):
+            self.value = value
+            self.key64 = key64
+
+    class Leaf(Tree):
+        __slots__ = ('key',)
+
+        def __init__(self, value, key64, key):
+            self.value = value
+            self.key64 = key64
+            self.key = key
+
+        def __repr__(self):
+            return f"Leaf({self.key})"
+
+    class Branch(Tree):
+        __slots__ = ('op', 'left', 'right', 'paren')
+
+        def __init__(self, value, key64, op, left, right, paren=False):
+            self.value = value
+            self.key64 = key64
+            self.op = op
+            self.left = left
+            self.right = right
+            self.paren = paren
+
+        @property
+        def key(self):
+            """标准化字符串键（按需构造，与 normalize_expression 的输出一致）"""
+            return FractionUtils.combine_key(self.op, self.left.key, self.right.key)
+
+        def __repr__(self):
+            return f"Branch({self.op!r}, {self.left!r}, {self.right!r})"
 
     @staticmethod
-    def generate_simple_expression(max_value):
+    def make_leaf(value):
+        """构造数字叶子节点，字符串键即规范化的数字字符串"""
+        return ExpressionUtils.Leaf(value, FractionUtils.number_hash(value), FractionUtils.fraction_to_string(value))
+
+    @staticmethod
+    def make_branch(op, left, right, paren=False, cache=None):
         """
-        生成简单表达式（两个操作数），满足：
-        - 减法不产生负数
-        - 除法结果为真分数（0<结果<1）
+        构造运算节点，自底向上计算精确值与 64 位标准化哈希 key64。
+
+        key64 由左右子树的 key64 组合而成（FractionUtils.combine_hash），每个节点 O(1)、不构造中间字符串，
+        与 get_expression_key 对同一棵树文本的结果一致，因此生成路径与解析路径的去重结果相同。
+        paren 仅表示左操作数是否额外加括号（不影响语义与键）。
+        cache 为子表达式值缓存，默认不使用：随机生成的子树很少重复（r=10 时命中率约 42%，r=50 时不足 5%），
+        查询与写入缓存的开销超过直接计算；求值与判题路径仍使用 FractionUtils.value_cache。
         """
-        num1 = FractionUtils.generate_number(max_value)
-        num2 = FractionUtils.generate_number(max_value)
+        key64 = FractionUtils.combine_hash(op, left.key64, right.key64)
+        if cache is None:
+            value = FractionUtils.apply_operator(op, left.value, right.value)
+        else:
+            value = cache.get(key64, op, left.value, right.value)
+            if value is None:
+                value = FractionUtils.apply_operator(op, left.value, right.value)
+                cache.put(key64, op, left.value, right.value, value)
+        return ExpressionUtils.Branch(value, key64, op, left, right, paren)
+
+    @staticmethod
+    def render(tree):
+        """将表达式树渲染为题目文本，按优先级补齐必要的括号，保证文本语义与树一致"""
+        if isinstance(tree, ExpressionUtils.Branch):
+            prec = ExpressionUtils._precedence(tree.op)
+            left = ExpressionUtils.render(tree.left)
+            right = ExpressionUtils.render(tree.right)
+            if isinstance(tree.left, ExpressionUtils.Branch) and (
+                    tree.paren or ExpressionUtils._precedence(tree.left.op) < prec):
+                left = f"({left})"
+            if isinstance(tree.right, ExpressionUtils.Branch) and ExpressionUtils._precedence(tree.right.op) <= prec:
+                right = f"({right})"
+            return f"{left} {tree.op} {right}"
+        return tree.key
 
-        operator = random.choice(ExpressionUtils.OPERATORS)
+    @staticmethod
+    def _pick_operand(operator, current_value, max_value, rng=random):
+        """
+        为 current_value 选取运算符右侧的操作数，返回 (运算符, 操作数)。
 
+        '-' 与 '÷' 按 generate_number 的分布、以约束为条件直接抽取操作数（见 FractionUtils.pick_not_greater / pick_greater），
+        期望只需常数次抽取；'÷' 无合法除数（被除数为 0 或已是范围内最大的数）时，
+        在其余三种运算符中重新等概率选择。
+        """
+        if operator == '÷':
+            next_value = FractionUtils.pick_greater(current_value, max_value, rng) if current_value > 0 else None
+            if next_value is not None:
+                return operator, next_value
+            Metrics.incr('generate.division_fallback')
+            operator = rng.choice(ExpressionUtils.OPERATORS[:3])
         if operator == '-':
-            # 确保不产生负数
-            if not FractionUtils.is_valid_subtraction(num1, num2):
-                num1, num2 = num2, num1
-            if not FractionUtils.is_valid_subtraction(num1, num2):
-                operator = '+'
-        elif operator == '÷':
-            # 保证除法得到真分数
-            if not FractionUtils.is_valid_division(num1, num2):
-                if FractionUtils.is_valid_division(num2, num1):
-                    num1, num2 = num2, num1
-                else:
-                    operator = '×'
-
-        num1_str = FractionUtils.fraction_to_string(num1)
-        num2_str = FractionUtils.fraction_to_string(num2)
-        expression = f"{num1_str} {operator} {num2_str}"
-
-        return expression, True
+            # 0 总是合法减数，非负的被减数总能找到合法减数
+            return operator, FractionUtils.pick_not_greater(current_value, max_value, rng)
+        return operator, FractionUtils.generate_number(max_value, rng=rng)
 
     @staticmethod
-    def generate_complex_expression(max_value, max_operators=3):
+    def generate_simple_tree(max_value, rng=random, cache=None):
+        """
+        生成简单表达式树（两个操作数），满足：
+        - 减法不产生负数
+        - 除法结果为真分数（0<结果<1）
+        """
+        num1 = FractionUtils.generate_number(max_value, rng=rng)
+        operator = rng.choice(ExpressionUtils.OPERATORS)
+        operator, num2 = ExpressionUtils._pick_operand(operator, num1, max_value, rng)
+
+        return ExpressionUtils.make_branch(
+            operator, ExpressionUtils.make_leaf(num1), ExpressionUtils.make_leaf(num2), cache=cache)
+
+    @staticmethod
+    def generate_complex_tree(max_value, max_operators=3, rng=random, paren_probability=None, cache=None):
         """
-        生成复杂表达式（多个操作数），逐步构造并在 '-' 与 '÷' 时强制括号，保证子表达式合法。
+        生成复杂表达式树（多个操作数），逐步构造并在 '-' 与 '÷' 时强制括号。
+
+        每一步的约束都直接对树上已知的精确值检查，无需再解析文本。
+        paren_probability 为 '+'、'×' 左侧子式加括号的概率，默认 PAREN_PROBABILITY。
         """
-        num_operators = random.randint(2, max_operators)
+        if paren_probability is None:
+            paren_probability = ExpressionUtils.PAREN_PROBABILITY
+        num_operators = rng.randint(2, max_operators)
 
         # 初始操作数
-        current_value = FractionUtils.generate_number(max_value)
-        expression = FractionUtils.fraction_to_string(current_value)
+        tree = ExpressionUtils.make_leaf(FractionUtils.generate_number(max_value, rng=rng))
 
         for _ in range(num_operators):
-            operator = random.choice(ExpressionUtils.OPERATORS)
-
+            operator = rng.choice(ExpressionUtils.OPERATORS)
             # 生成满足约束的下一个操作数
-            attempts = 0
-            while True:
-                attempts += 1
-                next_value = FractionUtils.generate_number(max_value)
-                if operator == '-':
-                    if FractionUtils.is_valid_subtraction(current_value, next_value):
-                        break
-                elif operator == '÷':
-                    # 保证 (current_value) ÷ next_value 是真分数
-                    if next_value != 0 and current_value > 0 and FractionUtils.is_valid_division(current_value, next_value):
-                        break
-                else:
-                    break
-                if attempts > 50:
-                    operator = '+'
-                    break
-
-            next_str = FractionUtils.fraction_to_string(next_value)
-
-            if operator in ['-', '÷']:
-                expression = f"({expression}) {operator} {next_str}"
-            else:
-                if random.random() < 0.3:
-                    expression = f"({expression}) {operator} {next_str}"
-                else:
-                    expression = f"{expression} {operator} {next_str}"
-
-            # 更新当前值
-            if operator == '+':
-                current_value = current_value + next_value
-            elif operator == '-':
-                current_value = current_value - next_value
-            elif operator == '×':
-                current_value = current_value * next_value
-            elif operator == '÷':
-                current_value = current_value / next_value
-
-        # 验证整体非负
-        try:
-            result = FractionUtils.calculate_expression(expression)
-            if result < 0:
-                return expression, False
-        except Exception:
-            return expression, False
+            operator, next_value = ExpressionUtils._pick_operand(operator, tree.value, max_value, rng)
 
-        return expression, True
+            paren = operator in ['-', '÷'] or rng.random() < paren_probability
+            tree = ExpressionUtils.make_branch(operator, tree, ExpressionUtils.make_leaf(next_value), paren, cache)
+
+        return tree
 
     @staticmethod
-    def generate_expression(max_value, max_operators=3):
-        """生成满足约束的表达式"""
+    def generate_expression_tree(max_value, max_operators=3, rng=random, paren_probability=None, cache=None):
+        """
+        生成满足约束的表达式树
+
+        只使用传入的 rng 与 cache（默认不使用缓存，见 make_branch），各线程传入各自的 random.Random 时互不影响（见 Generator）。
+        """
         max_attempts = 50
 
         for _ in range(max_attempts):
-            if random.random() < 0.4:
-                expression, valid = ExpressionUtils.generate_simple_expression(max_value)
+            Metrics.incr('generate.attempts')
+            # 复杂表达式至少含 2 个运算符，max_operators 为 1 时只能生成简单表达式
+            if max_operators < 2 or rng.random() < 0.4:
+                tree = ExpressionUtils.generate_simple_tree(max_value, rng, cache)
             else:
-                expression, valid = ExpressionUtils.generate_complex_expression(max_value, max_operators)
+                tree = ExpressionUtils.generate_complex_tree(max_value, max_operators, rng, paren_probability, cache)
 
-            if valid and ExpressionUtils.is_expression_valid(expression):
-                return expression
+            if tree.value >= 0:
+                return tree
+            Metrics.incr('generate.rejected_negative')
 
         # 兜底：简单加法
-        num1 = FractionUtils.generate_number(max_value)
-        num2 = FractionUtils.generate_number(max_value)
-        num1_str = FractionUtils.fraction_to_string(num1)
-        num2_str = FractionUtils.fraction_to_string(num2)
-        return f"{num1_str} + {num2_str}"
+        Metrics.incr('generate.fallback_add')
+        num1 = FractionUtils.generate_number(max_value, rng=rng)
+        num2 = FractionUtils.generate_number(max_value, rng=rng)
+        return ExpressionUtils.make_branch(
+            '+', ExpressionUtils.make_leaf(num1), ExpressionUtils.make_leaf(num2), cache=cache)
+
+    @staticmethod
+    def generate_simple_expression(max_value):
+        """生成简单表达式（两个操作数），返回 (表达式, 是否有效)"""
+        return ExpressionUtils.render(ExpressionUtils.generate_simple_tree(max_value)), True
+
+    @staticmethod
+    def generate_complex_expression(max_value, max_operators=3):
+        """生成复杂表达式（多个操作数），返回 (表达式, 是否有效)"""
+        tree = ExpressionUtils.generate_complex_tree(max_value, max_operators)
+        return ExpressionUtils.render(tree), tree.value >= 0
+
+    @staticmethod
+    def generate_expression(max_value, max_operators=3):
+        """生成满足约束的表达式"""
+        return ExpressionUtils.render(ExpressionUtils.generate_expression_tree(max_value, max_operators))
 
     @staticmethod
     def is_expression_valid(expression):
@@ -140,134 +213,325 @@ class ExpressionUtils:
         except Exception:
             return False
 
-    # ==== 解析与标准化（AST）用于去重 ====
-
-    @dataclass
-    class Node:
-        pass
-
-    @dataclass
-    class Num(Node):
-        token: str
-
-    @dataclass
-    class BinOp(Node):
-        op: str
-        left: 'ExpressionUtils.Node'
-        right: 'ExpressionUtils.Node'
-
-    @staticmethod
-    def _tokenize(expr: str) -> List[str]:
-        tokens = []
-        cur = ''
-        for ch in expr:
-            if ch in '+-×÷()':
-                if cur.strip():
-                    tokens.append(cur.strip())
-                    cur = ''
-                tokens.append(ch)
-            elif ch == ' ':
-                if cur.strip():
-                    tokens.append(cur.strip())
-                    cur = ''
-            else:
-                cur += ch
-        if cur.strip():
-            tokens.append(cur.strip())
-        return tokens
+    # ==== 解析与标准化用于去重 ====
 
     @staticmethod
     def _precedence(op: str) -> int:
         return 2 if op in ['×', '÷'] else 1
 
     @staticmethod
-    def _to_ast(tokens: List[str]) -> 'ExpressionUtils.Node':
-        # Shunting-yard 转 AST
-        output: List[ExpressionUtils.Node] = []
-        ops: List[str] = []
-
-        def apply_op():
-            op = ops.pop()
-            right = output.pop()
-            left = output.pop()
-            output.append(ExpressionUtils.BinOp(op, left, right))
-
-        i = 0
-        while i < len(tokens):
-            t = tokens[i]
-            if t in '+-×÷':
-                while ops and ops[-1] in '+-×÷' and ExpressionUtils._precedence(ops[-1]) >= ExpressionUtils._precedence(t):
-                    apply_op()
-                ops.append(t)
-            elif t == '(':
-                ops.append(t)
-            elif t == ')':
-                while ops and ops[-1] != '(':
-                    apply_op()
-                if ops and ops[-1] == '(':
-                    ops.pop()
+    def normalize_expression(expression):
+        """
+        标准化表达式，+、× 的左右操作数按字典序排列，用于去重
+
+        复用 FractionUtils.compile_expression 的后缀式（与求值共享同一解析与缓存），
+        按后缀式自底向上组合键，结果与 make_branch 在树上构造的键一致。
+
+        Raises:
+            ValueError: 表达式语法错误
+        """
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        fraction_to_string = FractionUtils.fraction_to_string
+        combine_key = FractionUtils.combine_key
+        for item in FractionUtils.compile_expression(expression):
+            if item.__class__ is str:
+                right = pop()
+                push(combine_key(item, pop(), right))
             else:
-                # 规范化数字表示
-                try:
-                    frac = FractionUtils.string_to_fraction(t)
-                    norm = FractionUtils.fraction_to_string(frac)
-                except Exception:
-                    norm = t
-                output.append(ExpressionUtils.Num(norm))
-            i += 1
-
-        while ops:
-            apply_op()
-
-        return output[-1] if output else ExpressionUtils.Num('0')
-
-    @staticmethod
-    def _node_to_str(node: 'ExpressionUtils.Node') -> str:
-        if isinstance(node, ExpressionUtils.Num):
-            return node.token
-        if isinstance(node, ExpressionUtils.BinOp):
-            left_str = ExpressionUtils._node_to_str(node.left)
-            right_str = ExpressionUtils._node_to_str(node.right)
-            if node.op in ['+', '×']:
-                # 仅在当前层交换左右，保持结构，不进行跨层扁平化，符合“有限次交换 + 与 × 左右表达式”的规则
-                if left_str > right_str:
-                    left_str, right_str = right_str, left_str
-            # 始终保留括号来表示结构
-            return f"({left_str}) {node.op} ({right_str})"
-        return ''
+                push(fraction_to_string(item))
+        return stack[-1]
 
     @staticmethod
-    def normalize_expression(expression):
-        """通过 AST 标准化表达式，+、× 的操作数排序，用于去重"""
-        tokens = ExpressionUtils._tokenize(expression)
-        ast = ExpressionUtils._to_ast(tokens)
-        return ExpressionUtils._node_to_str(ast)
+    def get_expression_hash(expression):
+        """get_expression_key 的十六进制字符串形式（保留用于兼容，等价关系相同）"""
+        return format(ExpressionUtils.get_expression_key(expression), '016x')
 
     @staticmethod
-    def get_expression_hash(expression):
-        normalized = ExpressionUtils.normalize_expression(expression)
-        return hashlib.md5(normalized.encode()).hexdigest()
+    def get_expression_key(expression):
+        """
+        表达式的 64 位标准化键，供 KeyIndex 去重
+
+        在后缀式上自底向上组合 number_hash / combine_hash，不构造标准化字符串，
+        结果与生成树上的 key64 一致。
+
+        Raises:
+            ValueError: 表达式语法错误
+        """
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        number_hash = FractionUtils.number_hash
+        combine_hash = FractionUtils.combine_hash
+        for item in FractionUtils.compile_expression(expression):
+            if item.__class__ is str:
+                right = pop()
+                push(combine_hash(item, pop(), right))
+            else:
+                push(number_hash(item))
+        return stack[-1]
+
+    # ==== 计数器式（可寻址）生成：候选题目 i 只由 (seed, i) 决定 ====
 
     @staticmethod
-    def generate_unique_expressions(count, max_value, max_operators=3):
-        expressions = []
-        expression_hashes = set()
+    def problem_rng(seed, index):
+        """由 (seed, index) 派生独立的随机数源，与其它候选题目的生成过程无关"""
+        return random.Random(f"{seed}:{index}")
+
+    @staticmethod
+    def expression_tree_at(seed, index, max_value, max_operators=3):
+        """
+        以 O(1) 代价重新生成种子 seed 下序号为 index（从 0 开始）的候选题目，无需重放之前的题目
+
+        注意 index 是候选序号而不是试卷题号：较大数值范围下重复的候选会被跳过，
+        试卷第 i 题一般对应更靠后的候选，按题号重建请用 worksheet_trees。
+        """
+        rng = ExpressionUtils.problem_rng(seed, index)
+        return ExpressionUtils.generate_expression_tree(max_value, max_operators, rng)
+
+    @staticmethod
+    def iter_trees_at(seed, start, stop, max_value, max_operators=3):
+        """按序号产出 [start, stop) 区间内的候选题目，任意区间可独立重建、校验或并行生成"""
+        for index in range(start, stop):
+            yield ExpressionUtils.expression_tree_at(seed, index, max_value, max_operators)
+
+    @staticmethod
+    def worksheet_trees(seed, start, stop, max_value, max_operators=3):
+        """
+        重建种子 seed 下试卷第 start 到 stop - 1 题（从 0 开始，即题号 start + 1 到 stop），
+        与 iter_unique_trees(n, ..., seed=seed) 的对应题目相同（n >= stop）
+
+        小数值范围下试卷题目直接由题目空间的伪随机置换给出，每题 O(1)，与之前的题目无关；
+        较大数值范围下重复的候选被跳过，试卷第 i 题对应哪个候选只能从头重放候选序列得到，代价为 O(stop)。
+        """
+        space = ExpressionUtils.check_capacity(stop, max_value, max_operators)
+        if space is None:
+            trees = ExpressionUtils._iter_unique_trees(stop, max_value, max_operators, seed)
+            return islice(trees, start, None)
+        return ExpressionUtils._sample_space(space, seed, start, stop)
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def expression_space(max_value, max_operators=3):
+        """小数值范围下的题目空间（按参数缓存），范围较大时返回 None"""
+        if not ExpressionSpace.is_small(max_value):
+            return None
+        return ExpressionSpace(max_value, max_operators)
+
+    @staticmethod
+    def check_capacity(count, max_value, max_operators=3):
+        """
+        小数值范围下检查 count 是否超过题目空间容量，返回题目空间（范围较大时返回 None）
+
+        Raises:
+            ValueError: count 超过容量，消息中给出实际最大值
+        """
+        space = ExpressionUtils.expression_space(max_value, max_operators)
+        if space is not None and count > space.capacity:
+            raise ValueError(f"-r {max_value} 时最多只能生成 {space.capacity} 道不重复的题目")
+        return space
+
+    @staticmethod
+    def tree_from_chain(first, steps, rng=random):
+        """将 ExpressionSpace.unrank 得到的题目链构造为表达式树（括号与底层左右顺序随机，不影响去重键）"""
+        tree = ExpressionUtils.make_leaf(first)
+        for i, (operator, value) in enumerate(steps):
+            left, right = tree, ExpressionUtils.make_leaf(value)
+            if i == 0 and operator in ['+', '×'] and rng.random() < 0.5:
+                left, right = right, left
+            paren = operator in ['-', '÷'] or rng.random() < ExpressionUtils.PAREN_PROBABILITY
+            tree = ExpressionUtils.make_branch(operator, left, right, paren)
+        return tree
+
+    @staticmethod
+    def iter_unique_trees(count, max_value, max_operators=3, seed=None, seen=None, start=0):
+        """
+        逐个产出至多 count 棵互不重复的表达式树，直接使用树上的标准化键去重。
+
+        指定 seed 时按序号 start, start + 1, … 依次取候选题目（见 expression_tree_at）并跳过重复，
+        结果只由 seed 决定，不受全局 random 状态影响。
+
+        小数值范围下改为对精确计数的题目空间做无放回抽样（见 ExpressionSpace.sample），不再拒绝重复；
+        count 超过空间容量时立即抛出 ValueError 并给出实际最大值。
+
+        两种情况下，指定 seed 时较小的 count 产出的都是较大 count 产出序列的前缀，
+        因此试卷第 i 题可以用 worksheet_trees 单独重建。
+
+        seen 为已有题目的 KeyIndex 时（追加模式），新题目与其中的题目也互不重复，产出题目的键会加入 seen；
+        此时小数值范围同样按拒绝重复的方式生成，空间所剩无几时可能少于 count 道。
+        """
+        if seen is not None:
+            return ExpressionUtils._iter_unique_trees(count, max_value, max_operators, seed, seen, start)
+        space = ExpressionUtils.check_capacity(count, max_value, max_operators)
+        if space is None:
+            return ExpressionUtils._iter_unique_trees(count, max_value, max_operators, seed, start=start)
+        return ExpressionUtils._sample_space(space, random.randrange(2 ** 32) if seed is None else seed, 0, count)
+
+    @staticmethod
+    def _sample_space(space, seed, start, stop):
+        # 第 i 题的题目链与括号、左右顺序都只由 (seed, i) 决定，与抽样总数无关
+        for index, (first, steps) in enumerate(space.sample(seed, start, stop), start):
+            yield ExpressionUtils.tree_from_chain(first, steps, ExpressionUtils.problem_rng(seed, index))
+
+    @staticmethod
+    def _iter_unique_trees(count, max_value, max_operators, seed, seen=None, start=0):
+        expression_keys = KeyIndex(count) if seen is None else seen
         max_attempts = count * 20
         attempts = 0
+        produced = 0
 
-        while len(expressions) < count and attempts < max_attempts:
+        while produced < count and attempts < max_attempts:
+            if seed is None:
+                tree = ExpressionUtils.generate_expression_tree(max_value, max_operators)
+            else:
+                tree = ExpressionUtils.expression_tree_at(seed, start + attempts, max_value, max_operators)
             attempts += 1
-            expression = ExpressionUtils.generate_expression(max_value, max_operators)
-            expr_hash = ExpressionUtils.get_expression_hash(expression)
-            if expr_hash not in expression_hashes:
-                expressions.append(expression)
-                expression_hashes.add(expr_hash)
-        return expressions
+            Metrics.incr('dedup.candidates')
+            if expression_keys.add(tree.key64):
+                produced += 1
+                yield tree
+            else:
+                Metrics.incr('dedup.duplicates')
+
+    @staticmethod
+    def _generate_shard(shard):
+        """
+        进程池任务：生成一段连续序号的候选题目
+
+        Returns:
+            (题目列表, 本分片的计数器)：题目为扁平的 (key64, 题目文本, 分子, 分母) 元组。
+            不返回表达式树——树的序列化与反序列化比生成本身还慢。
+        """
+        seed, start, stop, max_value, max_operators, profile = shard
+        Metrics.reset()
+        Metrics.enable(profile)
+        render = ExpressionUtils.render
+        problems = [(tree.key64, render(tree), tree.value.numerator, tree.value.denominator)
+                    for tree in ExpressionUtils.iter_trees_at(seed, start, stop, max_value, max_operators)]
+        return problems, Metrics.counters
+
+    @staticmethod
+    def iter_unique_problems(count, max_value, max_operators=3, seed=None):
+        """iter_unique_trees 的 (题目文本, 精确值) 版本，与 iter_unique_problems_parallel 的产出格式相同"""
+        for tree in ExpressionUtils.iter_unique_trees(count, max_value, max_operators, seed):
+            yield ExpressionUtils.render(tree), tree.value
+
+    @staticmethod
+    def iter_unique_problems_parallel(count, max_value, max_operators=3, workers=2, seed=None, batch_size=2000):
+        """
+        多进程分片生成，逐个产出至多 count 道全局不重复的题目 (题目文本, 精确值)。
+
+        每轮把一段连续的候选序号切分为 workers 个分片并行生成（候选题目只由 (seed, 序号) 决定），
+        各分片以扁平元组返回结果，按序号顺序合并，并以与 generate_unique_expressions 相同的标准化键全局去重，
+        重复造成的缺口由下一轮补齐。产出序列与 iter_unique_problems(count, ..., seed=seed) 完全一致，
+        与 workers 无关。
+        """
+        if ExpressionUtils.expression_space(max_value, max_operators) is not None:
+            # 小范围直接无放回抽样，代价很低，无需多进程
+            return ExpressionUtils.iter_unique_problems(count, max_value, max_operators, seed)
+        return ExpressionUtils._iter_unique_problems_parallel(count, max_value, max_operators, workers, seed,
+                                                              batch_size)
+
+    @staticmethod
+    def _iter_unique_problems_parallel(count, max_value, max_operators, workers, seed, batch_size):
+        from concurrent.futures import ProcessPoolExecutor
+
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        seen = KeyIndex(count)
+        max_attempts = count * 20
+        attempts = 0
+        produced = 0
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            while produced < count and attempts < max_attempts:
+                shard_size = min(batch_size, -(-(count - produced) // workers))
+                shards = []
+                for _ in range(workers):
+                    stop = min(attempts + shard_size, max_attempts)
+                    shards.append((seed, attempts, stop, max_value, max_operators, Metrics.enabled))
+                    attempts = stop
+                for problems, counters in executor.map(ExpressionUtils._generate_shard, shards):
+                    Metrics.merge(counters)
+                    for key64, expression, numerator, denominator in problems:
+                        if produced >= count:
+                            break
+                        Metrics.incr('dedup.candidates')
+                        if seen.add(key64):
+                            produced += 1
+                            yield expression, Rational(numerator, denominator)
+                        else:
+                            Metrics.incr('dedup.duplicates')
+
+    @staticmethod
+    def generate_unique_trees(count, max_value, max_operators=3):
+        return list(ExpressionUtils.iter_unique_trees(count, max_value, max_operators))
+
+    @staticmethod
+    def iter_unique_expressions(count, max_value, max_operators=3):
+        """generate_unique_expressions 的生成器版本，逐条产出题目文本"""
+        for tree in ExpressionUtils.iter_unique_trees(count, max_value, max_operators):
+            yield ExpressionUtils.render(tree)
+
+    @staticmethod
+    def generate_unique_expressions(count, max_value, max_operators=3, pool_path=None):
+        """
+        生成 count 道互不重复的题目文本
+
+        指定 pool_path 时改为从该目录的磁盘题目池（见 PoolFile）中无放回抽样，池中题目不足时先增量扩充并持久化。
+        题目很多时用 generate_unique_batch 得到只保存编码的题目批，内存约为文本列表的 1/4 到 1/7。
+        """
+        return list(ExpressionUtils.generate_unique_batch(count, max_value, max_operators, pool_path))
+
+    @staticmethod
+    def generate_unique_batch(count, max_value, max_operators=3, pool_path=None):
+        """
+        generate_unique_expressions 的紧凑版本
+
+        Returns:
+            ExpressionBatch: 只保存后缀式编码的题目批，按下标或迭代取得题目文本（访问时才渲染）
+        """
+        from expression_batch import ExpressionBatch
+
+        if pool_path is not None:
+            with ExpressionUtils._open_pool(count, max_value, max_operators, pool_path) as pool:
+                return pool.sample_batch(count)
+        return ExpressionBatch.generate(count, max_value, max_operators)
+
+    @staticmethod
+    def sample_pool(count, max_value, max_operators=3, pool_path="pool", seed=None):
+        """
+        从磁盘题目池抽取 count 道互不重复的题目，池中题目不足时先扩充
+
+        Returns:
+            list: [(题目文本, 精确值), ...]
+
+        Raises:
+            ValueError: 题目池参数不一致，或扩充后仍不足 count 道
+        """
+        with ExpressionUtils._open_pool(count, max_value, max_operators, pool_path, seed) as pool:
+            rng = random if seed is None else random.Random(seed)
+            return pool.sample(count, rng)
+
+    @staticmethod
+    def _open_pool(count, max_value, max_operators, pool_path, seed=None):
+        """打开（必要时新建）磁盘题目池，池中题目不足 count 道时先扩充"""
+        from pool_file import PoolFile
+
+        pool = PoolFile.open_or_create(pool_path, max_value, max_operators, seed)
+        if len(pool) < count:
+            try:
+                pool.extend(count - len(pool))
+            except BaseException:
+                pool.close()
+                raise
+        return pool
 
     @staticmethod
     def calculate_answer(expression):
         try:
-            result = FractionUtils.calculate_expression(expression)
+            result = FractionUtils.calculate_expression(expression, FractionUtils.value_cache)
             return FractionUtils.fraction_to_string(result)
         except Exception:
             return "计算错误"
@@ -4,13 +4,355 @@
 """
 
 import random
+import re
+import numbers
+import sys
+import time
+from collections import OrderedDict
 from fractions import Fraction
+from functools import lru_cache
+from math import gcd
 import math
 
+from metrics import Metrics
+
+
+class Rational:
+    """
+    轻量有理数：只保存已约分的分子、分母（__slots__），用于生成与求值的热路径
+    
+    - 比较运算通过交叉相乘完成，不做除法；
+    - 与 int、Fraction 可混合运算与比较，哈希值与等值的 Fraction 相同；
+    - 结果的分子或分母超过 LIMIT 时回退为 Fraction，避免大整数下的朴素算法变慢。
+    """
+    
+    __slots__ = ('numerator', 'denominator')
+    
+    # 超过该绝对值的结果改用 Fraction 表示
+    LIMIT = 1 << 62
+    
+    def __init__(self, numerator=0, denominator=1):
+        if denominator == 0:
+            raise ZeroDivisionError(f"Rational({numerator}, 0)")
+        if denominator < 0:
+            numerator, denominator = -numerator, -denominator
+        g = gcd(numerator, denominator)
+        self.numerator = numerator // g
+        self.denominator = denominator // g
+    
+    @staticmethod
+    def _make(numerator, denominator):
+        """由已知分母为正的分子、分母构造（约分），过大时回退为 Fraction"""
+        g = gcd(numerator, denominator)
+        if g != 1:
+            numerator //= g
+            denominator //= g
+        if denominator > Rational.LIMIT or not -Rational.LIMIT <= numerator <= Rational.LIMIT:
+            return Fraction(numerator, denominator)
+        result = object.__new__(Rational)
+        result.numerator = numerator
+        result.denominator = denominator
+        return result
+    
+    @staticmethod
+    def from_fraction(value):
+        """将 Fraction 或 int 转换为 Rational"""
+        return Rational._make(value.numerator, value.denominator)
+    
+    def to_fraction(self):
+        return Fraction(self.numerator, self.denominator)
+    
+    def __reduce__(self):
+        return Rational, (self.numerator, self.denominator)
+    
+    def __repr__(self):
+        return f"Rational({self.numerator}, {self.denominator})"
+    
+    def __str__(self):
+        if self.denominator == 1:
+            return str(self.numerator)
+        return f"{self.numerator}/{self.denominator}"
+    
+    def __float__(self):
+        return self.numerator / self.denominator
+    
+    def __bool__(self):
+        return self.numerator != 0
+    
+    def __hash__(self):
+        # 与 Fraction.__hash__ 的算法一致，保证等值的 Rational 与 Fraction 哈希相同
+        if self.denominator == 1:
+            return hash(self.numerator)
+        modulus = sys.hash_info.modulus
+        try:
+            dinv = pow(self.denominator, -1, modulus)
+        except ValueError:
+            hash_ = sys.hash_info.inf
+        else:
+            hash_ = hash(hash(abs(self.numerator)) * dinv)
+        result = hash_ if self.numerator >= 0 else -hash_
+        return -2 if result == -1 else result
+    
+    # ---- 运算：另一操作数为 Rational 或 int 时走快速路径，其余交给 Fraction ----
+    
+    def __add__(self, other):
+        if other.__class__ is Rational:
+            return Rational._make(self.numerator * other.denominator + other.numerator * self.denominator,
+                                  self.denominator * other.denominator)
+        if isinstance(other, int):
+            return Rational._make(self.numerator + other * self.denominator, self.denominator)
+        return self.to_fraction() + other
+    
+    def __radd__(self, other):
+        if isinstance(other, int):
+            return Rational._make(self.numerator + other * self.denominator, self.denominator)
+        return other + self.to_fraction()
+    
+    def __sub__(self, other):
+        if other.__class__ is Rational:
+            return Rational._make(self.numerator * other.denominator - other.numerator * self.denominator,
+                                  self.denominator * other.denominator)
+        if isinstance(other, int):
+            return Rational._make(self.numerator - other * self.denominator, self.denominator)
+        return self.to_fraction() - other
+    
+    def __rsub__(self, other):
+        if isinstance(other, int):
+            return Rational._make(other * self.denominator - self.numerator, self.denominator)
+        return other - self.to_fraction()
+    
+    def __mul__(self, other):
+        if other.__class__ is Rational:
+            return Rational._make(self.numerator * other.numerator, self.denominator * other.denominator)
+        if isinstance(other, int):
+            return Rational._make(self.numerator * other, self.denominator)
+        return self.to_fraction() * other
+    
+    def __rmul__(self, other):
+        if isinstance(other, int):
+            return Rational._make(self.numerator * other, self.denominator)
+        return other * self.to_fraction()
+    
+    def __truediv__(self, other):
+        if other.__class__ is Rational or isinstance(other, int):
+            other_num, other_den = other.numerator, other.denominator
+            if other_num == 0:
+                raise ZeroDivisionError(f"{self} ÷ 0")
+            if other_num < 0:
+                other_num, other_den = -other_num, -other_den
+            return Rational._make(self.numerator * other_den, self.denominator * other_num)
+        return self.to_fraction() / other
+    
+    def __rtruediv__(self, other):
+        if isinstance(other, int):
+            return Rational(other) / self
+        return other / self.to_fraction()
+    
+    def __neg__(self):
+        return Rational._make(-self.numerator, self.denominator)
+    
+    def __pos__(self):
+        return self
+    
+    def __abs__(self):
+        return Rational._make(abs(self.numerator), self.denominator)
+    
+    # ---- numbers.Rational 要求的其余运算：不在热路径上，交给等值的 Fraction ----
+    
+    def __int__(self):
+        return int(self.to_fraction())
+    
+    def __trunc__(self):
+        return self.to_fraction().__trunc__()
+    
+    def __floor__(self):
+        return self.numerator // self.denominator
+    
+    def __ceil__(self):
+        return -(-self.numerator // self.denominator)
+    
+    def __round__(self, ndigits=None):
+        return round(self.to_fraction(), ndigits)
+    
+    def __floordiv__(self, other):
+        return self.to_fraction() // other
+    
+    def __rfloordiv__(self, other):
+        return other // self.to_fraction()
+    
+    def __mod__(self, other):
+        return self.to_fraction() % other
+    
+    def __rmod__(self, other):
+        return other % self.to_fraction()
+    
+    def __divmod__(self, other):
+        return divmod(self.to_fraction(), other)
+    
+    def __rdivmod__(self, other):
+        return divmod(other, self.to_fraction())
+    
+    def __pow__(self, other):
+        return self.to_fraction() ** other
+    
+    def __rpow__(self, other):
+        return other ** self.to_fraction()
+    
+    def __complex__(self):
+        return complex(float(self))
+    
+    @property
+    def real(self):
+        return self
+    
+    @property
+    def imag(self):
+        return 0
+    
+    def conjugate(self):
+        return self
+    
+    # ---- 比较：交叉相乘，不做除法 ----
+    
+    def __eq__(self, other):
+        if other.__class__ is Rational or isinstance(other, numbers.Rational):
+            return self.numerator == other.numerator and self.denominator == other.denominator
+        if isinstance(other, float):
+            return float(self) == other
+        return NotImplemented
+    
+    def __lt__(self, other):
+        if other.__class__ is Rational or isinstance(other, numbers.Rational):
+            return self.numerator * other.denominator < other.numerator * self.denominator
+        if isinstance(other, float):
+            return float(self) < other
+        return NotImplemented
+    
+    def __le__(self, other):
+        if other.__class__ is Rational or isinstance(other, numbers.Rational):
+            return self.numerator * other.denominator <= other.numerator * self.denominator
+        if isinstance(other, float):
+            return float(self) <= other
+        return NotImplemented
+    
+    def __gt__(self, other):
+        if other.__class__ is Rational or isinstance(other, numbers.Rational):
+            return self.numerator * other.denominator > other.numerator * self.denominator
+        if isinstance(other, float):
+            return float(self) > other
+        return NotImplemented
+    
+    def __ge__(self, other):
+        if other.__class__ is Rational or isinstance(other, numbers.Rational):
+            return self.numerator * other.denominator >= other.numerator * self.denominator
+        if isinstance(other, float):
+            return float(self) >= other
+        return NotImplemented
+
+
+# 注册为 numbers.Rational，使 Fraction 能直接与 Rational 比较和运算（上面已实现该抽象类要求的全部运算）
+numbers.Rational.register(Rational)
+
+
+class ValueCache:
+    """
+    有界的子表达式值缓存（LRU）
+    
+    键为子树的 64 位标准化哈希（FractionUtils.combine_hash，与生成树上的 key64 一致），
+    条目同时保存运算符与左右操作数的精确值，命中时逐一核对，哈希碰撞不会返回错误的值；
+    超过 maxsize 时淘汰最久未使用的条目。hits / misses 用于评估缓存大小是否合适。
+    
+    求值时组合子树哈希本身有开销，命中率不足 min_hit_rate 时反而更慢，
+    因此求值路径通过 worthwhile() 判断是否启用缓存（前 warmup 次查询总是启用）。
+    判断依据的是最近的命中率：窗口内查询数达到 2·warmup 时命中数与查询数减半；
+    停用期间每 probe_interval 次求值仍启用一次，命中率回升后自动恢复。
+    """
+    
+    def __init__(self, maxsize=65536, min_hit_rate=0.9, warmup=1000, probe_interval=32):
+        self.maxsize = maxsize
+        self.min_hit_rate = min_hit_rate
+        self.warmup = warmup
+        self.probe_interval = probe_interval
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self._recent_hits = 0
+        self._recent_total = 0
+        self._data = OrderedDict()
+    
+    def __len__(self):
+        return len(self._data)
+    
+    def get(self, key, op, left, right):
+        """
+        查询 left op right 的值：键相同且运算符、操作数都相等才算命中（'+'、'×' 的操作数可交换），
+        未命中时返回 None
+        """
+        entry = self._data.get(key)
+        self._recent_total += 1
+        if self._recent_total >= 2 * self.warmup:
+            self._recent_total //= 2
+            self._recent_hits //= 2
+        if entry is None or entry[0] != op or not (
+                entry[1] == left and entry[2] == right
+                or (op == '+' or op == '×') and entry[1] == right and entry[2] == left):
+            self.misses += 1
+            return None
+        try:
+            self._data.move_to_end(key)
+        except KeyError:
+            # 并发淘汰导致条目已不存在，不影响返回值
+            pass
+        self.hits += 1
+        self._recent_hits += 1
+        return entry[3]
+    
+    def put(self, key, op, left, right, value):
+        self._data[key] = (op, left, right, value)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+    
+    def worthwhile(self):
+        """最近的命中率下本次求值是否使用缓存（停用期间定期放行一次以重新评估）"""
+        total = self._recent_total
+        if total < self.warmup or self._recent_hits >= self.min_hit_rate * total:
+            return True
+        self.bypassed += 1
+        return self.bypassed % self.probe_interval == 0
+    
+    def clear(self):
+        self._data.clear()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self._recent_hits = 0
+        self._recent_total = 0
+    
+    def stats(self):
+        """返回缓存统计：大小、容量、命中次数、未命中次数、命中率与跳过缓存的求值次数"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "bypassed": self.bypassed,
+        }
+
 
 class FractionUtils:
     """分数工具类，处理真分数和带分数相关操作"""
     
+    # 生成、求答案与判题共享的子表达式值缓存（以子表达式的 64 位标准化哈希为键）
+    value_cache = ValueCache()
+    
+    MASK64 = (1 << 64) - 1
+    # 64 位标准化哈希中区分各运算符的常量
+    HASH_SALT = {'+': 0x2b, '-': 0x2d, '×': 0xd7, '÷': 0xf7}
+    # 组合两个 64 位整数时左侧乘以的奇数常量（2^64 / 黄金分割比）
+    HASH_GOLDEN = 0x9E3779B97F4A7C15
+    
     @staticmethod
     def gcd(a, b):
         """计算最大公约数"""
@@ -24,74 +366,228 @@ class FractionUtils:
         return abs(a * b) // FractionUtils.gcd(a, b)
     
     @staticmethod
-    def generate_proper_fraction(max_value):
+    def generate_proper_fraction(max_value, rng=random):
         """
         生成真分数（分子小于分母）
         
         Args:
             max_value: 分子和分母的最大值（不包含）
+            rng: 随机数源（random 模块或 random.Random 实例）
             
         Returns:
-            Fraction: 真分数对象
+            Rational: 真分数对象
         """
-        if max_value <= 1:
-            return Fraction(1, 2)
+        if max_value <= 2:
+            return Rational(1, 2)
             
         # 生成分母（至少为2）
-        denominator = random.randint(2, max_value - 1)
+        denominator = rng.randint(2, max_value - 1)
         # 生成分子（小于分母）
-        numerator = random.randint(1, denominator - 1)
+        numerator = rng.randint(1, denominator - 1)
         
         # 化简分数
-        gcd_val = FractionUtils.gcd(numerator, denominator)
-        numerator //= gcd_val
-        denominator //= gcd_val
-        
-        return Fraction(numerator, denominator)
+        return Rational(numerator, denominator)
     
     @staticmethod
-    def generate_mixed_number(max_value):
+    def generate_mixed_number(max_value, rng=random):
         """
         生成带分数
         
         Args:
             max_value: 整数部分和分数部分的最大值
+            rng: 随机数源（random 模块或 random.Random 实例）
             
         Returns:
-            Fraction: 带分数转换后的假分数
+            Rational: 带分数转换后的假分数
         """
         if max_value <= 2:
-            return FractionUtils.generate_proper_fraction(max_value)
+            return FractionUtils.generate_proper_fraction(max_value, rng)
             
         # 整数部分
-        whole_part = random.randint(1, max_value - 2)
+        whole_part = rng.randint(1, max_value - 2)
         # 分数部分
-        fraction_part = FractionUtils.generate_proper_fraction(max_value)
+        fraction_part = FractionUtils.generate_proper_fraction(max_value, rng)
         
-        return Fraction(whole_part) + fraction_part
+        return fraction_part + whole_part
     
     @staticmethod
-    def generate_number(max_value, allow_mixed=True):
+    def generate_number(max_value, allow_mixed=True, rng=random):
         """
         生成数字（自然数或分数）
         
         Args:
             max_value: 数值范围
             allow_mixed: 是否允许带分数
+            rng: 随机数源（random 模块或 random.Random 实例）
             
         Returns:
-            Fraction: 生成的数字
+            Rational: 生成的数字
         """
-        choice = random.randint(1, 4)
+        choice = rng.randint(1, 4)
         
         if choice == 1:  # 自然数
-            return Fraction(random.randint(0, max_value - 1))
+            return Rational(rng.randint(0, max_value - 1))
         elif choice == 2:  # 真分数
-            return FractionUtils.generate_proper_fraction(max_value)
+            return FractionUtils.generate_proper_fraction(max_value, rng)
         elif choice == 3 and allow_mixed:  # 带分数
-            return FractionUtils.generate_mixed_number(max_value)
+            return FractionUtils.generate_mixed_number(max_value, rng)
         else:  # 默认真分数
-            return FractionUtils.generate_proper_fraction(max_value)
+            return FractionUtils.generate_proper_fraction(max_value, rng)
+    
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def number_table(max_value):
+        """
+        generate_number 在给定范围内可能产生的全部数值（升序，按范围缓存）
+        
+        表的大小约为 0.3·r³，只应在小范围（见 ExpressionSpace.is_small）下构造；
+        其余场合用 number_count 计数、用 pick_not_greater / pick_greater 直接抽取。
+        
+        Args:
+            max_value: 数值范围
+            
+        Returns:
+            tuple: 升序排列的 Rational
+        """
+        if max_value <= 2:
+            proper = {Rational(1, 2)}
+        else:
+            proper = {Rational(n, d) for d in range(2, max_value) for n in range(1, d)}
+        values = {Rational(i) for i in range(max_value)} | proper
+        if max_value > 2:
+            values |= {w + p for w in range(1, max_value - 1) for p in proper}
+        return tuple(sorted(values))
+    
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def number_count(max_value):
+        """
+        number_table(max_value) 的大小，不构造数值表
+        
+        整数 0..r-1 共 r 个；最简真分数共 F = φ(2) + … + φ(r-1) 个（φ 为欧拉函数，筛法计算），
+        带分数的整数部分为 1..r-2，因此共 r + (r-1)·F 个。
+        """
+        if max_value <= 2:
+            return max_value + 1
+        phi = list(range(max_value))
+        for p in range(2, max_value):
+            if phi[p] == p:
+                for m in range(p, max_value, p):
+                    phi[m] -= phi[m] // p
+        return max_value + (max_value - 1) * sum(phi[2:])
+    
+    @staticmethod
+    def _partial_bound(remainder, denominator, max_value, greater):
+        """
+        小数部分为 remainder/denominator 时，真分数 n/d 中合法分子个数的抽样参数
+    
+        不大于（greater 为 False）时合法分子为 1..⌊f·d⌋，大于时为 ⌊f·d⌋+1..d-1。
+        返回 (d0, bound)：d0 为至少有一个合法分子的最小分母，bound 为 d >= d0 时
+        合法分子占比 count/(d-1) 的上界；不存在合法分母时返回 None。
+        """
+        if greater:
+            share = denominator - remainder
+            d0 = max(2, denominator // share + 1)
+        else:
+            if remainder == 0:
+                return None
+            share = remainder
+            d0 = max(2, -(-denominator // share))
+        if d0 > max_value - 1:
+            return None
+        return d0, min(1.0, share * d0 / (denominator * (d0 - 1)))
+    
+    @staticmethod
+    def _pick_partner(value, max_value, greater, rng):
+        """
+        按 generate_number 的分布、以 b <= value（greater 为 False）或 b > value 为条件抽取 b
+    
+        generate_number 是三部分的混合：整数（概率 1/4）、真分数（1/2）、带分数（1/4），
+        真分数先等概率选分母 d、再等概率选分子。把 value 写成 q + f（0 <= f < 1）后，
+        每一部分中合法的数要么全部合法（整数区间、整数部分不等于 q 的带分数），要么只差
+        分数部分与 f 比较（真分数或整数部分为 q 的带分数）。前者的概率质量可以直接算出；
+        后者用上界代替质量，先等概率选分母，再按合法分子的占比接受，拒绝时从头重抽。
+        每轮接受的概率不低于 1/4，期望只需常数次抽取，结果与对 generate_number 做拒绝
+        抽样的分布完全相同。
+        """
+        if value < 0:
+            return None if not greater else FractionUtils.generate_number(max_value, rng=rng)
+        if max_value <= 2:
+            # 数值表只有 2~3 项，合法的数至少占 1/8 的概率
+            table = FractionUtils.number_table(max_value)
+            if (table[-1] <= value) if greater else (table[0] > value):
+                return None
+            while True:
+                b = FractionUtils.generate_number(max_value, rng=rng)
+                if (b > value) if greater else (b <= value):
+                    return b
+        whole_max = max_value - 2
+        q, remainder = divmod(value.numerator, value.denominator)
+        if greater:
+            ints = (q + 1, max_value - 1)
+            proper_full = False
+            mixed = (q + 1, whole_max)
+        else:
+            ints = (0, min(q, max_value - 1))
+            proper_full = q >= 1
+            mixed = (1, min(q - 1, whole_max))
+        # 分数部分需与 f 比较的一项：q = 0 时为真分数，1 <= q <= r-2 时为整数部分为 q 的带分数
+        partial = None
+        partial_mass = 0.0
+        if q <= whole_max:
+            partial = FractionUtils._partial_bound(remainder, value.denominator, max_value, greater)
+        if partial is not None:
+            d0, bound = partial
+            weight = 0.5 if q == 0 else 0.25 / whole_max
+            partial_mass = weight * (max_value - d0) / whole_max * bound
+        masses = (max(ints[1] - ints[0] + 1, 0) / (4 * max_value),
+                  0.5 if proper_full else 0.0,
+                  0.25 * max(mixed[1] - mixed[0] + 1, 0) / whole_max,
+                  partial_mass)
+        total = sum(masses)
+        if total == 0:
+            return None
+        while True:
+            x = rng.random() * total
+            if x < masses[0]:
+                return Rational(rng.randint(*ints))
+            x -= masses[0]
+            if x < masses[1]:
+                return FractionUtils.generate_proper_fraction(max_value, rng)
+            x -= masses[1]
+            if x < masses[2] or partial is None:
+                return FractionUtils.generate_proper_fraction(max_value, rng) + rng.randint(*mixed)
+            d = rng.randint(d0, max_value - 1)
+            low = remainder * d // value.denominator
+            count = d - 1 - low if greater else low
+            if rng.random() * bound * (d - 1) < count:
+                n = rng.randint(low + 1, d - 1) if greater else rng.randint(1, low)
+                return Rational(q * d + n, d)
+    
+    @staticmethod
+    def pick_not_greater(value, max_value, rng=random):
+        """
+        选取一个不大于 value 的数（减法的合法减数），结果一定在 number_table(max_value) 中
+    
+        分布与“反复调用 generate_number 直到不大于 value”相同（见 _pick_partner），
+        但只需常数次抽取，也不构造数值表。
+    
+        Returns:
+            Rational: 选中的数；不存在时返回 None
+        """
+        return FractionUtils._pick_partner(value, max_value, False, rng)
+    
+    @staticmethod
+    def pick_greater(value, max_value, rng=random):
+        """
+        选取一个大于 value 的数（value > 0 时即为使商为真分数的除数），结果一定在 number_table(max_value) 中
+    
+        分布与“反复调用 generate_number 直到大于 value”相同（见 _pick_partner）。
+    
+        Returns:
+            Rational: 选中的数；不存在时返回 None
+        """
+        return FractionUtils._pick_partner(value, max_value, True, rng)
     
     @staticmethod
     def fraction_to_string(frac):
@@ -119,16 +615,8 @@ class FractionUtils:
             return f"{frac.numerator}/{frac.denominator}"
     
     @staticmethod
-    def string_to_fraction(s):
-        """
-        将字符串转换为分数
-        
-        Args:
-            s: 分数字符串
-            
-        Returns:
-            Fraction: 分数对象
-        """
+    def _parse_number(s):
+        """将数字字符串解析为 (分子, 分母)，分母可能为 0 或未约分"""
         s = s.strip()
         
         # 处理带分数格式 "2'3/8"
@@ -138,108 +626,365 @@ class FractionUtils:
             frac_part = parts[1]
             if "/" in frac_part:
                 num, den = map(int, frac_part.split("/"))
-                return Fraction(whole_part * den + num, den)
+                return whole_part * den + num, den
             else:
-                return Fraction(whole_part)
+                return whole_part, 1
         
         # 处理普通分数格式 "3/8"
         elif "/" in s:
             num, den = map(int, s.split("/"))
-            return Fraction(num, den)
+            return num, den
         
         # 处理整数
         else:
-            return Fraction(int(s))
+            return int(s), 1
+    
+    @staticmethod
+    def string_to_fraction(s):
+        """
+        将字符串转换为分数
+        
+        Args:
+            s: 分数字符串
+            
+        Returns:
+            Fraction: 分数对象
+        """
+        return Fraction(*FractionUtils._parse_number(s))
+    
+    @staticmethod
+    def string_to_rational(s):
+        """
+        将字符串转换为轻量有理数（求值热路径使用）
+        
+        Args:
+            s: 分数字符串
+            
+        Returns:
+            Rational: 有理数对象
+        """
+        return Rational(*FractionUtils._parse_number(s))
     
     @staticmethod
     def is_valid_subtraction(a, b):
         """
-        检查减法是否有效（不产生负数）
+        检查减法是否有效（不产生负数），交叉相乘比较，不做除法
         
         Args:
-            a, b: Fraction对象
+            a, b: Rational、Fraction 或 int
             
         Returns:
             bool: 是否有效
         """
-        return a >= b
+        return a.numerator * b.denominator >= b.numerator * a.denominator
     
     @staticmethod
     def is_valid_division(a, b):
         """
-        检查除法是否有效（结果为真分数）
+        检查除法是否有效（结果为真分数），交叉相乘比较，不做除法
         
         Args:
-            a, b: Fraction对象
+            a, b: Rational、Fraction 或 int
             
         Returns:
             bool: 是否有效
         """
-        if b == 0:
+        # a ÷ b = x / y
+        x = a.numerator * b.denominator
+        y = a.denominator * b.numerator
+        if y == 0:
             return False
+        # 结果必须是真分数（0 < 结果 < 1）
+        if y > 0:
+            return 0 < x < y
+        return y < x < 0
+    
+    # 运算符优先级（数值越大越先计算，均为左结合）
+    PRECEDENCE = {'+': 1, '-': 1, '×': 2, '÷': 2}
+    
+    # 记号：数字（整数、分数 a/b、带分数 w'a/b）、运算符或括号；其余非空白字符均为非法记号
+    TOKEN_PATTERN = re.compile(r"([0-9]+)(?:'([0-9]+)/([0-9]+)|/([0-9]+))?|([-+×÷()])|(\S)")
+    
+    @staticmethod
+    def tokenize_expression(expr_str):
+        """
+        将表达式切分为记号（单个预编译正则一次扫描）：数字记号转换为 Rational，运算符与括号保留为字符
         
-        result = a / b
-        # 结果必须是真分数（小于1）
-        return 0 < result < 1
+        Args:
+            expr_str: 表达式字符串
+            
+        Returns:
+            list: 记号列表
+            
+        Raises:
+            ValueError: 出现无法识别的字符或数字（如分母为 0）
+        """
+        tokens = []
+        append = tokens.append
+        for whole, numerator, denominator, simple_denominator, op, bad in \
+                FractionUtils.TOKEN_PATTERN.findall(expr_str):
+            if op:
+                append(op)
+            elif bad:
+                raise ValueError(f"无法识别的记号：{bad}")
+            elif numerator:
+                d = int(denominator)
+                if d == 0:
+                    raise ValueError(f"无法识别的数字：{whole}'{numerator}/{denominator}")
+                append(Rational(int(whole) * d + int(numerator), d))
+            elif simple_denominator:
+                d = int(simple_denominator)
+                if d == 0:
+                    raise ValueError(f"无法识别的数字：{whole}/{simple_denominator}")
+                append(Rational(int(whole), d))
+            else:
+                append(Rational(int(whole)))
+        return tokens
     
     @staticmethod
-    def calculate_expression(expr_str):
+    @lru_cache(maxsize=8192)
+    def compile_expression(expr_str):
         """
-        计算表达式的值
+        将表达式编译为后缀式（逆波兰式），可重复求值而无需再次解析
+        
+        这是标准化、求值与判题共用的唯一解析入口，按表达式文本做 LRU 缓存；
+        返回的元组不可变，可安全地在调用方之间共享。
         
         Args:
             expr_str: 表达式字符串
             
         Returns:
-            Fraction: 计算结果
+            tuple: 后缀式，元素为 Rational 或运算符字符
+            
+        Raises:
+            ValueError: 表达式语法错误
         """
-        # 替换运算符为Python可识别的格式
-        expr_str = expr_str.replace('×', '*').replace('÷', '/')
+        precedence = FractionUtils.PRECEDENCE
+        output = []
+        ops = []
+        # 期望下一个记号为操作数（数字或左括号）
+        expect_operand = True
         
-        # 处理分数格式
-        tokens = []
-        i = 0
-        current_token = ""
-        
-        while i < len(expr_str):
-            char = expr_str[i]
-            if char in "+-*/()":
-                if current_token.strip():
-                    tokens.append(current_token.strip())
-                    current_token = ""
-                if char in "+-*/":
-                    tokens.append(f" {char} ")
+        for token in FractionUtils.tokenize_expression(expr_str):
+            if token.__class__ is not str:
+                if not expect_operand:
+                    raise ValueError(f"表达式缺少运算符：{expr_str}")
+                output.append(token)
+                expect_operand = False
+            elif token == '(':
+                if not expect_operand:
+                    raise ValueError(f"表达式缺少运算符：{expr_str}")
+                ops.append(token)
+            elif token == ')':
+                if expect_operand:
+                    raise ValueError(f"表达式缺少操作数：{expr_str}")
+                while ops and ops[-1] != '(':
+                    output.append(ops.pop())
+                if not ops:
+                    raise ValueError(f"括号不匹配：{expr_str}")
+                ops.pop()
+            else:
+                if expect_operand:
+                    raise ValueError(f"表达式缺少操作数：{expr_str}")
+                while ops and ops[-1] != '(' and precedence[ops[-1]] >= precedence[token]:
+                    output.append(ops.pop())
+                ops.append(token)
+                expect_operand = True
+        
+        if expect_operand:
+            raise ValueError(f"表达式不完整：{expr_str}")
+        while ops:
+            op = ops.pop()
+            if op == '(':
+                raise ValueError(f"括号不匹配：{expr_str}")
+            output.append(op)
+        return tuple(output)
+    
+    @staticmethod
+    def apply_operator(op, left, right):
+        """对两个数执行一次四则运算"""
+        if op == '+':
+            return left + right
+        if op == '-':
+            return left - right
+        if op == '×':
+            return left * right
+        return left / right
+    
+    @staticmethod
+    def combine_key(op, left_key, right_key):
+        """
+        由左右子树的标准化键组合出运算节点的标准化键
+        
+        '+'、'×' 的左右按字典序排列（与 normalize_expression 一致），保留括号以表达结构。
+        """
+        if op in ['+', '×'] and left_key > right_key:
+            left_key, right_key = right_key, left_key
+        return f"({left_key}) {op} ({right_key})"
+    
+    @staticmethod
+    def mix64(x):
+        """
+        64 位整数混合函数（splitmix64 的末轮：两次乘法与三次异或移位）
+        
+        只用整数运算定义，结果与平台、解释器实现和版本都无关，因此由它得到的键可以持久化
+        （题目池 keys.u64、去重索引 .idx）；BatchEngine 用 NumPy 的 uint64 运算得到相同的结果。
+        """
+        x = (x ^ (x >> 30)) * 0xBF58476D1CE4E5B9 & 0xFFFFFFFFFFFFFFFF
+        x = (x ^ (x >> 27)) * 0x94D049BB133111EB & 0xFFFFFFFFFFFFFFFF
+        return x ^ (x >> 31)
+    
+    @staticmethod
+    def _fold64(n):
+        """把任意大小的整数（含负数）逐段混合为 64 位，只用于超出 [0, 2^64) 的分子、分母"""
+        mask = FractionUtils.MASK64
+        h = 1 if n < 0 else 0
+        n = abs(n)
+        while True:
+            h = FractionUtils.mix64(h * FractionUtils.HASH_GOLDEN + (n & mask) & mask)
+            n >>= 64
+            if not n:
+                return h
+    
+    @staticmethod
+    def number_hash(value):
+        """数值的 64 位标准化哈希（按约分后的分子、分母计算，与 '2/4'、'1/2' 等写法无关）"""
+        return FractionUtils.pair_hash(value.numerator, value.denominator)
+    
+    @staticmethod
+    def pair_hash(numerator, denominator):
+        """已约分的分子、分母的 64 位标准化哈希（number_hash 的拆分形式，供按分子、分母数组计算的调用方使用）"""
+        mask = FractionUtils.MASK64
+        if numerator > mask or denominator > mask or numerator < 0:
+            numerator = FractionUtils._fold64(numerator)
+            denominator = FractionUtils._fold64(denominator)
+        # 与 mix64 相同，内联以省去一次函数调用（每个叶子节点都要计算）
+        x = numerator * 0x9E3779B97F4A7C15 + denominator & mask
+        x = (x ^ (x >> 30)) * 0xBF58476D1CE4E5B9 & mask
+        x = (x ^ (x >> 27)) * 0x94D049BB133111EB & mask
+        return x ^ (x >> 31)
+    
+    @staticmethod
+    def combine_hash(op, left_hash, right_hash):
+        """
+        由左右子树的 64 位哈希组合出运算节点的哈希，与 combine_key 的等价关系相同
+        
+        '+'、'×' 先将左右哈希排序再组合（与顺序无关），'-'、'÷' 按左右顺序组合；
+        只做整数运算（见 mix64），不构造任何中间字符串。
+        """
+        if left_hash > right_hash and (op == '+' or op == '×'):
+            left_hash, right_hash = right_hash, left_hash
+        # 与 mix64 相同，内联以省去一次函数调用（每个运算节点都要计算）
+        x = (left_hash * 0x9E3779B97F4A7C15 + right_hash ^ FractionUtils.HASH_SALT[op]) & 0xFFFFFFFFFFFFFFFF
+        x = (x ^ (x >> 30)) * 0xBF58476D1CE4E5B9 & 0xFFFFFFFFFFFFFFFF
+        x = (x ^ (x >> 27)) * 0x94D049BB133111EB & 0xFFFFFFFFFFFFFFFF
+        return x ^ (x >> 31)
+    
+    @staticmethod
+    def evaluate_compiled(code, cache=None):
+        """
+        对后缀式求值
+        
+        Args:
+            code: compile_expression 的返回值
+            cache: 子表达式值缓存（ValueCache），为 None 或命中率过低时不使用缓存
+            
+        Returns:
+            Fraction: 计算结果
+            
+        Raises:
+            ZeroDivisionError: 除数为 0
+        """
+        if cache is not None and cache.worthwhile():
+            return FractionUtils._evaluate_cached(code, cache)
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        for item in code:
+            if item.__class__ is str:
+                right = pop()
+                left = pop()
+                if item == '+':
+                    push(left + right)
+                elif item == '-':
+                    push(left - right)
+                elif item == '×':
+                    push(left * right)
                 else:
-                    tokens.append(char)
-            elif char == " ":
-                if current_token.strip():
-                    tokens.append(current_token.strip())
-                    current_token = ""
+                    push(left / right)
             else:
-                current_token += char
-            i += 1
-        
-        if current_token.strip():
-            tokens.append(current_token.strip())
-        
-        # 转换分数格式
-        processed_tokens = []
-        for token in tokens:
-            token = token.strip()
-            if token and token not in "+-*/()":
-                try:
-                    frac = FractionUtils.string_to_fraction(token)
-                    processed_tokens.append(f"Fraction({frac.numerator}, {frac.denominator})")
-                except:
-                    processed_tokens.append(token)
+                push(item)
+        return stack[0]
+    
+    @staticmethod
+    def _evaluate_cached(code, cache):
+        # 栈中保存 (值, 64 位标准化哈希)，每个运算节点先按子树哈希查询缓存，命中时缓存会核对操作数
+        stack = []
+        combine_hash = FractionUtils.combine_hash
+        for item in code:
+            if item.__class__ is str:
+                right_value, right_hash = stack.pop()
+                left_value, left_hash = stack.pop()
+                key = combine_hash(item, left_hash, right_hash)
+                value = cache.get(key, item, left_value, right_value)
+                if value is None:
+                    value = FractionUtils.apply_operator(item, left_value, right_value)
+                    cache.put(key, item, left_value, right_value, value)
+                stack.append((value, key))
             else:
-                processed_tokens.append(token)
+                stack.append((item, FractionUtils.number_hash(item)))
+        return stack[0][0]
+    
+    @staticmethod
+    def calculate_expression(expr_str, cache=None):
+        """
+        计算表达式的值
         
-        expr_str = "".join(processed_tokens)
+        Args:
+            expr_str: 表达式字符串
+            cache: 子表达式值缓存（ValueCache），为 None 时不使用缓存
+            
+        Returns:
+            Fraction: 计算结果
+            
+        Raises:
+            ValueError: 表达式语法错误
+            ZeroDivisionError: 除数为 0
+        """
+        if Metrics.enabled:
+            start = time.perf_counter()
+            try:
+                return FractionUtils.evaluate_compiled(FractionUtils.compile_expression(expr_str), cache)
+            finally:
+                Metrics.incr('evaluate.count')
+                Metrics.add_time('evaluate', time.perf_counter() - start)
+        return FractionUtils.evaluate_compiled(FractionUtils.compile_expression(expr_str), cache)
+    
+    @staticmethod
+    def calculate_expressions(expressions, strict=True, cache=None):
+        """
+        批量计算表达式的值
         
-        try:
-            # 在安全的环境中计算表达式
-            result = eval(expr_str, {"__builtins__": {}, "Fraction": Fraction})
-            return result
-        except:
-            return Fraction(0)
\ No newline at end of file
+        Args:
+            expressions: 表达式字符串的可迭代对象
+            strict: 为 True 时遇到错误直接抛出；为 False 时出错的表达式结果记为 None
+            cache: 子表达式值缓存（ValueCache），为 None 时不使用缓存
+            
+        Returns:
+            list: 与输入一一对应的计算结果
+        """
+        compile_expression = FractionUtils.compile_expression
+        evaluate_compiled = FractionUtils.evaluate_compiled
+        results = []
+        start = time.perf_counter()
+        for expr_str in expressions:
+            try:
+                results.append(evaluate_compiled(compile_expression(expr_str), cache))
+            except (ValueError, ZeroDivisionError):
+                if strict:
+                    raise
+                results.append(None)
+        if Metrics.enabled:
+            Metrics.incr('evaluate.count', len(results))
+            Metrics.add_time('evaluate', time.perf_counter() - start, len(results))
+        return results
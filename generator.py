@@ -0,0 +1,101 @@
+"""
+可重入的题目生成器
+每个 Generator 实例持有自己的随机数源、参数（r、运算符上限、括号概率）与去重索引，
+不读写全局 random 状态；同一实例也可在线程池中被多个线程同时使用。
+ExpressionUtils 的静态接口保持不变，Generator 只是在其上传入各自的 rng。
+"""
+
+import random
+import threading
+
+from expression_utils import ExpressionUtils
+from fraction_utils import FractionUtils
+from key_index import KeyIndex
+
+
+class Generator:
+    """
+    题目生成器
+
+    线程安全：
+    - 每个线程第一次使用实例时，从实例的主随机数源（加锁）派生一个线程私有的 random.Random，
+      之后生成题目时线程之间不共享任何可变状态（生成路径不使用子表达式值缓存，见 make_branch）；
+    - 去重索引由实例内所有线程共享，只有插入键这一步在锁内完成。
+    因此在自由线程（free-threaded）构建上，各线程的生成可以真正并行。
+
+    指定 seed 且只在一个线程中使用时，结果只由 seed 决定。
+    """
+
+    def __init__(self, max_value, max_operators=3, paren_probability=ExpressionUtils.PAREN_PROBABILITY,
+                 seed=None):
+        if max_value < 1 or max_operators < 1:
+            raise ValueError("r 与 max_operators 必须为>=1的自然数")
+        self.max_value = max_value
+        self.max_operators = max_operators
+        self.paren_probability = paren_probability
+        self._seed_rng = random.Random(seed)
+        self._keys = KeyIndex()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _rng(self):
+        """当前线程的 random.Random"""
+        rng = getattr(self._local, 'rng', None)
+        if rng is None:
+            with self._lock:
+                seed = self._seed_rng.getrandbits(64)
+            rng = self._local.rng = random.Random(seed)
+        return rng
+
+    def __len__(self):
+        """已产出的不重复题目数"""
+        return len(self._keys)
+
+    def tree(self):
+        """生成一棵满足约束的表达式树（不参与去重）"""
+        return ExpressionUtils.generate_expression_tree(self.max_value, self.max_operators, self._rng(),
+                                                        self.paren_probability)
+
+    def expression(self):
+        """生成一道满足约束的题目文本（不参与去重）"""
+        return ExpressionUtils.render(self.tree())
+
+    def unique_trees(self, count):
+        """
+        生成至多 count 棵表达式树，与本实例此前产出的全部题目（含其它线程产出的）互不重复
+
+        候选总数达到 count * 20 时停止（与 iter_unique_trees 相同），此时返回的题目可能少于 count。
+        """
+        trees = []
+        attempts = 0
+        while len(trees) < count and attempts < count * 20:
+            attempts += 1
+            tree = self.tree()
+            with self._lock:
+                fresh = self._keys.add(tree.key64)
+            if fresh:
+                trees.append(tree)
+        return trees
+
+    def unique_expressions(self, count):
+        """unique_trees 的题目文本版本"""
+        return [ExpressionUtils.render(tree) for tree in self.unique_trees(count)]
+
+    def worksheet(self, count):
+        """
+        出一份 count 道题的试卷（题目与本实例此前产出的题目互不重复）
+
+        Returns:
+            (题目行, 答案行)，格式同 Exercises.txt / Answers.txt
+        """
+        exercises = []
+        answers = []
+        for i, tree in enumerate(self.unique_trees(count), start=1):
+            exercises.append(ExpressionUtils.format_exercise(i, ExpressionUtils.render(tree)))
+            answers.append(ExpressionUtils.format_answer(i, FractionUtils.fraction_to_string(tree.value)))
+        return exercises, answers
+
+    def reset(self):
+        """清空去重索引，之后的题目可以与此前的重复"""
+        with self._lock:
+            self._keys = KeyIndex()
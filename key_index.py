@@ -0,0 +1,131 @@
+"""
+去重索引
+以定长 64 位整数键、数组存储的开放寻址哈希表实现，替代存放 MD5 十六进制字符串的 set
+"""
+
+import struct
+from array import array
+
+
+class KeyIndex:
+    """
+    64 位键去重索引（线性探测开放寻址，底层为 array('Q')）
+
+    冲突策略：
+    - 槽位值 0 表示空位，键 0 会被映射为 1 存储。
+    - 只保存 64 位键本身，两个键相同即视为同一道题。这是保守的：
+      哈希碰撞至多把一道新题误判为重复（被丢弃并重新生成），
+      绝不会把真正重复的题目放行。n 个键发生任意碰撞的概率约为 n²/2^65，
+      一千万道题时约为 3e-6。
+    """
+
+    MASK64 = (1 << 64) - 1
+    # 装载因子上限，超过后容量翻倍
+    MAX_LOAD = 0.5
+    # 持久化文件头：槽位数、键数
+    HEADER = struct.Struct('=QQ')
+
+    def __init__(self, capacity=1024):
+        size = 16
+        while size * KeyIndex.MAX_LOAD < capacity:
+            size *= 2
+        self._slots = array('Q', bytes(8 * size))
+        self._mask = size - 1
+        self._count = 0
+        self._limit = int(size * KeyIndex.MAX_LOAD)
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, key):
+        key = (key & KeyIndex.MASK64) or 1
+        slots = self._slots
+        mask = self._mask
+        i = key & mask
+        while True:
+            slot = slots[i]
+            if slot == key:
+                return True
+            if slot == 0:
+                return False
+            i = (i + 1) & mask
+
+    def add(self, key):
+        """
+        插入键
+
+        Returns:
+            bool: 键此前不存在时返回 True
+        """
+        key = (key & KeyIndex.MASK64) or 1
+        slots = self._slots
+        mask = self._mask
+        i = key & mask
+        while True:
+            slot = slots[i]
+            if slot == key:
+                return False
+            if slot == 0:
+                break
+            i = (i + 1) & mask
+        slots[i] = key
+        self._count += 1
+        if self._count > self._limit:
+            self._grow()
+        return True
+
+    def update(self, keys):
+        for key in keys:
+            self.add(key)
+
+    def keys(self):
+        """按槽位顺序产出已保存的键"""
+        for slot in self._slots:
+            if slot:
+                yield slot
+
+    def nbytes(self):
+        """底层数组占用的字节数"""
+        return self._slots.itemsize * len(self._slots)
+
+    def write(self, f):
+        """把整张表（文件头与槽位数组）写入二进制文件对象，读回时无需重新插入"""
+        f.write(KeyIndex.HEADER.pack(len(self._slots), self._count))
+        f.write(self._slots)
+
+    @staticmethod
+    def read(f):
+        """
+        从二进制文件对象读回 write 写出的表，只做一次整块复制，代价与键逐个插入无关
+
+        Raises:
+            ValueError: 数据不完整或槽位数不是 2 的幂
+        """
+        header = f.read(KeyIndex.HEADER.size)
+        if len(header) < KeyIndex.HEADER.size:
+            raise ValueError("去重索引数据不完整")
+        size, count = KeyIndex.HEADER.unpack(header)
+        if size < 16 or size & (size - 1) or count > size * KeyIndex.MAX_LOAD:
+            raise ValueError("去重索引数据损坏")
+        slots = array('Q')
+        try:
+            slots.fromfile(f, size)
+        except EOFError:
+            raise ValueError("去重索引数据不完整")
+        index = KeyIndex.__new__(KeyIndex)
+        index._slots = slots
+        index._mask = size - 1
+        index._count = count
+        index._limit = int(size * KeyIndex.MAX_LOAD)
+        return index
+
+    def _grow(self):
+        old = self._slots
+        size = len(old) * 2
+        self._slots = array('Q', bytes(8 * size))
+        self._mask = size - 1
+        self._count = 0
+        self._limit = int(size * KeyIndex.MAX_LOAD)
+        for slot in old:
+            if slot:
+                self.add(slot)
@@ -0,0 +1,99 @@
+"""
+运行指标
+按阶段统计生成与判题过程中的计数与耗时（尝试次数、约束拒绝、运算符回退、重复命中、
+求值次数与耗时、哈希与写入耗时），供 --profile 报告与调参使用。
+默认关闭，关闭时每个埋点只多一次属性判断。
+"""
+
+import math
+import time
+from contextlib import contextmanager
+
+
+class Metrics:
+    """
+    进程内的全局计数器与计时器（多进程生成时子进程的计数器随分片结果合并回主进程，
+    子进程的计时器与多进程判题中的埋点不汇总）
+
+    计数器名称约定为 "阶段.事件"，例如：
+    - generate.attempts：生成表达式树的尝试次数
+    - generate.rejected_negative：结果为负被拒绝的次数
+    - generate.division_fallback：'÷' 无合法除数、改为其它运算符的次数
+    - generate.fallback_add：多次尝试失败后回退为简单加法的次数
+    - dedup.candidates / dedup.duplicates：去重的候选数与重复命中数
+    - evaluate.count：表达式求值次数
+    计时器记录调用次数与总秒数，例如 evaluate、write、generate、grade。
+    """
+
+    enabled = False
+    counters = {}
+    timers = {}
+
+    @staticmethod
+    def enable(enabled=True):
+        Metrics.enabled = enabled
+
+    @staticmethod
+    def reset():
+        Metrics.counters = {}
+        Metrics.timers = {}
+
+    @staticmethod
+    def incr(name, n=1):
+        """计数器加 n（未启用时不做任何事）"""
+        if Metrics.enabled:
+            Metrics.counters[name] = Metrics.counters.get(name, 0) + n
+
+    @staticmethod
+    def merge(counters):
+        """合并另一进程的计数器"""
+        for name, n in counters.items():
+            Metrics.incr(name, n)
+
+    @staticmethod
+    def add_time(name, seconds, n=1):
+        """向计时器累加 n 次调用、共 seconds 秒"""
+        if Metrics.enabled:
+            entry = Metrics.timers.get(name)
+            if entry is None:
+                entry = Metrics.timers[name] = [0, 0.0]
+            entry[0] += n
+            entry[1] += seconds
+
+    @staticmethod
+    @contextmanager
+    def timer(name):
+        """计时上下文：with Metrics.timer('write'): ..."""
+        if not Metrics.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            Metrics.add_time(name, time.perf_counter() - start)
+
+    @staticmethod
+    def snapshot():
+        """
+        返回当前指标
+
+        Returns:
+            dict: {"counters": {名称: 次数}, "timers": {名称: {"calls": 次数, "total_sec": 秒, "mean_ms": 毫秒}}}
+        """
+        timers = {}
+        for name, (calls, total) in sorted(Metrics.timers.items()):
+            timers[name] = {
+                "calls": calls,
+                "total_sec": total,
+                "mean_ms": total / calls * 1000 if calls else 0.0,
+            }
+        return {"counters": dict(sorted(Metrics.counters.items())), "timers": timers}
+
+    @staticmethod
+    def percentile(samples, q):
+        """最近秩法求分位数（samples 已升序），samples 为空时返回 0"""
+        if not samples:
+            return 0.0
+        rank = max(0, min(len(samples) - 1, math.ceil(q / 100 * len(samples)) - 1))
+        return samples[rank]
@@ -1,15 +1,250 @@
+"""
+基准测试套件
+以固定种子在 r × n × max_operators 网格上测量题目生成，并测量标准化、求值、分数格式转换、
+文件写入与大文件判题；输出吞吐量、延迟分位数与峰值内存（JSON），
+并可与保存的基线比较，标记性能回退。
+
+用法示例：
+- 运行全部基准并保存为基线：python perf_check.py --output baseline.json
+- 快速运行（缩小网格）：python perf_check.py --quick
+- 与基线比较（吞吐下降或内存增长超过 20% 视为回退，退出码为 1）：
+  python perf_check.py --compare baseline.json --threshold 0.2
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
 import time
 import tracemalloc
+from typing import Callable, Dict, List, Optional, Sequence
+
+import arithmetic_generator as ag
 from expression_utils import ExpressionUtils
+from fraction_utils import FractionUtils
+from metrics import Metrics
+
+SEED = 20240501
+# 峰值内存增长不超过该值（MB）时视为测量噪声，不判为回退
+MEMORY_NOISE_MB = 0.1
+
+
+class Benchmark:
+    """
+    一个基准用例
+
+    - kind 为 "call"：对 inputs 中每个输入调用一次 func，按单次调用统计延迟分位数；
+    - kind 为 "batch"：整体调用 func() 共 repeat 次，按每次运行统计延迟分位数，
+      func 返回本次处理的条目数，用于计算吞吐量。
+    setup 在计时运行与内存测量之前各调用一次（例如清空缓存，保证测的是冷路径）。
+    """
+
+    def __init__(self, name: str, kind: str, func: Callable, inputs: Optional[Sequence] = None,
+                 params: Optional[Dict] = None, repeat: int = 3, setup: Optional[Callable] = None):
+        self.name = name
+        self.kind = kind
+        self.func = func
+        self.inputs = inputs
+        self.params = params or {}
+        self.repeat = repeat
+        self.setup = setup
 
-def run(count=10000, r=10):
+
+def measure(bench: Benchmark) -> Dict:
+    """运行一个基准用例，返回结果字典（时间单位为毫秒）"""
+    func = bench.func
+    setup = bench.setup or (lambda: None)
+    if bench.kind == "call":
+        inputs = bench.inputs
+        for item in inputs[:min(len(inputs), 100)]:
+            func(item)
+        setup()
+        samples = []
+        clock = time.perf_counter_ns
+        for item in inputs:
+            start = clock()
+            func(item)
+            samples.append((clock() - start) / 1e6)
+        items = len(samples)
+        total = sum(samples) / 1000
+    else:
+        func()
+        samples = []
+        items = 0
+        for _ in range(bench.repeat):
+            start = time.perf_counter()
+            items = func()
+            samples.append((time.perf_counter() - start) * 1000)
+        total = sorted(samples)[len(samples) // 2] / 1000
+    samples.sort()
+
+    # 峰值内存单独跑一次测量，避免 tracemalloc 拖慢计时
+    setup()
     tracemalloc.start()
-    start = time.perf_counter()
-    exprs = ExpressionUtils.generate_unique_expressions(count, r, 3)
-    elapsed = time.perf_counter() - start
-    current, peak = tracemalloc.get_traced_memory()
+    if bench.kind == "call":
+        for item in bench.inputs:
+            func(item)
+    else:
+        func()
+    _, peak = tracemalloc.get_traced_memory()
     tracemalloc.stop()
-    print(f"generated={len(exprs)} time_sec={elapsed:.6f} peak_mb={peak/1024/1024:.2f}")
+
+    return {
+        "name": bench.name,
+        "kind": bench.kind,
+        "params": bench.params,
+        "items": items,
+        "throughput_per_sec": items / total if total > 0 else 0.0,
+        "latency_ms": {
+            "p50": Metrics.percentile(samples, 50),
+            "p90": Metrics.percentile(samples, 90),
+            "p99": Metrics.percentile(samples, 99),
+            "max": samples[-1] if samples else 0.0,
+        },
+        "peak_mb": peak / 1024 / 1024,
+    }
+
+
+def build_suite(workdir: str, quick: bool = False) -> List[Benchmark]:
+    """构造基准用例列表，所有随机输入均由固定种子生成"""
+    suite = []
+    rng = random.Random(SEED)
+
+    # 题目生成：r × n × max_operators 网格
+    r_values = [10, 30] if quick else [10, 30, 60]
+    n_values = [1000] if quick else [1000, 10000]
+    op_values = [1, 3] if quick else [1, 2, 3]
+    for r in r_values:
+        for n in n_values:
+            for ops in op_values:
+                def generate(n=n, r=r, ops=ops):
+                    return sum(1 for _ in ExpressionUtils.iter_unique_trees(n, r, ops, seed=SEED))
+                suite.append(Benchmark(f"generate[r={r},n={n},ops={ops}]", "batch", generate,
+                                       params={"r": r, "n": n, "max_operators": ops}))
+
+    # 单次调用：标准化、求值、分数格式转换
+    call_count = 2000 if quick else 20000
+    expressions = [ExpressionUtils.render(ExpressionUtils.generate_expression_tree(10, 3, rng)) for _ in range(call_count)]
+    numbers = [FractionUtils.generate_number(100, rng=rng) for _ in range(call_count)]
+    texts = [FractionUtils.fraction_to_string(value) for value in numbers]
+    # 清空解析缓存，测量的是首次解析的代价
+    cold = FractionUtils.compile_expression.cache_clear
+    suite.append(Benchmark("normalize_expression", "call", ExpressionUtils.normalize_expression, expressions,
+                           setup=cold))
+    suite.append(Benchmark("calculate_expression", "call", FractionUtils.calculate_expression, expressions,
+                           setup=cold))
+    suite.append(Benchmark("fraction_to_string", "call", FractionUtils.fraction_to_string, numbers))
+    suite.append(Benchmark("string_to_fraction", "call", FractionUtils.string_to_fraction, texts))
+
+    # 文件写入与大文件判题
+    file_count = 10000 if quick else 100000
+    exercise_path = os.path.join(workdir, "Exercises.txt")
+    answer_path = os.path.join(workdir, "Answers.txt")
+    grade_path = os.path.join(workdir, "Grade.txt")
+    ag.stream_exercises(file_count, 10, exercise_path, answer_path, seed=SEED)
+    with open(exercise_path, encoding="utf-8") as f:
+        lines = f.read().split("\n")
+
+    def write():
+        ag.write_lines(os.path.join(workdir, "Copy.txt"), lines)
+        return len(lines)
+
+    def stream():
+        return ag.stream_exercises(file_count, 10, os.path.join(workdir, "Stream.txt"),
+                                   os.path.join(workdir, "StreamAnswers.txt"), seed=SEED)
+
+    def grade_with_sidecar():
+        ag.grade(exercise_path, answer_path, grade_path)
+        return file_count
+
+    def grade_recompute():
+        ag.grade_with_key(ag.build_answer_key(exercise_path), answer_path, grade_path)
+        return file_count
+
+    suite.append(Benchmark("write_lines", "batch", write, params={"n": file_count}))
+    suite.append(Benchmark("stream_exercises", "batch", stream, params={"n": file_count, "r": 10}))
+    suite.append(Benchmark("grade[sidecar]", "batch", grade_with_sidecar, params={"n": file_count}))
+    suite.append(Benchmark("grade[recompute]", "batch", grade_recompute, params={"n": file_count}))
+    return suite
+
+
+def compare(results: List[Dict], baseline: List[Dict], threshold: float = 0.2) -> List[Dict]:
+    """
+    与基线比较，返回回退列表
+
+    吞吐量低于基线的 (1 - threshold) 倍，或峰值内存超过基线的 (1 + threshold) 倍
+    （且增长超过 MEMORY_NOISE_MB）时视为回退；基线中不存在的用例忽略。
+    """
+    base = {item["name"]: item for item in baseline}
+    regressions = []
+    for item in results:
+        old = base.get(item["name"])
+        if old is None:
+            continue
+        if old["throughput_per_sec"] > 0 and item["throughput_per_sec"] < old["throughput_per_sec"] * (1 - threshold):
+            regressions.append({"name": item["name"], "metric": "throughput_per_sec",
+                                "baseline": old["throughput_per_sec"], "current": item["throughput_per_sec"]})
+        if (item["peak_mb"] > old["peak_mb"] * (1 + threshold)
+                and item["peak_mb"] - old["peak_mb"] > MEMORY_NOISE_MB):
+            regressions.append({"name": item["name"], "metric": "peak_mb",
+                                "baseline": old["peak_mb"], "current": item["peak_mb"]})
+    return regressions
+
+
+def run(quick: bool = False, name_filter: Optional[str] = None) -> Dict:
+    """运行基准套件，返回包含环境信息与各用例结果的报告"""
+    with tempfile.TemporaryDirectory() as workdir:
+        suite = build_suite(workdir, quick)
+        results = []
+        for bench in suite:
+            if name_filter and name_filter not in bench.name:
+                continue
+            result = measure(bench)
+            results.append(result)
+            print(f"{result['name']}: {result['throughput_per_sec']:.1f}/s "
+                  f"p50={result['latency_ms']['p50']:.3f}ms p99={result['latency_ms']['p99']:.3f}ms "
+                  f"peak={result['peak_mb']:.2f}MB", file=sys.stderr)
+    return {
+        "seed": SEED,
+        "quick": quick,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="四则运算题目生成与判题的基准测试")
+    parser.add_argument("--quick", action="store_true", help="缩小网格与数据规模，快速运行")
+    parser.add_argument("--filter", type=str, help="只运行名称包含该字符串的用例")
+    parser.add_argument("--output", type=str, help="将 JSON 报告写入文件（默认输出到标准输出）")
+    parser.add_argument("--compare", type=str, help="与该基线 JSON 报告比较，存在回退时退出码为 1")
+    parser.add_argument("--threshold", type=float, default=0.2, help="回退判定阈值（默认 0.2，即 20%%）")
+    args = parser.parse_args()
+
+    report = run(args.quick, args.filter)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        report["regressions"] = compare(report["results"], baseline["results"], args.threshold)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if report.get("regressions"):
+        for item in report["regressions"]:
+            print(f"回退：{item['name']} {item['metric']} {item['baseline']:.2f} -> {item['current']:.2f}",
+                  file=sys.stderr)
+        sys.exit(1)
+
 
 if __name__ == "__main__":
-    run()
\ No newline at end of file
+    main()
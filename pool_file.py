@@ -0,0 +1,236 @@
+"""
+磁盘题目池
+把某组 (r, max_operators) 参数下生成过的不重复题目持久化为可随机访问的题目池目录，
+新试卷直接从内存映射的题目池中无放回抽样，无需重新生成；题目池可增量扩充。
+"""
+
+import json
+import mmap
+import os
+import random
+from array import array
+
+from expression_batch import ExpressionBatch
+from expression_utils import ExpressionUtils
+from fraction_utils import Rational
+from key_index import KeyIndex
+
+
+class PoolFile:
+    """
+    题目池目录（所有数据文件只追加，meta.json 中的 count 为准）
+
+    - meta.json：版本、r、max_operators、题目数 count、候选序号 next_index、种子 seed
+    - keys.u64：每题的 64 位标准化键（树上的 key64，与 ExpressionUtils.get_expression_key 一致）
+    - values.i64：每题精确值的分子、分母（int64）
+    - offsets.u64：count + 1 个偏移，第 i 题的编码为 codes[offsets[i]:offsets[i + 1]]
+    - codes.u32：题目的后缀式编码（与 ExpressionBatch 相同：小于 8 的码为运算符，
+      其余为 8 + 分子 × base + 分母），因此 r 不能超过 MAX_VALUE
+
+    题目按 (seed, next_index) 的计数器序列生成并按标准化键去重，因此池内题目互不重复，
+    扩充只会追加新题目，且结果只由种子决定。
+    """
+
+    VERSION = 4
+    # codes.u32 能容纳全部叶子码的最大 r（见 ExpressionBatch.max_code）
+    MAX_VALUE = 1626
+    INT64_MAX = (1 << 63) - 1
+    FILES = (("keys", "keys.u64", "Q"), ("values", "values.i64", "q"),
+             ("offsets", "offsets.u64", "Q"), ("codes", "codes.u32", "I"))
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != PoolFile.VERSION:
+            raise ValueError(f"不支持的题目池版本：{path}")
+        self.max_value = self.meta["max_value"]
+        self.max_operators = self.meta["max_operators"]
+        self.base = ExpressionBatch.code_base(self.max_value)
+        self._texts = {}
+        self._maps = []
+        self._open()
+
+    def _open(self):
+        """内存映射各数据文件，只暴露 meta 中 count 覆盖的部分"""
+        count = self.meta["count"]
+        sizes = {"keys": count, "values": 2 * count, "offsets": count + 1}
+        self._views = {}
+        for name, filename, typecode in PoolFile.FILES:
+            with open(os.path.join(self.path, filename), "rb") as f:
+                length = sizes.get(name)
+                if name == "codes":
+                    length = self._views["offsets"][count]
+                if length == 0:
+                    self._views[name] = memoryview(array(typecode))
+                    continue
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            itemsize = array(typecode).itemsize
+            if len(buffer) < length * itemsize:
+                buffer.close()
+                raise ValueError(f"题目池文件不完整：{filename}")
+            self._maps.append(buffer)
+            self._views[name] = memoryview(buffer)[:length * itemsize].cast(typecode)
+
+    def close(self):
+        for view in self._views.values():
+            view.release()
+        self._views = {}
+        for buffer in self._maps:
+            buffer.close()
+        self._maps = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self):
+        return self.meta["count"]
+
+    @staticmethod
+    def create(path, max_value, max_operators=3, seed=None):
+        """新建空的题目池目录并打开"""
+        if max_value > PoolFile.MAX_VALUE:
+            raise ValueError(f"题目池最多支持 r={PoolFile.MAX_VALUE}")
+        os.makedirs(path, exist_ok=True)
+        for _, filename, typecode in PoolFile.FILES:
+            with open(os.path.join(path, filename), "wb") as f:
+                if filename == "offsets.u64":
+                    f.write(array(typecode, [0]).tobytes())
+        meta = {
+            "version": PoolFile.VERSION,
+            "max_value": max_value,
+            "max_operators": max_operators,
+            "count": 0,
+            "next_index": 0,
+            "seed": random.randrange(2 ** 32) if seed is None else seed,
+        }
+        PoolFile._write_meta(path, meta)
+        return PoolFile(path)
+
+    @staticmethod
+    def open_or_create(path, max_value, max_operators=3, seed=None):
+        """打开已有题目池（参数须一致），不存在时新建"""
+        if not os.path.exists(os.path.join(path, "meta.json")):
+            return PoolFile.create(path, max_value, max_operators, seed)
+        pool = PoolFile(path)
+        if (pool.max_value, pool.max_operators) != (max_value, max_operators):
+            pool.close()
+            raise ValueError(f"题目池参数为 r={pool.max_value}, max_operators={pool.max_operators}，与请求不一致")
+        return pool
+
+    @staticmethod
+    def _write_meta(path, meta):
+        # 先写临时文件再原子替换，扩充中途失败时旧的 count 仍然有效
+        tmp = os.path.join(path, "meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp, os.path.join(path, "meta.json"))
+
+    # ==== 编码与解码（与 ExpressionBatch 相同的后缀式编码） ====
+
+    def encode(self, tree):
+        """将表达式树编码为后缀式码列表"""
+        return ExpressionBatch.encode_tree(tree, self.base)
+
+    def decode(self, codes):
+        """将后缀式码渲染为题目文本"""
+        return ExpressionBatch.render_codes(codes, self.base, self._texts)
+
+    # ==== 随机访问与抽样 ====
+
+    def key(self, index):
+        return self._views["keys"][index]
+
+    def value(self, index):
+        values = self._views["values"]
+        return Rational(values[2 * index], values[2 * index + 1])
+
+    def expression(self, index):
+        offsets = self._views["offsets"]
+        return self.decode(self._views["codes"][offsets[index]:offsets[index + 1]])
+
+    def sample(self, count, rng=random):
+        """
+        无放回抽取 count 道题目（池内题目互不重复，因此试卷内也互不重复）
+
+        Returns:
+            list: [(题目文本, 精确值), ...]
+
+        Raises:
+            ValueError: count 超过题目池大小
+        """
+        if count > len(self):
+            raise ValueError(f"题目池只有 {len(self)} 道题目，不足 {count} 道")
+        return [(self.expression(i), self.value(i)) for i in rng.sample(range(len(self)), count)]
+
+    def sample_batch(self, count, rng=random):
+        """
+        与 sample 相同的无放回抽样，但直接把抽中题目的编码复制进 ExpressionBatch，不渲染文本、不求值
+
+        Raises:
+            ValueError: count 超过题目池大小
+        """
+        if count > len(self):
+            raise ValueError(f"题目池只有 {len(self)} 道题目，不足 {count} 道")
+        batch = ExpressionBatch(self.max_value)
+        offsets = self._views["offsets"]
+        codes = self._views["codes"]
+        for i in rng.sample(range(len(self)), count):
+            batch.append_encoded(codes[offsets[i]:offsets[i + 1]])
+        return batch
+
+    # ==== 增量扩充 ====
+
+    def extend(self, count):
+        """
+        按计数器序列继续生成，向题目池追加至多 count 道新题目（与池内已有题目均不重复）
+
+        Returns:
+            int: 实际追加的题目数（高重复率时可能少于 count）
+        """
+        meta = self.meta
+        total = meta["count"]
+        seen = KeyIndex(total + count)
+        seen.update(self._views["keys"])
+        keys = array("Q")
+        values = array("q")
+        offsets = array("Q")
+        codes = array("I")
+        end = self._views["offsets"][total]
+        index = meta["next_index"]
+        stop = index + count * 20
+        while len(keys) < count and index < stop:
+            tree = ExpressionUtils.expression_tree_at(meta["seed"], index, self.max_value, self.max_operators)
+            index += 1
+            numerator, denominator = tree.value.numerator, tree.value.denominator
+            if abs(numerator) > PoolFile.INT64_MAX or denominator > PoolFile.INT64_MAX:
+                continue
+            key = tree.key64
+            if not seen.add(key):
+                continue
+            keys.append(key)
+            values.append(numerator)
+            values.append(denominator)
+            encoded = self.encode(tree)
+            codes.extend(encoded)
+            end += len(encoded)
+            offsets.append(end)
+
+        self.close()
+        # 先丢弃上次失败扩充可能遗留的尾部数据，再追加
+        data = {"keys": keys, "values": values, "offsets": offsets, "codes": codes}
+        valid = {"keys": total * 8, "values": total * 16, "offsets": (total + 1) * 8,
+                 "codes": (end - len(codes)) * 4}
+        for name, filename, _ in PoolFile.FILES:
+            with open(os.path.join(self.path, filename), "r+b") as f:
+                f.truncate(valid[name])
+                f.seek(0, 2)
+                f.write(data[name].tobytes())
+        meta["count"] = total + len(keys)
+        meta["next_index"] = index
+        PoolFile._write_meta(self.path, meta)
+        self._open()
+        return len(keys)
@@ -0,0 +1,333 @@
+"""
+本地题目服务
+常驻进程，按 (r, max_operators) 维护预生成的不重复题目池，由后台工作进程补充；
+通过 HTTP（TCP 或 Unix 套接字）提供出卷与判题接口，并统计各接口的延迟分位数。
+
+接口：
+- GET  /worksheet?r=10&n=20&ops=3  出卷，返回 {"exercises": [...], "answers": [...]}（行格式同输出文件）
+- POST /grade  请求体 {"exercises": [...], "answers": [...]}，返回 {"correct": [...], "wrong": [...]}
+- GET  /metrics  各接口的请求数与 p50/p90/p99 延迟（毫秒），以及各题目池的当前大小
+- GET  /health
+
+用法示例：
+- python arithmetic_generator.py --serve --port 8000 --workers 2 --prewarm 10 20
+- python arithmetic_generator.py --serve --socket /tmp/worksheet.sock
+"""
+
+import json
+import multiprocessing
+import os
+import random
+import socket
+import socketserver
+import threading
+import time
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import arithmetic_generator as ag
+from expression_batch import ExpressionBatch
+from expression_utils import ExpressionUtils
+from fraction_utils import FractionUtils
+from generator import Generator
+from metrics import Metrics
+
+
+def _fill(job):
+    """
+    工作进程任务：生成一批不重复题目
+
+    Returns:
+        (ExpressionBatch, array('Q'))：题目批与各题的 64 位键，只有两块缓冲区需要序列化
+    """
+    max_value, max_operators, count, seed = job
+    batch = ExpressionBatch(max_value)
+    keys = array('Q')
+    for tree in ExpressionUtils.iter_unique_trees(count, max_value, max_operators, seed=seed):
+        batch.append(tree)
+        keys.append(tree.key64)
+    return batch, keys
+
+
+class ProblemPool:
+    """
+    一组 (r, max_operators) 参数下的预生成题目池
+
+    池中的题目按批次生成，批次之间可能重复；取题时按 64 位键在本次试卷内去重，重复的题目直接丢弃。
+    每个批次保存为 ExpressionBatch（只有后缀式编码）与键数组，取题时才渲染文本、计算精确值。
+    池内题目低于 size 时向进程池提交补充任务，取题不等待补充；池中不足时在当前线程内直接生成补齐。
+    """
+
+    def __init__(self, max_value, max_operators, executor, size=2000, batch_size=500):
+        self.max_value = max_value
+        self.max_operators = max_operators
+        self.size = size
+        self.batch_size = batch_size
+        self._executor = executor
+        # 每项为 [ExpressionBatch, 键数组, 下一道未取题目的下标]
+        self._batches = deque()
+        self._count = 0
+        self._pending = 0
+        self._lock = threading.Lock()
+        # 池中不足时在请求线程内补齐，每个线程使用生成器各自的随机数源
+        self._generator = Generator(max_value, max_operators)
+
+    def __len__(self):
+        return self._count
+
+    def top_up(self):
+        """按缺口提交补充任务（在途任务计入缺口）"""
+        with self._lock:
+            jobs = -(-(self.size - self._count - self._pending * self.batch_size) // self.batch_size)
+            jobs = max(jobs, 0)
+            self._pending += jobs
+        for _ in range(jobs):
+            job = (self.max_value, self.max_operators, self.batch_size, random.randrange(2 ** 63))
+            self._executor.submit(_fill, job).add_done_callback(self._on_filled)
+
+    def _on_filled(self, future):
+        with self._lock:
+            self._pending -= 1
+            # close() 取消的任务没有结果，调用 exception() 会抛出 CancelledError
+            if not future.cancelled() and future.exception() is None:
+                batch, keys = future.result()
+                self._batches.append([batch, keys, 0])
+                self._count += len(batch)
+        Metrics.incr("service.pool_refills")
+
+    def take(self, count):
+        """
+        取出 count 道互不重复的题目
+
+        Returns:
+            list: [(题目文本, 精确值), ...]
+        """
+        seen = set()
+        picked = []
+        with self._lock:
+            while self._batches and len(picked) < count:
+                entry = self._batches[0]
+                batch, keys, start = entry
+                i = start
+                while i < len(batch) and len(picked) < count:
+                    key = keys[i]
+                    if key not in seen:
+                        seen.add(key)
+                        picked.append((batch, i))
+                    i += 1
+                self._count -= i - start
+                if i == len(batch):
+                    self._batches.popleft()
+                else:
+                    entry[2] = i
+        # 渲染与求值在锁外进行
+        taken = [(batch.render(i), batch.value(i)) for batch, i in picked]
+        if len(taken) < count:
+            Metrics.incr("service.pool_misses", count - len(taken))
+            attempts = 0
+            while len(taken) < count and attempts < count * 20:
+                attempts += 1
+                tree = self._generator.tree()
+                key = tree.key64
+                if key not in seen:
+                    seen.add(key)
+                    taken.append((ExpressionUtils.render(tree), tree.value))
+        self.top_up()
+        return taken
+
+
+class WorksheetService:
+    """题目池集合、延迟统计与请求分发（与具体的 HTTP 服务器无关）"""
+
+    # 每个接口保留的最近延迟样本数
+    LATENCY_WINDOW = 10000
+
+    def __init__(self, workers=1, pool_size=2000, max_count=10000):
+        self.pool_size = pool_size
+        self.max_count = max_count
+        # 工作进程在首次补充题目池时才启动，可能位于 HTTP 请求线程中；
+        # 多线程进程里 fork 可能继承其它线程持有的锁，因此改用 forkserver（不支持时用 spawn）
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        self._executor = ProcessPoolExecutor(max_workers=max(workers, 1),
+                                             mp_context=multiprocessing.get_context(method))
+        self._pools = {}
+        self._pools_lock = threading.Lock()
+        self._latencies = {}
+        self._latency_lock = threading.Lock()
+
+    def pool(self, max_value, max_operators=3):
+        """取得（必要时创建并开始预热）参数对应的题目池"""
+        key = (max_value, max_operators)
+        with self._pools_lock:
+            pool = self._pools.get(key)
+            if pool is None:
+                pool = self._pools[key] = ProblemPool(max_value, max_operators, self._executor, self.pool_size)
+        pool.top_up()
+        return pool
+
+    def worksheet(self, max_value, count, max_operators=3):
+        """出一份 count 道题的试卷，返回题目行与答案行"""
+        if max_value < 1 or max_operators < 1:
+            raise ValueError("r 与 ops 必须为>=1的自然数")
+        if count < 1 or count > self.max_count:
+            raise ValueError(f"n 范围为 1-{self.max_count}")
+        if ExpressionUtils.expression_space(max_value, max_operators) is not None:
+            # 小数值范围直接对精确计数的题目空间抽样，代价很低，且能正确报告容量上限
+            problems = [(ExpressionUtils.render(tree), tree.value)
+                        for tree in ExpressionUtils.iter_unique_trees(count, max_value, max_operators)]
+        else:
+            problems = self.pool(max_value, max_operators).take(count)
+        exercises = []
+        answers = []
+        for i, (expression, value) in enumerate(problems, start=1):
+            exercises.append(ExpressionUtils.format_exercise(i, expression))
+            answers.append(ExpressionUtils.format_answer(i, FractionUtils.fraction_to_string(value)))
+        return {"exercises": exercises, "answers": answers}
+
+    def grade(self, exercises, answers):
+        for name, lines in (("exercises", exercises), ("answers", answers)):
+            if not isinstance(lines, list) or not all(isinstance(line, str) for line in lines):
+                raise ValueError(f"{name} 必须为字符串列表")
+        correct, wrong = ag.grade_lines(exercises, answers)
+        return {"correct": correct, "wrong": wrong}
+
+    def record(self, endpoint, seconds):
+        with self._latency_lock:
+            samples = self._latencies.get(endpoint)
+            if samples is None:
+                samples = self._latencies[endpoint] = deque(maxlen=WorksheetService.LATENCY_WINDOW)
+            samples.append(seconds * 1000)
+
+    def metrics(self):
+        endpoints = {}
+        with self._latency_lock:
+            items = [(name, sorted(samples)) for name, samples in self._latencies.items()]
+        for name, samples in items:
+            endpoints[name] = {
+                "requests": len(samples),
+                "p50_ms": Metrics.percentile(samples, 50),
+                "p90_ms": Metrics.percentile(samples, 90),
+                "p99_ms": Metrics.percentile(samples, 99),
+            }
+        with self._pools_lock:
+            pools = {f"r={r},ops={ops}": len(pool) for (r, ops), pool in self._pools.items()}
+        return {"endpoints": endpoints, "pools": pools}
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class WorksheetHandler(BaseHTTPRequestHandler):
+    """HTTP 请求处理：所有响应均为 JSON，参数或请求体错误返回 400，其它异常返回 500"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        if url.path == "/worksheet":
+            self._dispatch("worksheet", lambda: self.server.service.worksheet(
+                int(params.get("r", 0)), int(params.get("n", 10)), int(params.get("ops", 3))))
+        elif url.path == "/metrics":
+            self._dispatch("metrics", self.server.service.metrics)
+        elif url.path == "/health":
+            self._dispatch("health", lambda: {"status": "ok"})
+        else:
+            self._send(404, {"error": f"未知路径：{url.path}"})
+
+    def do_POST(self):
+        if urlsplit(self.path).path != "/grade":
+            self._send(404, {"error": f"未知路径：{self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            self._send(400, {"error": "Content-Length 无效"})
+            return
+        body = self.rfile.read(length)
+
+        def grade():
+            payload = json.loads(body or b"{}")
+            if not isinstance(payload, dict):
+                raise ValueError("请求体必须为 JSON 对象")
+            return self.server.service.grade(payload.get("exercises", []), payload.get("answers", []))
+
+        self._dispatch("grade", grade)
+
+    def _dispatch(self, endpoint, handler):
+        start = time.perf_counter()
+        try:
+            status, payload = 200, handler()
+        except ValueError as e:
+            status, payload = 400, {"error": str(e)}
+        except Exception as e:
+            # 意外错误也要给出响应，不能让连接挂起
+            status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+        # 先记录再响应，客户端收到响应时该请求已计入 /metrics
+        self.server.service.record(endpoint, time.perf_counter() - start)
+        self._send(status, payload)
+
+    def _send(self, status, payload):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # 访问日志由 /metrics 替代
+        pass
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    """监听 Unix 套接字的多线程 HTTP 服务器"""
+
+    address_family = socket.AF_UNIX
+    daemon_threads = True
+
+    def server_bind(self):
+        socketserver.TCPServer.server_bind(self)
+        self.server_name = "localhost"
+        self.server_port = 0
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler 需要 (host, port) 形式的客户端地址
+        return request, ("local", 0)
+
+
+def create_server(service, host="127.0.0.1", port=8000, socket_path=None):
+    """创建绑定到 TCP 地址或 Unix 套接字的 HTTP 服务器（尚未开始服务）"""
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = UnixHTTPServer(socket_path, WorksheetHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), WorksheetHandler)
+        server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def serve(host="127.0.0.1", port=8000, socket_path=None, workers=1, pool_size=2000, prewarm=()):
+    """启动服务并阻塞运行，prewarm 中的 r 值（max_operators=3）在启动时即开始预热"""
+    service = WorksheetService(workers=workers, pool_size=pool_size)
+    for max_value in prewarm:
+        if ExpressionUtils.expression_space(max_value) is None:
+            service.pool(max_value)
+    server = create_server(service, host, port, socket_path)
+    address = socket_path or f"http://{host}:{server.server_port}"
+    print(f"题目服务已启动：{address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
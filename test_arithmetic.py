@@ -1,10 +1,28 @@
 import unittest
+import random
+import json
+import math
 import os
+import tempfile
+import threading
+import urllib.error
+import urllib.request
 from fractions import Fraction
 
-from fraction_utils import FractionUtils
+from fraction_utils import FractionUtils, ValueCache, Rational
 from expression_utils import ExpressionUtils
+from key_index import KeyIndex
+from expression_space import ExpressionSpace
+from answer_key import AnswerKey, ExerciseIndex
+from batch_engine import BatchEngine
+from metrics import Metrics
+from ingest import Ingest
+from pool_file import PoolFile
+from expression_batch import ExpressionBatch
+from generator import Generator
 import arithmetic_generator as ag
+import perf_check
+import batch_jobs
 
 
 class TestFractionUtils(unittest.TestCase):
@@ -38,6 +56,173 @@ class TestFractionUtils(unittest.TestCase):
         self.assertTrue(FractionUtils.is_valid_division(a, b))  # 1/2 ÷ 3/2 = 1/3 < 1
         self.assertFalse(FractionUtils.is_valid_division(b, a))  # 3/2 ÷ 1/2 = 3 > 1
 
+    def test_valid_checks_cross_multiply(self):
+        self.assertTrue(FractionUtils.is_valid_subtraction(Rational(3, 4), Fraction(3, 4)))
+        self.assertTrue(FractionUtils.is_valid_division(Rational(2, 3), 1))
+        self.assertFalse(FractionUtils.is_valid_division(Rational(2, 3), Rational(2, 3)))
+        self.assertFalse(FractionUtils.is_valid_division(Rational(0), 2))
+        self.assertFalse(FractionUtils.is_valid_division(Rational(1, 2), 0))
+        self.assertTrue(FractionUtils.is_valid_division(Rational(-1, 2), -1))
+
+    def test_rational_matches_fraction(self):
+        pairs = [(1, 2), (-3, 4), (5, 1), (0, 1), (7, -3)]
+        for an, ad in pairs:
+            for bn, bd in pairs:
+                a, b = Rational(an, ad), Rational(bn, bd)
+                fa, fb = Fraction(an, ad), Fraction(bn, bd)
+                self.assertEqual(a + b, fa + fb)
+                self.assertEqual(a - b, fa - fb)
+                self.assertEqual(a * b, fa * fb)
+                if bn:
+                    self.assertEqual(a / b, fa / fb)
+                    self.assertEqual(a // b, fa // fb)
+                    self.assertEqual(a % fb, fa % fb)
+                self.assertEqual(a < b, fa < fb)
+                self.assertEqual(a <= fb, fa <= fb)
+            # numbers.Rational 要求的其余运算
+            self.assertEqual((int(a), round(a), +a, a ** 2, math.floor(a), math.ceil(a)),
+                             (int(fa), round(fa), +fa, fa ** 2, math.floor(fa), math.ceil(fa)))
+        self.assertEqual(hash(Rational(3, 6)), hash(Fraction(1, 2)))
+        self.assertEqual(hash(Rational(4, 2)), hash(2))
+        self.assertEqual(FractionUtils.fraction_to_string(Rational(19, 8)), "2'3/8")
+        with self.assertRaises(ZeroDivisionError):
+            Rational(1, 2) / 0
+
+    def test_rational_falls_back_to_fraction(self):
+        big = Rational(Rational.LIMIT - 1)
+        self.assertIsInstance(big * 4, Fraction)
+        self.assertEqual(big * 4, Fraction(Rational.LIMIT - 1) * 4)
+        self.assertIsInstance(Rational(1, 2) + Fraction(1, 3), Fraction)
+
+    def test_calculate_expression_precedence(self):
+        self.assertEqual(FractionUtils.calculate_expression("1 + 2 × 3"), 7)
+        self.assertEqual(FractionUtils.calculate_expression("(1 + 2) × 3"), 9)
+        self.assertEqual(FractionUtils.calculate_expression("1/3 ÷ 8'2/3 + 7"), Fraction(183, 26))
+        self.assertEqual(FractionUtils.calculate_expression("6 - 2 - 1"), 3)
+
+    def test_calculate_expression_errors(self):
+        with self.assertRaises(ValueError):
+            FractionUtils.calculate_expression("1 + ")
+        with self.assertRaises(ValueError):
+            FractionUtils.calculate_expression("(1 + 2")
+        with self.assertRaises(ValueError):
+            FractionUtils.calculate_expression("1 + x")
+        with self.assertRaises(ZeroDivisionError):
+            FractionUtils.calculate_expression("1 ÷ 0")
+
+    def test_shared_parser(self):
+        self.assertEqual(FractionUtils.tokenize_expression("1'1/2×(3/4 - 0)"),
+                         [Fraction(3, 2), '×', '(', Fraction(3, 4), '-', 0, ')'])
+        for bad in ["1 + 2/0", "1 ' 2", "1 + x", "1'2"]:
+            with self.assertRaises(ValueError):
+                FractionUtils.calculate_expression(bad)
+        FractionUtils.compile_expression.cache_clear()
+        ExpressionUtils.normalize_expression("2/4 + 1")
+        FractionUtils.calculate_expression("2/4 + 1")
+        self.assertEqual(FractionUtils.compile_expression.cache_info().hits, 1)
+        self.assertEqual(ExpressionUtils.normalize_expression("2/4 + 1"), ExpressionUtils.normalize_expression("1 + 1/2"))
+
+    def test_calculate_expressions_batch(self):
+        values = FractionUtils.calculate_expressions(["1 + 1", "2 ×", "3/4 - 1/4"], strict=False)
+        self.assertEqual(values, [Fraction(2), None, Fraction(1, 2)])
+        with self.assertRaises(ValueError):
+            FractionUtils.calculate_expressions(["1 + 1", "2 ×"])
+
+    def test_number_table(self):
+        self.assertEqual(FractionUtils.number_table(3),
+                         (Fraction(0), Fraction(1, 2), Fraction(1), Fraction(3, 2), Fraction(2)))
+        table = FractionUtils.number_table(10)
+        self.assertEqual(list(table), sorted(set(table)))
+        for _ in range(200):
+            self.assertIn(FractionUtils.generate_number(10), table)
+        for r in range(1, 12):
+            self.assertEqual(FractionUtils.number_count(r), len(FractionUtils.number_table(r)))
+
+    def test_pick_partner(self):
+        table = FractionUtils.number_table(6)
+        for value in table:
+            b = FractionUtils.pick_not_greater(value, 6)
+            self.assertIn(b, table)
+            self.assertTrue(FractionUtils.is_valid_subtraction(value, b))
+            b = FractionUtils.pick_greater(value, 6)
+            if value == table[-1]:
+                self.assertIsNone(b)
+            elif value > 0:
+                self.assertIn(b, table)
+                self.assertTrue(FractionUtils.is_valid_division(value, b))
+        # 大范围不构造数值表
+        FractionUtils.number_table.cache_clear()
+        value = Fraction(123457, 11)
+        self.assertLessEqual(FractionUtils.pick_not_greater(value, 100000), value)
+        self.assertGreater(FractionUtils.pick_greater(value, 100000), value)
+        self.assertFalse(ExpressionSpace.is_small(100000))
+        self.assertEqual(FractionUtils.number_table.cache_info().currsize, 0)
+
+    def test_pick_partner_distribution(self):
+        # 与反复调用 generate_number 直到合法（拒绝抽样）的分布一致
+        def frequencies(draw):
+            counts = {}
+            for _ in range(10000):
+                b = Fraction(draw())
+                counts[b] = counts.get(b, 0) + 1
+            return counts
+
+        def rejection(value, greater, rng):
+            while True:
+                b = FractionUtils.generate_number(6, rng=rng)
+                if (b > value) if greater else (b <= value):
+                    return b
+
+        for value in (Fraction(1, 3), Fraction(7, 3)):
+            for greater, pick in ((False, FractionUtils.pick_not_greater), (True, FractionUtils.pick_greater)):
+                rng = random.Random(1)
+                picked = frequencies(lambda: pick(Rational(value.numerator, value.denominator), 6, rng))
+                expected = frequencies(lambda: rejection(value, greater, rng))
+                distance = sum(abs(picked.get(b, 0) - expected.get(b, 0)) for b in set(picked) | set(expected))
+                self.assertLess(distance / 20000, 0.06)
+
+    def test_value_cache_counters(self):
+        cache = ValueCache(maxsize=2)
+        self.assertEqual(FractionUtils.calculate_expression("(1 + 2) × (2 + 1)", cache), 9)
+        # 1 + 2 与 2 + 1 的标准化键相同，第二次命中
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+        self.assertEqual(FractionUtils.calculate_expression("3 - (1 + 2)", cache), 0)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.stats()["hits"], 2)
+
+    def test_value_cache_checks_operands(self):
+        # 2^61 与 1 的 CPython 元组 hash 相同，缓存不能只按哈希命中
+        self.assertEqual(ExpressionUtils.calculate_answer("1 + 1"), "2")
+        self.assertEqual(ExpressionUtils.calculate_answer("2305843009213693952 + 1"), "2305843009213693953")
+        cache = ValueCache()
+        cache.put(7, '+', Rational(1), Rational(1), Rational(2))
+        self.assertIsNone(cache.get(7, '+', Rational(2 ** 61), Rational(1)))
+        self.assertEqual(cache.get(7, '+', Rational(1), Rational(1)), 2)
+        # 64 位键只由整数运算定义，跨解释器版本稳定
+        self.assertEqual(FractionUtils.number_hash(Rational(1, 2)), 10905525725756348110)
+        self.assertEqual(FractionUtils.combine_hash('-', 1, 2), 14387688016129665287)
+        self.assertNotEqual(FractionUtils.number_hash(Rational(2 ** 61)), FractionUtils.number_hash(Rational(1)))
+
+    def test_value_cache_bypass_on_low_hit_rate(self):
+        cache = ValueCache(warmup=10, min_hit_rate=0.9)
+        for i in range(20):
+            FractionUtils.calculate_expression(f"{i} + {i + 1}", cache)
+        self.assertFalse(cache.worthwhile())
+        self.assertEqual(cache.misses, 10)
+        # 停用期间定期放行一次，计数继续更新，命中率回升后恢复使用
+        cache = ValueCache(warmup=10, min_hit_rate=0.9, probe_interval=4)
+        for i in range(20):
+            FractionUtils.calculate_expression(f"{i} + {i + 1}", cache)
+        for _ in range(2000):
+            FractionUtils.calculate_expression("1 + 2", cache)
+        self.assertTrue(cache.worthwhile())
+        self.assertGreater(cache.hits, 1000)
+        self.assertGreater(cache.stats()["bypassed"], 0)
+        # 生成路径默认不查共享缓存
+        stats = FractionUtils.value_cache.stats()
+        ExpressionUtils.generate_unique_trees(50, 10)
+        self.assertEqual(FractionUtils.value_cache.stats(), stats)
+
 
 class TestExpressionUtils(unittest.TestCase):
     def test_generate_expression_non_negative(self):
@@ -52,6 +237,21 @@ class TestExpressionUtils(unittest.TestCase):
         # 运算符个数不超过3个
         self.assertLessEqual(count, 3)
 
+    def test_single_operator_generation(self):
+        for tree in ExpressionUtils.iter_unique_trees(200, 30, 1, seed=1):
+            self.assertEqual(ExpressionUtils.render(tree).count(' '), 2)
+
+    def test_benchmark_compare_flags_regressions(self):
+        baseline = [{"name": "a", "throughput_per_sec": 100.0, "peak_mb": 1.0},
+                    {"name": "b", "throughput_per_sec": 100.0, "peak_mb": 1.0}]
+        results = [{"name": "a", "throughput_per_sec": 90.0, "peak_mb": 1.1},
+                   {"name": "b", "throughput_per_sec": 50.0, "peak_mb": 2.0},
+                   {"name": "c", "throughput_per_sec": 1.0, "peak_mb": 9.0}]
+        regressions = perf_check.compare(results, baseline, threshold=0.2)
+        self.assertEqual([(item["name"], item["metric"]) for item in regressions],
+                         [("b", "throughput_per_sec"), ("b", "peak_mb")])
+        self.assertEqual(Metrics.percentile([1.0, 2.0, 3.0, 4.0], 50), 2.0)
+
     def test_normalization_commute_plus(self):
         e1 = "1 + 2 + 3"
         e2 = "3 + (2 + 1)"
@@ -72,26 +272,536 @@ class TestExpressionUtils(unittest.TestCase):
         self.assertEqual(len(exprs), 100)
         self.assertEqual(len(set(ExpressionUtils.get_expression_hash(e) for e in exprs)), 100)
 
+    def test_tree_key_matches_normalization(self):
+        for _ in range(200):
+            tree = ExpressionUtils.generate_expression_tree(10, 3)
+            text = ExpressionUtils.render(tree)
+            self.assertEqual(tree.key, ExpressionUtils.normalize_expression(text))
+            self.assertEqual(tree.value, FractionUtils.calculate_expression(text))
+            self.assertEqual(tree.key64, ExpressionUtils.get_expression_key(text))
+
+    def test_key64_matches_string_key_equivalence(self):
+        # 64 位哈希与标准化字符串给出相同的等价划分：只交换 '+'/'×' 的左右，不跨层重组
+        by_key = {}
+        for i in range(3000):
+            tree = ExpressionUtils.expression_tree_at(11, i, 5, 3)
+            by_key.setdefault(tree.key, set()).add(tree.key64)
+        self.assertTrue(all(len(hashes) == 1 for hashes in by_key.values()))
+        self.assertEqual(len(set().union(*by_key.values())), len(by_key))
+        key = ExpressionUtils.get_expression_key
+        self.assertEqual(key("2/4 + 1 × 3"), key("3 × 1 + 1/2"))
+        self.assertNotEqual(key("3 - 1"), key("1 - 3"))
+        self.assertNotEqual(key("(1 + 2) + 3"), key("1 + (2 + 3)"))
+
+    def test_render_keeps_precedence(self):
+        leaf = ExpressionUtils.make_leaf
+        tree = ExpressionUtils.make_branch('×', ExpressionUtils.make_branch('+', leaf(Fraction(1)), leaf(Fraction(2))), leaf(Fraction(3)))
+        self.assertEqual(ExpressionUtils.render(tree), '(1 + 2) × 3')
+        self.assertEqual(tree.value, 9)
+
+    def test_parallel_generation_deterministic(self):
+        run1 = list(ExpressionUtils.iter_unique_problems_parallel(300, 10, 3, workers=2, seed=7, batch_size=100))
+        run2 = list(ExpressionUtils.iter_unique_problems_parallel(300, 10, 3, workers=2, seed=7, batch_size=100))
+        self.assertEqual(len(run1), 300)
+        self.assertEqual(len(set(ExpressionUtils.get_expression_key(e) for e, _ in run1)), 300)
+        self.assertEqual(run1, run2)
+        for expression, value in run1[:50]:
+            self.assertEqual(FractionUtils.calculate_expression(expression), value)
+
+    def test_counter_based_generation(self):
+        trees = list(ExpressionUtils.iter_trees_at(3, 0, 50, 10, 3))
+        # 打乱全局随机状态不影响按序号重建
+        ExpressionUtils.generate_expression(10, 3)
+        self.assertEqual(ExpressionUtils.expression_tree_at(3, 37, 10, 3).key, trees[37].key)
+        serial = [t.key for t in ExpressionUtils.iter_unique_trees(200, 10, 3, seed=5)]
+        parallel = [ExpressionUtils.normalize_expression(e)
+                    for e, _ in ExpressionUtils.iter_unique_problems_parallel(200, 10, 3, workers=3, seed=5, batch_size=30)]
+        self.assertEqual(serial, parallel)
+
+    def test_worksheet_trees(self):
+        # 指定种子时试卷第 i 题与题量无关，可按题号单独重建
+        for max_value in (2, 10):
+            full = [ExpressionUtils.render(t) for t in ExpressionUtils.iter_unique_trees(120, max_value, 3, seed=9)]
+            short = [ExpressionUtils.render(t) for t in ExpressionUtils.iter_unique_trees(40, max_value, 3, seed=9)]
+            self.assertEqual(short, full[:40])
+            page = [ExpressionUtils.render(t) for t in ExpressionUtils.worksheet_trees(9, 100, 120, max_value, 3)]
+            self.assertEqual(page, full[100:])
+        space = ExpressionSpace(3, 2)
+        keys = ExpressionSpace.permutation_keys(4)
+        self.assertEqual(sorted(space.permute(keys, i) for i in range(space.capacity)), list(range(space.capacity)))
+
+    def test_small_range_exact_capacity(self):
+        # 只有拒绝重复取不满题量的范围才走精确计数
+        self.assertTrue(ExpressionSpace.is_small(3))
+        self.assertFalse(ExpressionSpace.is_small(4))
+        space = ExpressionSpace(3, 2)
+        self.assertEqual(space.capacity, 772)
+        keys = set()
+        for index in range(space.capacity):
+            first, steps = space.unrank(index)
+            keys.add(ExpressionUtils.tree_from_chain(first, steps).key)
+        self.assertEqual(len(keys), space.capacity)
+
+    def test_small_range_sampling(self):
+        capacity = ExpressionUtils.expression_space(2, 3).capacity
+        exprs = ExpressionUtils.generate_unique_expressions(capacity, 2, 3)
+        self.assertEqual(len(set(ExpressionUtils.get_expression_key(e) for e in exprs)), capacity)
+        with self.assertRaises(ValueError):
+            ExpressionUtils.generate_unique_expressions(capacity + 1, 2, 3)
+        # 流式生成在打开输出文件之前就检查容量，不截断已有的题目集
+        with tempfile.TemporaryDirectory() as tmp:
+            ex_path = os.path.join(tmp, 'Exercises.txt')
+            ans_path = os.path.join(tmp, 'Answers.txt')
+            ag.stream_exercises(10, 2, ex_path, ans_path)
+            with self.assertRaises(ValueError):
+                ag.stream_exercises(5000, 2, ex_path, ans_path)
+            with open(ex_path, encoding='utf-8') as f:
+                self.assertEqual(len(f.read().split('\n')), 10)
+
     def test_answer_format_and_calc(self):
         expr = "1/6 + 1/8"
         ans = ExpressionUtils.calculate_answer(expr)
         self.assertEqual(ans, '7/24')
 
 
+class TestKeyIndex(unittest.TestCase):
+    def test_add_and_contains(self):
+        index = KeyIndex(4)
+        keys = [ExpressionUtils.get_expression_key(f"{i} + {i + 1}") for i in range(1000)]
+        for key in keys:
+            self.assertTrue(index.add(key))
+        self.assertEqual(len(index), 1000)
+        self.assertFalse(index.add(keys[10]))
+        self.assertIn(keys[999], index)
+        self.assertNotIn(ExpressionUtils.get_expression_key("1 - 1"), index)
+        self.assertEqual(sorted(index.keys()), sorted(keys))
+
+    def test_zero_key(self):
+        index = KeyIndex()
+        self.assertTrue(index.add(0))
+        self.assertIn(0, index)
+        self.assertFalse(index.add(0))
+
+    def test_commuted_expression_same_key(self):
+        self.assertEqual(ExpressionUtils.get_expression_key("1 + 2 + 3"),
+                         ExpressionUtils.get_expression_key("3 + (2 + 1)"))
+
+
+@unittest.skipUnless(BatchEngine.available(), "需要 NumPy")
+class TestBatchEngine(unittest.TestCase):
+    def test_batch_matches_evaluator_and_normalization(self):
+        expressions, keys, numerators, denominators = BatchEngine(10, seed=1).draw(2000)
+        self.assertGreater(len(expressions), 0)
+        for expression, key, n, d in zip(expressions.tolist(), keys.tolist(), numerators.tolist(), denominators.tolist()):
+            self.assertEqual(FractionUtils.calculate_expression(expression), Fraction(n, d))
+            self.assertEqual(ExpressionUtils.get_expression_key(expression), key)
+            self.assertTrue(ExpressionUtils.is_expression_valid(expression))
+
+    def test_generate_unique_and_formatted(self):
+        batches = list(BatchEngine(10, seed=2).generate(3000, batch_size=1000))
+        expressions = [e for batch in batches for e in batch[0].tolist()]
+        answers = [a for batch in batches for a in batch[1].tolist()]
+        self.assertEqual(len(expressions), 3000)
+        keys = {ExpressionUtils.normalize_expression(e) for e in expressions}
+        self.assertEqual(len(keys), 3000)
+        for expression, answer in zip(expressions[:200], answers[:200]):
+            self.assertEqual(answer, FractionUtils.fraction_to_string(FractionUtils.calculate_expression(expression)))
+
+    def test_numpy_engine_stream_and_grade(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            ex_path = os.path.join(tmp, 'Exercises.txt')
+            ans_path = os.path.join(tmp, 'Answers.txt')
+            grade_path = os.path.join(tmp, 'Grade.txt')
+            self.assertEqual(ag.stream_exercises(500, 10, ex_path, ans_path, seed=3, engine="numpy"), 500)
+            os.remove(AnswerKey.sidecar_path(ex_path))
+            ag.grade(ex_path, ans_path, grade_path)
+            with open(grade_path, encoding='utf-8') as f:
+                self.assertEqual(f.read().split('\n')[1], 'Wrong: 0 ()')
+
+
 class TestGrading(unittest.TestCase):
     def test_generate_and_grade(self):
         exercises, answers = ag.generate_exercises(20, 10)
-        ag.write_lines('Exercises.txt', exercises)
-        ag.write_lines('Answers.txt', answers)
-        ag.grade('Exercises.txt', 'Answers.txt', 'Grade.txt')
-        self.assertTrue(os.path.exists('Grade.txt'))
-        with open('Grade.txt', 'r', encoding='utf-8') as f:
-            lines = [l.strip() for l in f.readlines() if l.strip()]
+        with tempfile.TemporaryDirectory() as tmp:
+            ex_path = os.path.join(tmp, 'Exercises.txt')
+            ans_path = os.path.join(tmp, 'Answers.txt')
+            grade_path = os.path.join(tmp, 'Grade.txt')
+            ag.write_lines(ex_path, exercises)
+            ag.write_lines(ans_path, answers)
+            ag.grade(ex_path, ans_path, grade_path)
+            self.assertTrue(os.path.exists(grade_path))
+            with open(grade_path, 'r', encoding='utf-8') as f:
+                lines = [l.strip() for l in f.readlines() if l.strip()]
         # 所有答案应正确
         self.assertTrue(lines[0].startswith('Correct:'))
         self.assertIn('(1', lines[0])  # 包含编号列表
         self.assertEqual(lines[1], 'Wrong: 0 ()')
 
+    def test_stream_and_grade(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            ex_path = os.path.join(tmp, 'Exercises.txt')
+            ans_path = os.path.join(tmp, 'Answers.txt')
+            grade_path = os.path.join(tmp, 'Grade.txt')
+            count = ag.stream_exercises(250, 10, ex_path, ans_path, chunk_size=40)
+            self.assertEqual(count, 250)
+            with open(ex_path, 'r', encoding='utf-8') as f:
+                lines = f.read().split('\n')
+            self.assertEqual(len(lines), 250)
+            self.assertTrue(lines[-1].startswith('250. '))
+            ag.grade(ex_path, ans_path, grade_path)
+            with open(grade_path, 'r', encoding='utf-8') as f:
+                self.assertEqual(f.read().split('\n')[1], 'Wrong: 0 ()')
+
+    def test_grade_stream_matches_grade(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            ex_path = os.path.join(tmp, 'Exercises.txt')
+            ans_path = os.path.join(tmp, 'Answers.txt')
+            exercises, answers = ag.generate_exercises(60, 10)
+            # 改错部分答案，并删去一行答案
+            answers = [f"{i}. 999" if i % 7 == 0 else line for i, line in enumerate(answers, start=1)]
+            del answers[30]
+            ag.write_lines(ex_path, exercises)
+            ag.write_lines(ans_path, answers)
+            ag.grade(ex_path, ans_path, os.path.join(tmp, 'Grade1.txt'))
+            counts = ag.grade_stream(ex_path, ans_path, os.path.join(tmp, 'Grade2.txt'), workers=2, chunk_size=7)
+            self.assertEqual(counts, (51, 9))
+            with open(os.path.join(tmp, 'Grade1.txt'), encoding='utf-8') as f1, \
+                    open(os.path.join(tmp, 'Grade2.txt'), encoding='utf-8') as f2:
+                self.assertEqual(f1.read(), f2.read())
+            # 答案乱序时回退为整体读入判题，不会把跳过的答案误判为错误
+            ag.write_lines(ans_path, answers[::-1])
+            self.assertEqual(ag.grade_stream(ex_path, ans_path, os.path.join(tmp, 'Grade3.txt'), chunk_size=7),
+                             (51, 9))
+            with open(os.path.join(tmp, 'Grade1.txt'), encoding='utf-8') as f1, \
+                    open(os.path.join(tmp, 'Grade3.txt'), encoding='utf-8') as f3:
+                self.assertEqual(f1.read(), f3.read())
+
+    def test_grade_many(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            ex_path = os.path.join(tmp, 'Exercises.txt')
+            sub_dir = os.path.join(tmp, 'submissions')
+            out_dir = os.path.join(tmp, 'grades')
+            os.makedirs(sub_dir)
+            exercises, answers = ag.generate_exercises(10, 10)
+            ag.write_lines(ex_path, exercises)
+            ag.write_lines(os.path.join(sub_dir, 'alice.txt'), answers)
+            ag.write_lines(os.path.join(sub_dir, 'bob.txt'), answers[:6] + ['7. 999'])
+            results = ag.grade_many(ex_path, [sub_dir], out_dir, workers=2)
+            self.assertEqual([(os.path.basename(p), c, w, e) for p, c, w, e in results],
+                             [('alice.txt', 10, 0, None), ('bob.txt', 6, 4, None)])
+            with open(os.path.join(out_dir, 'Grade_bob.txt'), encoding='utf-8') as f:
+                self.assertEqual(f.read().split('\n')[1], 'Wrong: 4 (7, 8, 9, 10)')
+            with open(os.path.join(out_dir, 'Summary.csv'), encoding='utf-8') as f:
+                self.assertEqual(f.read().splitlines(), ['answer_file,grade_file,correct,wrong,error',
+                                                         f'{results[0][0]},Grade_alice.txt,10,0,',
+                                                         f'{results[1][0]},Grade_bob.txt,6,4,'])
+            # 不同目录下的同名答案各自输出，缺失的文件只记录错误
+            other_dir = os.path.join(tmp, 'late')
+            os.makedirs(other_dir)
+            ag.write_lines(os.path.join(other_dir, 'bob.txt'), answers)
+            missing = os.path.join(tmp, 'missing.txt')
+            for workers in (1, 2):
+                results = ag.grade_many(ex_path, [sub_dir, other_dir, missing], out_dir, workers=workers)
+                self.assertEqual([(c, w) for _, c, w, _ in results], [(10, 0), (6, 4), (10, 0), (None, None)])
+                self.assertTrue(results[3][3].startswith('FileNotFoundError'))
+            with open(os.path.join(out_dir, 'Grade_submissions_bob.txt'), encoding='utf-8') as f:
+                self.assertEqual(f.read().split('\n')[1], 'Wrong: 4 (7, 8, 9, 10)')
+            with open(os.path.join(out_dir, 'Grade_late_bob.txt'), encoding='utf-8') as f:
+                self.assertEqual(f.read().split('\n')[1], 'Wrong: 0 ()')
+            self.assertEqual(ag.grade_output_names(['a/x.txt', 'a/x.txt', 'b/y.txt']),
+                             ['Grade_a_x_1.txt', 'Grade_a_x_2.txt', 'Grade_y.txt'])
+
+    def test_answer_key_sidecar(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            ex_path = os.path.join(tmp, 'Exercises.txt')
+            ans_path = os.path.join(tmp, 'Answers.txt')
+            grade_path = os.path.join(tmp, 'Grade.txt')
+            ag.stream_exercises(30, 10, ex_path, ans_path, chunk_size=8)
+            with AnswerKey.load_for(ex_path) as key:
+                self.assertEqual(len(key), 30)
+                with open(ex_path, encoding='utf-8') as f:
+                    first = ag.read_exercise_line(f.readline())[1]
+                self.assertEqual(key[1], FractionUtils.calculate_expression(first))
+            # 题目文件被修改后答案键失效，回退为重新计算
+            with open(ex_path, 'a', encoding='utf-8') as f:
+                f.write('\n31. 1 + 1 =')
+            self.assertIsNone(AnswerKey.load_for(ex_path))
+            ag.grade(ex_path, ans_path, grade_path)
+            with open(grade_path, encoding='utf-8') as f:
+                self.assertEqual(f.read().split('\n')[1], 'Wrong: 1 (31)')
+
+    def test_profile_report(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            report_path = os.path.join(tmp, 'profile.json')
+            # main 把题目、答案与答案键写到当前目录，在临时目录中运行，不污染仓库
+            cwd = os.getcwd()
+            os.chdir(tmp)
+            try:
+                ag.main(['-r', '10', '-n', '50', '--seed', '1', '--profile', report_path])
+            finally:
+                os.chdir(cwd)
+            self.assertFalse(Metrics.enabled)
+            with open(report_path, encoding='utf-8') as f:
+                report = json.load(f)
+        counters = report['counters']
+        self.assertEqual(counters['dedup.candidates'] - counters.get('dedup.duplicates', 0), 50)
+        self.assertGreaterEqual(counters['generate.attempts'], counters['dedup.candidates'])
+        self.assertIn('generate', report['timers'])
+        self.assertIn('write', report['timers'])
+        # 未启用时埋点不计数
+        Metrics.reset()
+        FractionUtils.calculate_expression("1 + 2")
+        self.assertEqual(Metrics.snapshot(), {'counters': {}, 'timers': {}})
+
+    def test_ingest_matches_line_parsers(self):
+        lines = ["1. 1 + 2 =", "", "garbage", " 2 .  3/4 × 2  = \r", "x. 1 + 1 =", "3. 1'1/2 ÷ 4", "12.7"]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'Exercises.txt')
+            with open(path, 'w', encoding='utf-8', newline='') as f:
+                f.write("\n".join(lines))
+            expected = []
+            for line in lines:
+                try:
+                    expected.append(ag.read_exercise_line(line))
+                except ValueError:
+                    continue
+            for block_size in (1, 8, Ingest.BLOCK_SIZE):
+                records = [(idx, expr.decode()) for idx, expr in Ingest.iter_exercises(path, block_size)]
+                self.assertEqual(records, expected)
+            self.assertEqual([(idx, answer.decode()) for idx, answer in Ingest.iter_answers(path)][-1], (12, '7'))
+            empty = os.path.join(tmp, 'Empty.txt')
+            open(empty, 'w').close()
+            self.assertEqual(list(Ingest.iter_answers(empty)), [])
+
+    def test_job_manifest(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            ex_path = os.path.join(tmp, 'a', 'Exercises.txt')
+            ans_path = os.path.join(tmp, 'a', 'Answers.txt')
+            jobs = [
+                {'r': 10, 'n': 20, 'seed': 3, 'exercises': ex_path, 'answers': ans_path},
+                {'id': 'sheet-b', 'r': 30, 'n': 5, 'stream': True,
+                 'exercises': os.path.join(tmp, 'b', 'Exercises.txt'), 'answers': os.path.join(tmp, 'b', 'Answers.txt')},
+                {'exercises': ex_path, 'answers': ans_path, 'grade': os.path.join(tmp, 'a', 'Grade.txt')},
+                {'r': 0, 'n': 5},
+                {'r': None, 'n': 5},
+                {'r': 10, 'n': [5]},
+            ]
+            manifest = os.path.join(tmp, 'jobs.json')
+            with open(manifest, 'w', encoding='utf-8') as f:
+                json.dump({'jobs': jobs}, f)
+            results = list(batch_jobs.run_jobs(batch_jobs.load_manifest(manifest)))
+            self.assertEqual([result['id'] for result in results], [1, 'sheet-b', 3, 4, 5, 6])
+            self.assertEqual([result['status'] for result in results], ['ok', 'ok', 'ok', 'error', 'error', 'error'])
+            self.assertTrue(results[4]['error'].startswith('TypeError'))
+            self.assertEqual((results[0]['count'], results[1]['count']), (20, 5))
+            self.assertEqual((results[2]['correct'], results[2]['wrong']), (20, 0))
+            # CSV 清单：空单元格视为未给出
+            csv_path = os.path.join(tmp, 'jobs.csv')
+            with open(csv_path, 'w', encoding='utf-8') as f:
+                f.write(f"type,r,n,seed,exercises,answers,grade\ngenerate,10,8,,{ex_path},{ans_path},\n")
+            self.assertEqual(batch_jobs.load_manifest(csv_path),
+                             [{'type': 'generate', 'r': '10', 'n': '8', 'exercises': ex_path, 'answers': ans_path, 'id': 1}])
+
+    def test_append_mode(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            ex_path = os.path.join(tmp, 'Exercises.txt')
+            ans_path = os.path.join(tmp, 'Answers.txt')
+            grade_path = os.path.join(tmp, 'Grade.txt')
+            ag.save_exercise_set(*ag.build_exercise_set(50, 20, seed=1), ex_path, ans_path)
+            # 首次追加：无索引，解析已有题目重建；之后直接读取索引
+            self.assertEqual(ag.append_exercises(30, 20, ex_path, ans_path, seed=2), 30)
+            index = ExerciseIndex.load_for(ex_path)
+            self.assertEqual((index.count, len(index.keys)), (80, 80))
+            Metrics.reset()
+            Metrics.enable()
+            try:
+                self.assertEqual(ag.append_exercises(20, 20, ex_path, ans_path, seed=3, chunk_size=7), 20)
+            finally:
+                Metrics.enable(False)
+            self.assertNotIn('append.index_rebuilds', Metrics.counters)
+            with open(ex_path, encoding='utf-8') as f:
+                exercises = [ag.read_exercise_line(line) for line in f.read().split('\n')]
+            self.assertEqual([idx for idx, _ in exercises], list(range(1, 101)))
+            self.assertEqual(len({ExpressionUtils.get_expression_key(e) for _, e in exercises}), 100)
+            # 增量计算的校验和与整个文件一致，答案键仍然有效
+            with AnswerKey.load_for(ex_path) as key:
+                self.assertEqual(len(key), 100)
+                self.assertEqual(key[100], FractionUtils.calculate_expression(exercises[-1][1]))
+            self.assertEqual(ag.grade(ex_path, ans_path, grade_path), (100, 0))
+            # 题目文件被外部修改后索引失效
+            with open(ex_path, 'a', encoding='utf-8') as f:
+                f.write('\n101. 1 + 1 =')
+            self.assertIsNone(ExerciseIndex.load_for(ex_path))
+            self.assertEqual(ag.append_exercises(5, 20, ex_path, ans_path), 5)
+            self.assertEqual(ExerciseIndex.load_for(ex_path).count, 106)
+
+    def test_answer_key_overflow_marks_incomplete(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            ex_path = os.path.join(tmp, 'Exercises.txt')
+            ag.save_exercise_set(['1. 1 + 1 ='], ['1. 2'], [Fraction(2 ** 70)], ex_path, os.path.join(tmp, 'Answers.txt'))
+            self.assertIsNone(AnswerKey.load_for(ex_path))
+
+
+
+class TestExpressionBatch(unittest.TestCase):
+    def test_packed_batch_matches_trees(self):
+        trees = list(ExpressionUtils.iter_unique_trees(300, 30, seed=4))
+        batch = ExpressionBatch(30)
+        batch.extend(trees)
+        self.assertEqual(len(batch), 300)
+        self.assertEqual(batch.codes.typecode, 'H')
+        for i, tree in enumerate(trees):
+            self.assertEqual(batch[i], ExpressionUtils.render(tree))
+            self.assertEqual(batch.value(i), tree.value)
+            self.assertEqual(batch.key64(i), tree.key64)
+        self.assertEqual(list(batch), [ExpressionUtils.render(tree) for tree in trees])
+        self.assertLess(batch.nbytes(), 300 * 20)
+
+    def test_unique_batch_and_text_cache_bound(self):
+        self.assertIsInstance(ExpressionUtils.generate_unique_expressions(5, 10), list)
+        batch = ExpressionUtils.generate_unique_batch(3000, 100000)
+        self.assertIsInstance(batch, ExpressionBatch)
+        texts = list(batch)
+        self.assertEqual(len(set(texts)), 3000)
+        self.assertLessEqual(len(batch._texts), ExpressionBatch.TEXT_CACHE_SIZE)
+        self.assertEqual(batch[2999], texts[-1])
+
+
+class TestGenerator(unittest.TestCase):
+    def test_seeded_and_independent_of_global_random(self):
+        first = Generator(30, seed=5).unique_expressions(200)
+        random.seed(0)
+        second = Generator(30, seed=5).unique_expressions(200)
+        self.assertEqual(first, second)
+        self.assertEqual(len(set(ExpressionUtils.get_expression_key(e) for e in first)), 200)
+        exercises, answers = Generator(10, seed=1).worksheet(20)
+        self.assertEqual(ag.grade_lines(exercises, answers), (list(range(1, 21)), []))
+
+    def test_concurrent_use_stays_unique(self):
+        generator = Generator(30, max_operators=2, paren_probability=1.0)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(generator.unique_trees(300))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        keys = [tree.key64 for trees in results for tree in trees]
+        self.assertEqual(len(keys), 1200)
+        self.assertEqual(len(set(keys)), len(generator))
+        # 括号概率为 1 时，复杂表达式中后续每一步的左侧子式都加括号
+        for tree in results[0]:
+            if isinstance(tree.left, ExpressionUtils.Branch):
+                self.assertTrue(tree.paren)
+
+
+class TestPoolFile(unittest.TestCase):
+    def test_build_extend_and_sample(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'pool')
+            with PoolFile.create(path, 20, seed=7) as pool:
+                self.assertEqual(pool.extend(150), 150)
+                first = [pool.expression(i) for i in range(150)]
+            # 重新打开后增量扩充：已有题目不变，新题目与已有题目互不重复
+            with PoolFile.open_or_create(path, 20) as pool:
+                self.assertEqual([pool.expression(i) for i in range(150)], first)
+                pool.extend(100)
+                self.assertEqual(len(pool), 250)
+                keys = [pool.key(i) for i in range(250)]
+                self.assertEqual(len(set(keys)), 250)
+                for i in range(250):
+                    expression = pool.expression(i)
+                    self.assertEqual(pool.value(i), FractionUtils.calculate_expression(expression))
+                    self.assertEqual(keys[i], ExpressionUtils.get_expression_key(expression))
+                sample = pool.sample(200)
+                self.assertEqual(len({expression for expression, _ in sample}), 200)
+                with self.assertRaises(ValueError):
+                    pool.sample(251)
+            with self.assertRaises(ValueError):
+                PoolFile.open_or_create(path, 30)
+            # 题目不足时自动扩充
+            expressions = ExpressionUtils.generate_unique_expressions(300, 20, pool_path=path)
+            self.assertEqual(len(set(expressions)), 300)
+
+
+class TestService(unittest.TestCase):
+    def setUp(self):
+        from service import WorksheetService, create_server
+        self.service = WorksheetService(workers=1, pool_size=200)
+        self.server = create_server(self.service, port=0)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base = f"http://127.0.0.1:{self.server.server_port}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.service.close()
+
+    def test_worksheet_grade_and_metrics(self):
+        with urllib.request.urlopen(self.base + "/worksheet?r=10&n=30") as response:
+            sheet = json.load(response)
+        self.assertEqual(len(sheet["exercises"]), 30)
+        expressions = [ag.read_exercise_line(line)[1] for line in sheet["exercises"]]
+        self.assertEqual(len({ExpressionUtils.normalize_expression(e) for e in expressions}), 30)
+
+        request = urllib.request.Request(self.base + "/grade", data=json.dumps(sheet).encode(), method="POST")
+        with urllib.request.urlopen(request) as response:
+            result = json.load(response)
+        self.assertEqual((len(result["correct"]), result["wrong"]), (30, []))
+
+        with self.assertRaises(urllib.error.HTTPError) as ctx:
+            urllib.request.urlopen(self.base + "/worksheet?r=10&n=0")
+        self.assertEqual(ctx.exception.code, 400)
+        ctx.exception.close()
+
+        # 请求体不是 JSON 对象或字段类型不对时返回 JSON 400
+        for body in (b"[1, 2]", b"{not json", b'{"exercises": "1. 1 + 1 ="}'):
+            request = urllib.request.Request(self.base + "/grade", data=body, method="POST")
+            with self.assertRaises(urllib.error.HTTPError) as ctx:
+                urllib.request.urlopen(request)
+            self.assertEqual(ctx.exception.code, 400)
+            self.assertIn("error", json.load(ctx.exception))
+            ctx.exception.close()
+        # 意外异常返回 JSON 500，而不是断开连接
+        grade = self.service.grade
+        self.service.grade = lambda exercises, answers: {}["missing"]
+        request = urllib.request.Request(self.base + "/grade", data=b"{}", method="POST")
+        with self.assertRaises(urllib.error.HTTPError) as ctx:
+            urllib.request.urlopen(request)
+        self.service.grade = grade
+        self.assertEqual(ctx.exception.code, 500)
+        self.assertTrue(json.load(ctx.exception)["error"].startswith("KeyError"))
+        ctx.exception.close()
+
+        with urllib.request.urlopen(self.base + "/metrics") as response:
+            metrics = json.load(response)
+        self.assertEqual(metrics["endpoints"]["worksheet"]["requests"], 2)
+        self.assertIn("p99_ms", metrics["endpoints"]["grade"])
+
+    def test_problem_pool_takes_across_batches(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from service import ProblemPool
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            pool = ProblemPool(30, 3, executor, size=100, batch_size=40)
+            pool.top_up()
+            while len(pool) < 120:
+                threading.Event().wait(0.01)
+            problems = pool.take(50) + pool.take(50)
+            self.assertLess(len(pool), 120)
+        self.assertEqual(len(problems), 100)
+        for expression, value in problems:
+            self.assertEqual(FractionUtils.calculate_expression(expression), value)
+        self.assertEqual(len({ExpressionUtils.get_expression_key(e) for e, _ in problems[:50]}), 50)
+
+    def test_problem_pool_ignores_cancelled_refill(self):
+        # close() 取消在途的补充任务时，回调不应抛出 CancelledError
+        from concurrent.futures import Future
+        from service import ProblemPool
+        pool = ProblemPool(30, 3, None, size=100, batch_size=40)
+        pool._pending = 1
+        future = Future()
+        future.cancel()
+        pool._on_filled(future)
+        self.assertEqual((pool._pending, len(pool)), (0, 0))
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file